@@ -0,0 +1,229 @@
+"""Decision makers for the players.
+
+An agent gets a read-only GameView and the playable cards of a turn, and returns the move of the player as
+(action, card index, gold cost), where action is 'play', 'wonder' or 'coin'. Agents that rank moves implement
+score_moves, which scores the moves of many decisions, possibly from many games, in a single call. The view only
+holds copies and read-only mappings, and its rng is the player's own stream, so an agent can neither change the game
+nor the draws of the deal.
+"""
+import collections
+import types
+import weakref
+
+CARD_TYPES = ('brown', 'gray', 'blue', 'yellow', 'red', 'green', 'guild', 'wonder')
+# Must match the slots of definitions.Resource
+RESOURCE_SYMBOLS = ('$', 'T', 'S', 'C', 'O', 'L', 'G', 'P', 'X', '&', '#', '@', 'V', 'W')
+
+PlayerView = collections.namedtuple('PlayerView', ['name', 'resources', 'split_resources', 'played_cards',
+                                                   'military_tokens', 'wonder', 'wonder_stage'])
+# A card or a wonder as seen by the agents. cost and resources are read-only {symbol: count} mappings; the
+# current_stage and stages (cost, resources or special) of a wonder are None and () for a card, and its cost is the
+# cost of the next stage.
+CardView = collections.namedtuple('CardView', ['name', 'type', 'cost', 'resources', 'split_resources', 'gives_free',
+                                               'current_stage', 'stages'])
+# players holds a PlayerView per seat, whose played_cards is the frozenset of the names of its played cards; cards
+# are the CardViews of the hand, followed by the wonder if a stage can still be built; rng is the random stream of the
+# player, for agents that need to break ties.
+GameView = collections.namedtuple('GameView', ['player_i', 'age', 'cards', 'players', 'rng'])
+
+# CardViews of the catalogue cards, which never change
+_card_views = weakref.WeakKeyDictionary()
+
+
+def player_view(player):
+    return PlayerView(player.name,
+                      dict(zip(RESOURCE_SYMBOLS, player.resources.values)),
+                      tuple(tuple(options) for options in player.split_resources),
+                      frozenset(player.played_names),
+                      tuple(player.military_tokens),
+                      player.wonder.name,
+                      player.wonder.current_stage)
+
+
+def _mapping(resources):
+    return types.MappingProxyType(dict(zip(RESOURCE_SYMBOLS, resources.values)))
+
+
+def card_view(card):
+    """Return the CardView of a card or of a wonder."""
+    if card.type == 'wonder':
+        stages = tuple((_mapping(cost), resources if isinstance(resources, str) else _mapping(resources))
+                       for cost, resources in card.stages)
+        return CardView(card.name, 'wonder', _mapping(card.cost), stages[0][1], tuple(card.split_resources),
+                        tuple(card.gives_free), card.current_stage, stages)
+    view = _card_views.get(card)
+    if view is None:
+        view = _card_views[card] = CardView(card.name, card.type, _mapping(card.cost), _mapping(card.resources),
+                                            tuple(card.split_resources), tuple(card.gives_free), None, ())
+    return view
+
+
+def hand_size(view):
+    return len(view.cards) - 1 if view.cards and view.cards[-1].type == 'wonder' else len(view.cards)
+
+
+def card_resources(card):
+    """Return the resources given by a card, or by the next stage of a wonder, as a dict of symbol to count."""
+    if card.type == 'wonder':
+        stage = card.current_stage + 1
+        resources = card.stages[stage][1] if stage < len(card.stages) else ''
+        # Specials and split resources are not counted
+        return {} if isinstance(resources, str) else dict(resources.items())
+    return dict(card.resources.items())
+
+
+def card_split_options(card):
+    """Return the options of the split resource given by a card, or by the next stage of a wonder."""
+    if card.type == 'wonder':
+        stage = card.current_stage + 1
+        resources = card.stages[stage][1] if stage < len(card.stages) else ''
+        return tuple(resources.split('/')) if isinstance(resources, str) and '/' in resources else ()
+    return card.split_resources
+
+
+def science_points(resources):
+    symbols = [resources.get('&', 0), resources.get('#', 0), resources.get('@', 0)]
+    return sum(n ** 2 for n in symbols) + 7 * min(symbols)
+
+
+def military_points(age, strength, neighbours_strength):
+    # 1, 3 and 5 points for a win in age 1, 2 and 3, -1 for a defeat
+    return sum(1 + (age - 1) * 2 if strength > other else -1 if strength < other else 0
+               for other in neighbours_strength)
+
+
+def immediate_points(view, card_i, gold_cost):
+    """Estimate the victory points a move is worth right now, trading costs included."""
+    me = view.players[view.player_i]
+    card = view.cards[card_i]
+    gain = card_resources(card)
+    after = {symbol: me.resources[symbol] + gain.get(symbol, 0) for symbol in RESOURCE_SYMBOLS}
+    neighbours_strength = [view.players[(view.player_i + d) % len(view.players)].resources['X'] for d in (-1, 1)]
+    coins_spent = card.cost['$'] + sum(gold_cost.values()) if gold_cost else card.cost['$']
+    return (gain.get('V', 0) + gain.get('W', 0) +
+            science_points(after) - science_points(me.resources) +
+            military_points(view.age, after['X'], neighbours_strength) -
+            military_points(view.age, me.resources['X'], neighbours_strength) +
+            (gain.get('$', 0) - coins_spent) / 3)
+
+
+class Agent:
+    """Base class of the agents: plays the best scored move, or discards a random card when nothing is playable."""
+    def choose(self, view, playable_cards):
+        if not playable_cards:
+            return 'coin', self.card_to_discard(view), None
+        moves = list(playable_cards.items())
+        scores = self.score_moves([(view, moves)])[0]
+        card_i, cost = moves[max(range(len(moves)), key=scores.__getitem__)]
+        if view.cards[card_i].type == 'wonder':
+            return 'wonder', self.card_to_discard(view), cost
+        return 'play', card_i, cost
+
+    def score_moves(self, decisions):
+        """Return a list of scores for each (view, [(card index, gold cost), ...]) decision, higher is better."""
+        raise NotImplementedError
+
+    def card_to_discard(self, view):
+        """Return the index of the card to discard or to build a wonder stage with."""
+        return view.rng.randint(0, max(hand_size(view) - 1, 0))
+
+
+class RandomAgent(Agent):
+    """Pick a random playable card."""
+    def choose(self, view, playable_cards):
+        if not playable_cards:
+            return 'coin', self.card_to_discard(view), None
+        picked_card_i = view.rng.choice(list(playable_cards.keys()))
+        cost = playable_cards[picked_card_i]
+        if view.cards[picked_card_i].type == 'wonder':
+            return 'wonder', self.card_to_discard(view), cost
+        return 'play', picked_card_i, cost
+
+    def score_moves(self, decisions):
+        return [[decision[0].rng.random() for _ in decision[1]] for decision in decisions]
+
+
+class GreedyVPAgent(Agent):
+    """Pick the move that is worth the most victory points right now."""
+    def score_moves(self, decisions):
+        return [[immediate_points(view, card_i, cost) for card_i, cost in moves] for view, moves in decisions]
+
+
+class HeuristicAgent(Agent):
+    """Like GreedyVPAgent, but also value production, free chains and wonder stages while they can still pay off."""
+    def score_moves(self, decisions):
+        return [[self.score(view, card_i, cost) for card_i, cost in moves] for view, moves in decisions]
+
+    def score(self, view, card_i, gold_cost):
+        me = view.players[view.player_i]
+        card = view.cards[card_i]
+        ages_left = 3 - view.age
+        score = immediate_points(view, card_i, gold_cost)
+        for symbol, n in card_resources(card).items():
+            if symbol in 'TSCOLGP':
+                # New kinds of resources are worth more than extra units of the ones we already produce
+                score += n * ages_left * (1.0 if not me.resources[symbol] else 0.4)
+        score += len(card_split_options(card)) * ages_left * 0.3
+        score += len(card.gives_free) * ages_left * 0.8
+        if card.type == 'wonder':
+            score += 1
+        return score
+
+
+class BatchEvaluatorAgent(Agent):
+    """Score moves with an external evaluator called once per batch of decisions.
+
+    evaluate gets a (moves, len(MOVE_FEATURES)) NumPy array with a row per move of every decision (see
+    move_feature_matrix) and returns a sequence of scores of the same length. lockstep.evaluator_policy calls the same
+    evaluate with the moves of every game of a batch at once. Needs NumPy.
+    """
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+
+    def score_moves(self, decisions):
+        moves = [(view, card_i, cost) for view, decision_moves in decisions for card_i, cost in decision_moves]
+        scores = list(self.evaluate(move_feature_matrix(moves))) if moves else []
+        result = []
+        for _, decision_moves in decisions:
+            result.append(scores[:len(decision_moves)])
+            del scores[:len(decision_moves)]
+        return result
+
+
+MOVE_FEATURES = (('age', 'is_wonder', 'gold_cost', 'coins') +
+                 tuple('type_' + card_type for card_type in CARD_TYPES) +
+                 tuple('gives_' + symbol for symbol in RESOURCE_SYMBOLS) +
+                 tuple('costs_' + symbol for symbol in RESOURCE_SYMBOLS) +
+                 tuple('has_' + symbol for symbol in RESOURCE_SYMBOLS))
+
+
+def move_feature_matrix(moves):
+    """Return the (moves, len(MOVE_FEATURES)) int32 array describing (view, card index, gold cost) moves.
+
+    The array is filled a column at a time, from the cards, gains and players of all the moves.
+    """
+    import numpy as np
+    cards = [view.cards[card_i] for view, card_i, _ in moves]
+    players = [view.players[view.player_i].resources for view, _, _ in moves]
+    gains = [card_resources(card) for card in cards]
+    features = np.empty((len(moves), len(MOVE_FEATURES)), dtype=np.int32)
+    features[:, 0] = [view.age for view, _, _ in moves]
+    features[:, 1] = [card.type == 'wonder' for card in cards]
+    features[:, 2] = [sum(gold_cost.values()) if gold_cost else 0 for _, _, gold_cost in moves]
+    features[:, 3] = [resources['$'] for resources in players]
+    types_start = 4
+    for i, card_type in enumerate(CARD_TYPES):
+        features[:, types_start + i] = [card.type == card_type for card in cards]
+    gives_start = types_start + len(CARD_TYPES)
+    for i, symbol in enumerate(RESOURCE_SYMBOLS):
+        features[:, gives_start + i] = [gain.get(symbol, 0) for gain in gains]
+        features[:, gives_start + len(RESOURCE_SYMBOLS) + i] = [card.cost[symbol] for card in cards]
+        features[:, gives_start + 2 * len(RESOURCE_SYMBOLS) + i] = [resources[symbol] for resources in players]
+    return features
+
+
+AGENTS = {
+    'random': RandomAgent,
+    'greedy': GreedyVPAgent,
+    'heuristic': HeuristicAgent,
+}
@@ -0,0 +1,111 @@
+"""The cards and wonders of a catalogue as NumPy arrays, for the code that works on batches of games.
+
+The effects of the cards become weights over what they count (THINGS) and whose things they count (WHOSE), so the
+effects of many players are evaluated with a single product. NumPy is needed by this module.
+"""
+import numpy as np
+
+from seven_wonders import agents
+from seven_wonders import definitions as sw
+
+SYMBOLS = sw.Resource.symbols
+COINS = SYMBOLS.index('$')
+GOODS = slice(SYMBOLS.index('T'), SYMBOLS.index('P') + 1)
+RAW_GOODS = [symbol in sw.RAW_MATERIALS for symbol in SYMBOLS[GOODS]]
+SCIENCE = [SYMBOLS.index(symbol) for symbol in '&#@']
+# Counted by the effects: the card types, 'wonder' for wonder stages, then defeat tokens
+THINGS = agents.CARD_TYPES + ('defeat',)
+WONDER = THINGS.index('wonder')
+DEFEAT = THINGS.index('defeat')
+# Index of the effect weights by whose cards are counted. A 'self_and_neighbours' effect weighs both the 'self' and
+# the 'neighbours' things
+WHOSE = ('self', 'neighbours', 'all')
+SPECIALS = ('play_discarded_card', 'trading_post', 'copy_guild_card', 'build_free_structure', 'play_seventh')
+PLAY_DISCARDED, TRADING_POST, COPY_GUILD, BUILD_FREE, PLAY_SEVENTH = range(len(SPECIALS))
+
+_tables = {}
+
+
+class Tables:
+    """The cards and wonders of a catalogue as arrays, indexed by card_id and wonder_id."""
+    def __init__(self, catalogue):
+        cards = catalogue.cards
+        self.catalogue = catalogue
+        names = sorted({card.name for card in cards})
+        name_ids = {name: i for i, name in enumerate(names)}
+        stage_resources = [resources for wonder in catalogue.wonders for _, resources in wonder.stages]
+        # Every group of options of a split resource, sorted as in SplitResources.key
+        self.split_options = sorted(
+            {tuple(sorted(sw.Resource._index[symbol] for symbol in card.split_resources))
+             for card in cards if card.split_resources} |
+            {tuple(sorted(sw.Resource._index[symbol] for symbol in resources.split('/')))
+             for resources in stage_resources if isinstance(resources, str) and '/' in resources})
+        split_ids = {options: i for i, options in enumerate(self.split_options)}
+        self.split_goods = np.array([[slot in options for slot in range(len(SYMBOLS))][GOODS]
+                                     for options in self.split_options], dtype=np.int32).reshape(-1, 7)
+        # Split resources made of science symbols only are science wildcards. The last entry is for split ID -1.
+        self.split_science = np.array([all(slot in SCIENCE for slot in options) for options in self.split_options] +
+                                      [False])
+
+        def split_id(symbols):
+            return split_ids[tuple(sorted(sw.Resource._index[symbol] for symbol in symbols))] if symbols else -1
+
+        self.name_id = np.array([name_ids[card.name] for card in cards])
+        self.type_id = np.array([THINGS.index(card.type) for card in cards])
+        self.cost = np.array([card.cost.values for card in cards], dtype=np.int32)
+        self.resources = np.array([card.resources.values for card in cards], dtype=np.int32)
+        self.split = np.array([split_id(card.split_resources) for card in cards])
+        self.tradeable = np.array([card.type in ('brown', 'gray') for card in cards])
+        self.gives_free = np.zeros((len(cards), len(names)), dtype=bool)
+        self.effects = {kind: np.zeros((len(cards), len(WHOSE), len(THINGS)), dtype=np.int32)
+                        for kind in ('coins', 'commerce', 'guild')}
+        # Science wildcards given by each card, from an effect or a split resource
+        self.science = self.split_science[self.split].astype(np.int32)
+        # [left, right][raw, manufactured]
+        self.discount = np.zeros((len(cards), 2, 2), dtype=bool)
+        for card in cards:
+            for name in card.gives_free:
+                if name in name_ids:
+                    self.gives_free[card.card_id, name_ids[name]] = True
+            for effect in card.effects:
+                if effect.kind in self.effects:
+                    whose = ('self', 'neighbours') if effect.whose == 'self_and_neighbours' else (effect.whose,)
+                    for thing in effect.counts:
+                        self.effects[effect.kind][card.card_id, [WHOSE.index(w) for w in whose],
+                                                  THINGS.index(thing)] += effect.amount
+                elif effect.kind == 'science':
+                    self.science[card.card_id] += effect.amount
+                elif effect.kind == 'discount':
+                    sides = (0, 1) if effect.whose == 'neighbours' else (0,) if effect.whose == 'left' else (1,)
+                    for side in sides:
+                        for goods in effect.counts:
+                            self.discount[card.card_id, side, ('raw', 'manufactured').index(goods)] = True
+
+        # Stage 0 holds the resource given by the wonder from the start
+        wonders = catalogue.wonders
+        max_stages = max(len(wonder.stages) for wonder in wonders)
+        self.n_stages = np.array([len(wonder.stages) - 1 for wonder in wonders])
+        self.stage_cost = np.zeros((len(wonders), max_stages, len(SYMBOLS)), dtype=np.int32)
+        self.stage_resources = np.zeros((len(wonders), max_stages, len(SYMBOLS)), dtype=np.int32)
+        self.stage_split = np.full((len(wonders), max_stages), -1)
+        self.stage_special = np.full((len(wonders), max_stages), -1)
+        for wonder in wonders:
+            for stage, (cost, resources) in enumerate(wonder.stages):
+                self.stage_cost[wonder.wonder_id, stage] = cost.values
+                if isinstance(resources, sw.Resource):
+                    self.stage_resources[wonder.wonder_id, stage] = resources.values
+                elif '/' in resources:
+                    self.stage_split[wonder.wonder_id, stage] = split_id(resources.split('/'))
+                else:
+                    self.stage_special[wonder.wonder_id, stage] = SPECIALS.index(resources)
+
+    def split_key(self, counts):
+        """Return the SplitResources.key of an array of counts of each split_options."""
+        return tuple((options, int(count)) for options, count in zip(self.split_options, counts) if count)
+
+
+def tables(catalogue):
+    """Return the Tables of a catalogue, built once per process."""
+    if catalogue.data_hash not in _tables:
+        _tables[catalogue.data_hash] = Tables(catalogue)
+    return _tables[catalogue.data_hash]
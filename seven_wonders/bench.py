@@ -0,0 +1,256 @@
+"""Benchmarks of the engine hot paths and of whole games, compared with a baseline of the same machine.
+
+    python -m seven_wonders.bench --save           # store the results as the baseline of this machine
+    python -m seven_wonders.bench                  # run them all and compare with the baseline
+    python -m seven_wonders.bench -k can_play      # only the benchmarks whose name contains can_play
+
+Every benchmark does the same work on every run: games are played from fixed seeds. The time of a benchmark is the
+best of --repeat runs, per call, and its spread how much slower the median run is. A benchmark is a regression when
+it is slower than its baseline by more than --tolerance plus the spreads of both measures, so that noisy benchmarks
+need a larger slowdown: regressions are reported and the command exits with status 1.
+
+Timings depend on the machine, so the baseline isn't part of the repository: it is saved next to the package, in
+bench_baseline.json (ignored by git), unless --baseline names another file. Without a baseline the command exits
+with status 2. Benchmarks of the NumPy code are skipped when NumPy is missing.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+
+from seven_wonders import catalogue
+from seven_wonders import definitions as sw
+from seven_wonders import run
+
+SEED = 2024
+BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench_baseline.json')
+# Players of the macro benchmarks
+PLAYER_COUNTS = range(3, 8)
+# Games played per call of the macro benchmarks
+GAMES = 20
+# Split cards (brown, so that they can also be traded) added to the player of the can_play benchmarks
+SPLIT_CARDS = ('Tree Farm', 'Excavation', 'Clay Pit', 'Timber Yard', 'Forest Cave', 'Mine')
+
+# name: (setup, calls per run). setup() returns the function to time.
+BENCHMARKS = {}
+
+
+def benchmark(name, number):
+    def register(setup):
+        BENCHMARKS[name] = (setup, number)
+        return setup
+    return register
+
+
+def _card(name):
+    cards = catalogue.load()
+    return cards.cards[cards.card_ids[name][0]]
+
+
+def _played_games(no_of_players, n_games, seed=SEED):
+    """Play n_games random games and return their players."""
+    cards = catalogue.load()
+    games = []
+    for game_i in range(n_games):
+        rng = run.game_rng(seed, game_i)
+        players = [sw.Player(str(player)) for player in range(no_of_players)]
+        run.play(players, cards.decks(no_of_players, rng), cards.wonders, False, rng)
+        games.append(players)
+    return games
+
+
+@benchmark('resource_add', 100000)
+def resource_add():
+    one, two = sw.Resource('TTSCOXV$$'), sw.Resource('LGP&#@W')
+    return lambda: one + two
+
+
+@benchmark('resource_sub', 100000)
+def resource_sub():
+    one, two = sw.Resource('TTSCOXV$$'), sw.Resource('LGP&#@W')
+    return lambda: one - two
+
+
+@benchmark('resource_negative_items', 100000)
+def resource_negative_items():
+    resources = sw.Resource('TTSCO') - sw.Resource('LGPPTTT')
+    return resources.negative_items
+
+
+def _can_play(n_split_cards):
+    # The player has n_split_cards split cards and buys the rest of a Palace from neighbours with split cards too
+    players = [sw.Player(str(player)) for player in range(3)]
+    for player_i, p in enumerate(players):
+        p.player_i = player_i
+        p.adjacent_players_i = ((player_i - 1) % 3, (player_i + 1) % 3)
+    me, left, right = players[0], players[2], players[1]
+    me.resources['$'] = 20
+    for name in SPLIT_CARDS[:n_split_cards]:
+        me._play_a_card(_card(name), {}, players, free=True)
+    left._play_a_card(_card('Tree Farm'), {}, players, free=True)
+    left.resources += sw.Resource('LGS')
+    right._play_a_card(_card('Mine'), {}, players, free=True)
+    right.resources += sw.Resource('PGC')
+    palace = _card('Palace')
+
+    def can_play():
+        # Cold caches, so that the trade is solved every time
+        sw.split_leftovers.cache_clear()
+        sw.cheapest_trade.cache_clear()
+        return me.can_play(palace, players)
+    return can_play
+
+
+for _n in range(len(SPLIT_CARDS) + 1):
+    benchmark('can_play/splits=%d' % _n, 200)(lambda n=_n: _can_play(n))
+
+
+@benchmark('populate_decks', 200)
+def populate_decks():
+    cards = catalogue.load().cards
+    rng = run.game_rng(SEED, 0)
+    return lambda: run.populate_decks(cards, 5, rng)
+
+
+@benchmark('catalogue_decks', 2000)
+def catalogue_decks():
+    cards = catalogue.load()
+    rng = run.game_rng(SEED, 0)
+    return lambda: cards.decks(5, rng)
+
+
+@benchmark('calculate_victory_points', 20)
+def calculate_victory_points():
+    games = _played_games(5, 50)
+
+    def score():
+        for players in games:
+            run.calculate_victory_points(players)
+    return score
+
+
+for _n in PLAYER_COUNTS:
+    benchmark('games/players=%d' % _n, 1)(lambda n=_n: lambda: _played_games(n, GAMES))
+
+
+def _numpy_benchmark(name, number):
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return lambda setup: setup
+    return benchmark(name, number)
+
+
+@_numpy_benchmark('score_positions', 20)
+def score_positions():
+    from seven_wonders import scoring
+    cards = catalogue.load()
+    positions = scoring.from_players(cards, _played_games(5, 50))
+    return lambda: scoring.score_positions(cards, positions)
+
+
+@_numpy_benchmark('lockstep/players=4', 1)
+def lockstep_games():
+    from seven_wonders import lockstep
+    cards = catalogue.load()
+    # One batch first, so that the trade cache is as warm as in a long run
+    lockstep.play_batch(cards, 256, 4, lockstep.batch_rng(SEED, 0))
+    return lambda: lockstep.play_batch(cards, 256, 4, lockstep.batch_rng(SEED, 1))
+
+
+def measure(setup, number, repeat=15):
+    """Return the best time of a call of the function returned by setup, in seconds, and the spread of the runs.
+
+    The spread is how much slower the median run is than the best one, relative to the best one.
+    """
+    function = setup()
+    times = timeit.repeat(function, number=number, repeat=repeat)
+    return min(times) / number, statistics.median(times) / min(times) - 1
+
+
+def run_benchmarks(names, repeat=15, output=sys.stdout):
+    """Return {name: best time} and {name: spread} of the benchmarks."""
+    results, spreads = {}, {}
+    for name in names:
+        setup, number = BENCHMARKS[name]
+        results[name], spreads[name] = measure(setup, number, repeat)
+        print('{:<28} {:>12} +{:>4.0%}'.format(name, _format_time(results[name]), spreads[name]), file=output)
+    return results, spreads
+
+
+def compare(results, spreads, baseline, baseline_spreads, tolerance):
+    """Return the lines of the comparison with baseline, and the names of the regressed benchmarks.
+
+    A benchmark regressed when it is slower than its baseline by more than tolerance plus both spreads.
+    """
+    lines, regressions = [], []
+    for name, seconds in results.items():
+        if name not in baseline:
+            lines.append('{:<28} {:>12}   no baseline'.format(name, _format_time(seconds)))
+            continue
+        ratio = seconds / baseline[name]
+        allowed = tolerance + spreads.get(name, 0) + baseline_spreads.get(name, 0)
+        status = ''
+        if ratio > 1 + allowed:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 / (1 + allowed):
+            status = 'faster'
+        lines.append('{:<28} {:>12} {:>12} {:>7.2f}x {:>8.2f}x  {}'.format(
+            name, _format_time(seconds), _format_time(baseline[name]), ratio, 1 + allowed, status))
+    return lines, regressions
+
+
+def _format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '%.2f %s' % (seconds / scale, unit)
+    return '%.0f ns' % (seconds / 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmarks and compare them with a stored baseline.')
+    parser.add_argument('-k', dest='pattern', default='', help='only run the benchmarks whose name contains this')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file (default: %(default)s)')
+    parser.add_argument('--save', action='store_true', help='store the results in the baseline file')
+    parser.add_argument('--repeat', type=int, default=15, help='runs of each benchmark, the best one counts')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='slowdown over the baseline, on top of the spreads of the runs, reported as a '
+                             'regression (default: %(default)s)')
+    args = parser.parse_args()
+    names = [name for name in BENCHMARKS if args.pattern in name]
+    if not names:
+        parser.error('no benchmark matches ' + args.pattern)
+    try:
+        with open(args.baseline) as baseline_file:
+            stored = json.load(baseline_file)
+    except FileNotFoundError:
+        stored = {'results': {}, 'spreads': {}}
+    if not args.save and not stored['results']:
+        print('No baseline in %s, run with --save to store one' % args.baseline, file=sys.stderr)
+        sys.exit(2)
+    results, spreads = run_benchmarks(names, args.repeat)
+
+    if args.save:
+        stored.update(python=platform.python_version(), machine=platform.machine(), processor=platform.processor())
+        stored['results'].update(results)
+        stored.setdefault('spreads', {}).update(spreads)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(stored, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print('\nBaseline saved to ' + args.baseline)
+        return
+    lines, regressions = compare(results, spreads, stored['results'], stored.get('spreads', {}), args.tolerance)
+    print('\n{:<28} {:>12} {:>12} {:>8} {:>9}'.format('** Against the baseline **', 'now', 'baseline', 'ratio',
+                                                      'allowed'))
+    print('\n'.join(lines))
+    if regressions:
+        print('\n%d regression(s): %s' % (len(regressions), ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
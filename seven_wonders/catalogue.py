@@ -0,0 +1,180 @@
+"""Card and wonder catalogue, parsed once and cached on disk.
+
+The TSV files are read from the package data, so loading does not depend on the working directory. The effects
+of the cards are declared in effects.tsv and compiled into the Effect records of each card. The parsed tables are
+pickled to a cache directory (SEVEN_WONDERS_CACHE, ~/.cache/seven_wonders by default) under a name
+made of CATALOGUE_VERSION and a hash of the TSV files, so editing a file or changing the parser invalidates the
+cache. Within a process the catalogue is only built once, and worker processes forked afterwards share it.
+"""
+import array
+import csv
+import hashlib
+import importlib.resources
+import io
+import os
+import pickle
+import random
+import tempfile
+
+from seven_wonders import definitions as sw
+
+# Bump when Card, Wonder, Resource or the parsing below change in a way that makes old pickles invalid
+CATALOGUE_VERSION = 4
+PLAYER_COUNTS = range(3, 8)
+
+_catalogues = {}
+
+
+class Catalogue:
+    """Interned cards and wonders: cards[card_id] and wonders[wonder_id]. Both tables must not be modified.
+
+    deck_templates[no_of_players] holds the card IDs of each age for that many players, guilds excluded, and
+    guild_ids the IDs of all the guilds.
+    """
+    def __init__(self, cards, wonders, data_hash):
+        self.cards = cards
+        self.wonders = wonders
+        self.data_hash = data_hash
+        self.card_ids = {}
+        for card in cards:
+            self.card_ids.setdefault(card.name, []).append(card.card_id)
+        self.guild_ids = array.array('H', [card.card_id for card in cards if card.type == 'guild'])
+        self.deck_templates = {}
+        for no_of_players in PLAYER_COUNTS:
+            self.deck_templates[no_of_players] = tuple(
+                array.array('H', [card.card_id for card in cards if card.age == age and card.type != 'guild'
+                                  for _ in range(card.cards_per_players[no_of_players - PLAYER_COUNTS[0]])])
+                for age in range(1, 4))
+
+    def decks(self, no_of_players, rng=random):
+        """Return the three decks of a game as lists of cards, with no_of_players + 2 random guilds in age 3.
+
+        The decks are not shuffled: play shuffles them when dealing.
+        """
+        decks = [[self.cards[card_id] for card_id in template] for template in self.deck_templates[no_of_players]]
+        decks[2] += [self.cards[card_id] for card_id in rng.sample(self.guild_ids, no_of_players + 2)]
+        return decks
+
+
+def load(card_file='cards.tsv', wonder_file='wonders.tsv', use_cache=True, effect_file='effects.tsv'):
+    """Return the Catalogue of the given files, from memory, the disk cache or by parsing them."""
+    card_data = read_data(card_file)
+    wonder_data = read_data(wonder_file)
+    effect_data = read_data(effect_file)
+    data_hash = hashlib.sha256(card_data + b'\0' + wonder_data + b'\0' + effect_data).hexdigest()[:16]
+    if data_hash in _catalogues:
+        return _catalogues[data_hash]
+    cache_path = os.path.join(cache_dir(), 'catalogue-v%s-%s.pickle' % (CATALOGUE_VERSION, data_hash))
+    catalogue = _read_cache(cache_path) if use_cache else None
+    if catalogue is None:
+        cards = parse_cards(card_data.decode())
+        compile_effects(cards, parse_effects(effect_data.decode()))
+        catalogue = Catalogue(cards, parse_wonders(wonder_data.decode()), data_hash)
+        if use_cache:
+            _write_cache(cache_path, catalogue)
+    _catalogues[data_hash] = catalogue
+    return catalogue
+
+
+def read_data(file_name):
+    """Return the bytes of a file of the package data, or of any file given with a path."""
+    if os.path.dirname(file_name):
+        with open(file_name, 'rb') as data_file:
+            return data_file.read()
+    return (importlib.resources.files('seven_wonders') / 'data' / file_name).read_bytes()
+
+
+def cache_dir():
+    return os.environ.get('SEVEN_WONDERS_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'seven_wonders'))
+
+
+def parse_cards(text):
+    """Create a list of card object from the text of a tsv file with card descriptions."""
+    card_reader = csv.reader(io.StringIO(text), delimiter='\t')
+    next(card_reader, None)
+    return [sw.Card(line, card_id) for card_id, line in enumerate(card_reader)]
+
+
+def parse_effects(text):
+    """Return {card name: [Effect, ...]} from the text of a tsv file with card effects."""
+    effect_reader = csv.reader(io.StringIO(text), delimiter='\t')
+    next(effect_reader)
+    effects = {}
+    for line in effect_reader:
+        if not any(line):
+            continue
+        try:
+            name, kind, counts, whose, amount = line
+            effect = sw.Effect(kind, tuple(counts.split()), whose, int(amount))
+        except ValueError:
+            raise ValueError('invalid effect: ' + str(line))
+        if kind not in sw.EFFECT_KINDS or whose not in sw.EFFECT_WHOSE:
+            raise ValueError('invalid effect: ' + str(line))
+        effects.setdefault(name, []).append(effect)
+    return effects
+
+
+def compile_effects(cards, effects):
+    """Set the effects of every card. Copies of a card share the same tuple of effects."""
+    unknown = set(effects) - {card.name for card in cards}
+    if unknown:
+        raise ValueError('effects of unknown cards: ' + ', '.join(sorted(unknown)))
+    for card in cards:
+        card.effects = tuple(effects.get(card.name, ()))
+
+
+def parse_wonders(text):
+    """Create the list of wonders, one per side, from the text of a tsv file."""
+    wonder_reader = csv.reader(io.StringIO(text), delimiter='\t')
+    next(wonder_reader)
+    wonders = {}
+    for line in wonder_reader:
+        # Wonders are separated by lines of empty fields
+        if not any(line):
+            continue
+        try:
+            name, cost, resources, stage, side = line
+        except ValueError:
+            raise ValueError('invalid line: ' + str(line))
+        cost = sw.Resource(cost)
+        name = name + '_' + side
+        if resources.startswith('>'):
+            resources = resources[1:]
+        elif '/' not in resources:
+            resources = sw.Resource(resources)
+        if name not in wonders:
+            wonders[name] = sw.Wonder(name, side, resources)
+            wonders[name].wonder_id = len(wonders) - 1
+        else:
+            wonders[name].stages.append((cost, resources))
+    return list(wonders.values())
+
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            return pickle.load(cache_file)
+    except Exception:
+        # The cache is only an optimisation: a pickle of another version of the package is rebuilt
+        return None
+
+
+def _write_cache(cache_path, catalogue):
+    # Write to a temporary file first, so that workers starting together never read a partial pickle
+    temporary_path = None
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(cache_path), delete=False) as cache_file:
+            temporary_path = cache_file.name
+            pickle.dump(catalogue, cache_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, cache_path)
+        temporary_path = None
+    except OSError:
+        # The cache is only an optimisation
+        pass
+    finally:
+        if temporary_path:
+            try:
+                os.unlink(temporary_path)
+            except OSError:
+                pass
@@ -0,0 +1,229 @@
+"""Self-play datasets for training move evaluation models.
+
+Every decision of an agent becomes a fixed width record: the state seen by the deciding player, the mask of its legal
+moves, the move it chose, then its final score and rank once the game is over. Games are played on a process pool,
+each task playing a shard of games_per_shard games and writing its records to one .npy file per field, so that
+shards can be opened with numpy.load(mmap_mode='r') and memory stays bounded by a shard per worker. At most
+max_pending shards are in flight, so a slow disk slows the workers down instead of filling the memory. dataset.json
+describes the fields and lists the shards.
+
+    python -m seven_wonders.dataset DIR --games 100000 --players 4 --seed 1
+
+The layout of the records depends on the catalogue and the number of players, see Encoder. NumPy is needed by this
+module.
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from seven_wonders import agents
+from seven_wonders import catalogue
+from seven_wonders import definitions as sw
+from seven_wonders import run
+
+# Fields of the records: (dtype, width), width None for a scalar per record and 'state' or 'moves' for the widths
+# given by the Encoder
+FIELDS = collections.OrderedDict([
+    ('game', ('int64', None)),
+    ('seat', ('int8', None)),
+    ('age', ('int8', None)),
+    ('state', ('int16', 'state')),
+    ('legal', ('bool', 'moves')),
+    ('move', ('int16', None)),
+    ('score', ('int16', None)),
+    ('rank', ('int8', None)),
+])
+MANIFEST = 'dataset.json'
+
+
+class Encoder:
+    """Encode what a player sees of a game of no_of_players players as a row of integers.
+
+    The state row holds the age and the size of the hand, then for each seat, from the deciding player on in seat
+    order (player_i, player_i + 1, ...): its resources (the slots of definitions.Resource), wonder_id, wonder stage,
+    military points and the names of its played cards (one column per card name, names sorted). The cards of the
+    hand come last, one column per card name. Moves are indexed by card name to play that card, then BUILD for a
+    wonder stage and DISCARD.
+    """
+    def __init__(self, cards_and_wonders, no_of_players):
+        self.no_of_players = no_of_players
+        self.names = sorted({card.name for card in cards_and_wonders.cards})
+        self.name_ids = {name: i for i, name in enumerate(self.names)}
+        self.wonder_ids = {wonder.name: wonder.wonder_id for wonder in cards_and_wonders.wonders}
+        self.build = len(self.names)
+        self.discard = self.build + 1
+        self.moves = self.discard + 1
+        self.seat_width = len(sw.Resource.symbols) + 3 + len(self.names)
+        self.state_width = 2 + no_of_players * self.seat_width + len(self.names)
+
+    def columns(self):
+        """Return the names of the columns of the state rows."""
+        seat_columns = list(sw.Resource.symbols) + ['wonder_id', 'wonder_stage', 'military'] + self.names
+        return (['age', 'hand_size'] +
+                ['seat%d:%s' % (seat, column) for seat in range(self.no_of_players) for column in seat_columns] +
+                ['hand:' + name for name in self.names])
+
+    def encode(self, view, playable_cards):
+        """Return the (state, legal) rows of the decision of view.player_i among playable_cards."""
+        state = np.zeros(self.state_width, dtype=np.int16)
+        hand = view.cards[:agents.hand_size(view)]
+        state[:2] = view.age, len(hand)
+        for seat in range(self.no_of_players):
+            player = view.players[(view.player_i + seat) % self.no_of_players]
+            start = 2 + seat * self.seat_width
+            row = state[start:start + self.seat_width]
+            row[:len(sw.Resource.symbols)] = [player.resources[symbol] for symbol in sw.Resource.symbols]
+            stats = len(sw.Resource.symbols)
+            row[stats:stats + 3] = self.wonder_ids[player.wonder], player.wonder_stage, sum(player.military_tokens)
+            row[stats + 3 + np.array([self.name_ids[name] for name in player.played_cards], dtype=np.int64)] = 1
+        hand_start = self.state_width - len(self.names)
+        for card in hand:
+            state[hand_start + self.name_ids[card.name]] += 1
+        legal = np.zeros(self.moves, dtype=bool)
+        for card_i in playable_cards:
+            legal[self.move_index(view, ('wonder' if view.cards[card_i].type == 'wonder' else 'play', card_i))] = True
+        legal[self.discard] = True
+        return state, legal
+
+    def move_index(self, view, move):
+        """Return the index of a move (action, card index, ...) returned by an agent for view."""
+        action, card_i = move[:2]
+        if action == 'play':
+            return self.name_ids[view.cards[card_i].name]
+        return self.build if action == 'wonder' else self.discard
+
+
+class RecordingAgent(agents.Agent):
+    """Play as agent, and append (seat, age, state, legal, move) to records for every decision."""
+    def __init__(self, agent, encoder, records):
+        self.agent = agent
+        self.encoder = encoder
+        self.records = records
+
+    def choose(self, view, playable_cards):
+        move = self.agent.choose(view, playable_cards)
+        state, legal = self.encoder.encode(view, playable_cards)
+        self.records.append((view.player_i, view.age, state, legal, self.encoder.move_index(view, move)))
+        return move
+
+
+def play_records(cards_and_wonders, encoder, seed, game_i, agent_names):
+    """Play game game_i of the batch started from seed and return the columns of its records, as FIELDS."""
+    rng = run.game_rng(seed, game_i)
+    records = []
+    players = [sw.Player(str(player), RecordingAgent(agents.AGENTS[agent_names[player]](), encoder, records))
+               for player in range(encoder.no_of_players)]
+    run.play(players, cards_and_wonders.decks(encoder.no_of_players, rng), cards_and_wonders.wonders, False, rng)
+    standings = [run.standing(p) for p in players]
+    # 0 for the winner, ties broken by coins as in run.winner
+    ranks = [sum(other > standing for other in standings) for standing in standings]
+    seats = [record[0] for record in records]
+    return {
+        'game': np.full(len(records), game_i, dtype=np.int64),
+        'seat': np.array(seats, dtype=np.int8),
+        'age': np.array([record[1] for record in records], dtype=np.int8),
+        'state': np.array([record[2] for record in records], dtype=np.int16),
+        'legal': np.array([record[3] for record in records], dtype=bool),
+        'move': np.array([record[4] for record in records], dtype=np.int16),
+        'score': np.array([standings[seat][0] for seat in seats], dtype=np.int16),
+        'rank': np.array([ranks[seat] for seat in seats], dtype=np.int8),
+    }
+
+
+def _write_shard(args):
+    """Play the games of a shard and write its records, return (shard name, number of records)."""
+    directory, shard_i, no_of_players, seed, game_indices, agent_names, card_file, wonder_file = args
+    cards_and_wonders = catalogue.load(card_file, wonder_file)
+    encoder = Encoder(cards_and_wonders, no_of_players)
+    games = [play_records(cards_and_wonders, encoder, seed, game_i, agent_names) for game_i in game_indices]
+    name = 'shard-%05d' % shard_i
+    for field in FIELDS:
+        path = os.path.join(directory, '%s.%s.npy' % (name, field))
+        # Written under a temporary name, so that a shard is either complete or absent
+        with open(path + '.tmp', 'wb') as field_file:
+            np.save(field_file, np.concatenate([game[field] for game in games]))
+        os.replace(path + '.tmp', path)
+    return name, sum(len(game['move']) for game in games)
+
+
+def generate(directory, n_games, no_of_players=4, seed=0, workers=None, games_per_shard=256, agent_names=None,
+             max_pending=None, card_file='cards.tsv', wonder_file='wonders.tsv'):
+    """Write the records of n_games games to directory and yield (shard name, records) as the shards are done.
+
+    The manifest is written when all the shards are. Shards only depend on (seed, game index) and the agents.
+    """
+    agent_names = agent_names or ('random',) * no_of_players
+    os.makedirs(directory, exist_ok=True)
+    tasks = ((directory, shard_i, no_of_players, seed, range(start, min(start + games_per_shard, n_games)),
+              agent_names, card_file, wonder_file)
+             for shard_i, start in enumerate(range(0, n_games, games_per_shard)))
+    max_pending = max_pending or 2 * (workers or os.cpu_count())
+    shards = []
+    with multiprocessing.Pool(workers) as pool:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_write_shard, (task,)))
+            # Backpressure: wait for the oldest shard before starting more than max_pending
+            while len(pending) >= max_pending:
+                shards.append(pending.popleft().get())
+                yield shards[-1]
+        while pending:
+            shards.append(pending.popleft().get())
+            yield shards[-1]
+    cards_and_wonders = catalogue.load(card_file, wonder_file)
+    encoder = Encoder(cards_and_wonders, no_of_players)
+    widths = {'state': encoder.state_width, 'moves': encoder.moves, None: None}
+    manifest = {
+        'games': n_games,
+        'players': no_of_players,
+        'seed': seed,
+        'agents': list(agent_names),
+        'catalogue': cards_and_wonders.data_hash,
+        'fields': {field: [dtype, widths[width]] for field, (dtype, width) in FIELDS.items()},
+        'state_columns': encoder.columns(),
+        'moves': encoder.names + ['BUILD', 'DISCARD'],
+        'shards': [{'name': name, 'records': records} for name, records in shards],
+    }
+    with open(os.path.join(directory, MANIFEST), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+
+
+def load(directory):
+    """Return the manifest of a dataset and a {field: memory mapped array} per shard."""
+    with open(os.path.join(directory, MANIFEST)) as manifest_file:
+        manifest = json.load(manifest_file)
+    shards = [{field: np.load(os.path.join(directory, '%s.%s.npy' % (shard['name'], field)), mmap_mode='r')
+               for field in FIELDS} for shard in manifest['shards']]
+    return manifest, shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the decisions of self-play games as a training dataset.')
+    parser.add_argument('directory')
+    parser.add_argument('-n', '--games', type=int, default=1000)
+    parser.add_argument('-p', '--players', type=int, default=4, choices=range(3, 8))
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-w', '--workers', type=int, default=None, help='defaults to the number of CPUs')
+    parser.add_argument('--games-per-shard', type=int, default=256)
+    parser.add_argument('-a', '--agents', default='random',
+                        help='comma separated agent of each seat, or a single one for every seat: %s' %
+                             ', '.join(agents.AGENTS))
+    args = parser.parse_args()
+    agent_names = args.agents.split(',')
+    if len(agent_names) == 1:
+        agent_names *= args.players
+    if len(agent_names) != args.players or not set(agent_names) <= set(agents.AGENTS):
+        parser.error('invalid agents: ' + args.agents)
+    total = 0
+    for name, records in generate(args.directory, args.games, args.players, args.seed, args.workers,
+                                  args.games_per_shard, agent_names):
+        total += records
+        print('%s: %d records (%d in total)' % (name, records, total))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,181 +1,249 @@
 import collections
+import functools
 import itertools
 import random
 
+from seven_wonders import agents
+from seven_wonders import events
+from seven_wonders import profiling
 
-discarded_cards = []
+
+RAW_MATERIALS = 'TSCO'
+MANUFACTURED_GOODS = 'LGP'
+
+# An effect of a card, declared in data/effects.tsv and compiled by the catalogue into Card.effects. kind is one of:
+#   coins: coins given when the card is played
+#   commerce, guild: victory points scored at the end of the game, in the Commerce and Guilds categories
+#   discount: the counts ('raw', 'manufactured') bought from whose ('left', 'right', 'neighbours') cost 1 coin
+#   science: one more science symbol of the player's choice at the end of the game
+# Coins and points are amount for each of the counts (card types, 'wonder' for built wonder stages, 'defeat' for
+# defeat tokens) owned by whose: 'self', 'neighbours', 'self_and_neighbours' or 'all' the players.
+Effect = collections.namedtuple('Effect', ['kind', 'counts', 'whose', 'amount'])
+EFFECT_KINDS = ('coins', 'commerce', 'guild', 'discount', 'science')
+EFFECT_WHOSE = ('self', 'neighbours', 'self_and_neighbours', 'all', 'left', 'right')
+# Given by the trading_post wonder special
+TRADING_POST = Effect('discount', ('raw',), 'neighbours', 1)
 
 
 class Player:
-    def __init__(self, name):
+    def __init__(self, name, agent=None):
         self.name = name
+        self.agent = agent or agents.RandomAgent()
+        self.age = 1
+        # (action, card) of every move
         self.actions = []
         self.coins = 3
-        self.free_to_play = []
+        self.free_to_play = set()
         self.military_tokens = []
         self.played_cards = []
+        # Indexes of played_cards, kept up to date by _add_to_tableau. Built wonder stages are counted in
+        # colour_counts['wonder']
+        self.played_names = set()
+        self.played_ids = set()
+        self.colour_counts = collections.Counter()
+        # Goods ('raw', 'manufactured') bought for 1 coin from the (left, right) neighbour, and the resulting price
+        # of each Resource slot
+        self.discounts = (set(), set())
+        self.trade_prices = (trade_prices(False, False), trade_prices(False, False))
+        # Effects of the played cards that are scored at the end of the game
+        self.end_effects = []
         self.player_i = 0
         self.resources = Resource()
         # List if resources from cards that give multiple excluding resources
         self.split_resources = []
-        self.split_resources_combinations = []
+        self.split_resources_index = SplitResources()
+        # Only split resources from brown and gray cards can be bought by the neighbours
+        self.tradeable_split_resources = SplitResources()
         self.resources.initialize_resources()
         self.adjacent_players_i = None
         self.victory_points = dict()
+        self.log = events.NULL_SINK
+        self.profiler = profiling.NULL_PROFILER
+        self.rng = random
+        # Shared by all the players of a game
+        self.discarded_cards = []
+
+    def play_a_turn(self, players, hand, free=False):
+        """Play a card from hand. If free, the cards of the hand (but not the wonder stage) cost nothing."""
+        profiler = self.profiler
+        if profiler.enabled:
+            started = profiler.start()
+        cards, playable_cards = self.playable_moves(players, hand, free)
+        if profiler.enabled:
+            profiler.stop('affordability', started)
+            started = profiler.start()
+        move = self.agent.choose(*self.decision(playable_cards, cards, players))
+        if profiler.enabled:
+            profiler.stop('move_selection', started)
+            started = profiler.start()
+        self.apply_move(players, hand, cards, move, free)
+        # Cards played this way are free. Their cost is never changed, since the cards are shared between games.
+        for special_hand in self.special_turns(hand):
+            if profiler.enabled:
+                profiler.count('special_plays')
+            self.play_a_turn(players, special_hand, free=True)
+        if profiler.enabled:
+            profiler.stop('card_application', started)
+        return hand, players
 
-    def play_a_turn(self, players, hand):
+    def playable_moves(self, players, hand, free=False):
+        """Return the cards of a turn (hand, then the wonder if a stage is left) and {card index: gold cost} of the
+        playable ones."""
         cards = hand + [self.wonder] if not self.wonder.is_last_stage else hand
         playable_cards = {}
         # Create a dictionary of playable cards and their cost in terms of resources to buy from other players
         for card_i, card in enumerate(cards):
-            can_buy_and_cost = self.can_play(card, players)
+            can_buy_and_cost = self.can_play(card, players, free and card.type != 'wonder')
             if can_buy_and_cost is not None:
                 playable_cards[card_i] = can_buy_and_cost
-        action, picked_card_i, picked_card_cost = self._pick_best_move(playable_cards, cards, players)
+        return cards, playable_cards
+
+    def apply_move(self, players, hand, cards, move, free=False):
+        """Play a move (action, card index, gold cost) among the cards of a turn and remove its card from hand."""
+        action, picked_card_i, picked_card_cost = move
         picked_card = cards[picked_card_i]
+        coins_before = self.resources['$']
         if action == 'coin':
             self.resources['$'] += 3
-            self.actions.append('discarded ' + picked_card.name)
-            discarded_cards.append(card)
+            self.discarded_cards.append(picked_card)
         elif action == 'wonder':
+            # Pay the coins of the stage before moving on, since the cost of a wonder is the one of its next stage
+            self.resources['$'] -= self.wonder.cost['$']
             next(self.wonder)
-            # TODO minor: this won't print split resources for Alexandria
-            self.actions.append('activated stage %s of the wonder %s - %s' %
-                                (self.wonder.current_stage, self.wonder.name, self.wonder.resources))
-            self._play_a_card(self.wonder, picked_card_cost, players)
+            self._play_a_card(self.wonder, picked_card_cost, players, free=True)
         # Play a normal card
         else:
-            self._play_a_card(picked_card, picked_card_cost, players)
-            resource_to_print = str(picked_card.resources) if picked_card.resources else \
-                '/'.join(picked_card.split_resources)
-            self.actions.append('played %s - %s' % (picked_card.name, resource_to_print))
-        print("player %s: %s" % (self.name, self.actions[-1]))
+            self._play_a_card(picked_card, picked_card_cost, players, free)
+        self.actions.append((action, picked_card))
         # Pay players for trading
         if picked_card_cost:
             p1, p2 = picked_card_cost.keys()
             players[p1].resources['$'] += picked_card_cost[p1]
             players[p2].resources['$'] += picked_card_cost[p2]
+        if self.log.enabled:
+            payments = [picked_card_cost.get(i, 0) for i in self.adjacent_players_i] if picked_card_cost else [0, 0]
+            self.log.move(self, action, picked_card, self.resources['$'] - coins_before, payments)
         hand.pop(picked_card_i)
 
-        # Play some wonder specials
+    def special_turns(self, hand):
+        """Yield the hands of the free turns given by the wonder specials after a move, in order.
+
+        Each hand is yielded once the turn of the previous one is played.
+        """
         if self.wonder.specials['play_discarded_card']:
-            for card in discarded_cards.copy():
-                card.cost = Resource()
             self.wonder.specials['play_discarded_card'] = False
-            if discarded_cards:
-                self.play_a_turn(players, discarded_cards)
+            if self.discarded_cards:
+                yield self.discarded_cards
         if len(hand) == 1 and self.wonder.specials['play_seventh']:
-            hand[0].cost = Resource()
-            self.play_a_turn(players, hand)
-        return hand, players
+            yield hand
 
-    def can_play(self, card, players):
+    def can_play(self, card, players, free=False):
+        if self.profiler.enabled:
+            self.profiler.count('can_play_calls')
         gold_cost = dict()
-        missing_resources = (self.resources - card.cost).negative_items()
-        if card.name in [c.name for c in self.played_cards]:
+        if card.name in self.played_names:
             return None
-        if card.name in self.free_to_play or not missing_resources:
+        if free:
             return gold_cost
-        # Check if we can pay missing resources with any split resource combination
-        resource_set_to_buy = []
-        for resource_comb in self.split_resources_combinations:
-            missing_resource_after = (missing_resources + resource_comb).negative_items()
-            if not missing_resource_after:
-                return gold_cost
-            if missing_resource_after not in resource_set_to_buy:
-                resource_set_to_buy.append(Resource(missing_resource_after))
-        # Buy the resources from other players
-        # TODO critical: add support for buying from split resource cards
-        adjacent_players = [players[i] for i in self.adjacent_players_i]
-        gold_cost_list = []
-        played_cards_names = [c.name for c in self.played_cards]
+        resources_after = self.resources - card.cost
+        if card.name in self.free_to_play or not resources_after.has_negative():
+            return gold_cost
+        coins = resources_after['$']
+        if coins < 0:
+            return None
+        missing_resources = resources_after.negative_items()
+        # Check if we can pay missing resources with the split resources, otherwise get what is left to buy
+        resource_set_to_buy = self.split_resources_index.leftovers(missing_resources)
+        profiler = self.profiler
+        if profiler.enabled:
+            profiler.observe('split_combinations', len(resource_set_to_buy))
+        if not resource_set_to_buy[0]:
+            return gold_cost
+        # Buy the resources from other players, picking the cheapest set of trades
+        if profiler.enabled:
+            started = profiler.start()
+        left_i, right_i = self.adjacent_players_i
+        best_trade = None
         for resources_to_buy in resource_set_to_buy:
-            # Other players have the resources we need.
-            if not (resources_to_buy + adjacent_players[0].resources + adjacent_players[1].resources).negative_items():
-                # We buy semi-randomly from players. Adding a model would require too much work for little return.
-                random.shuffle(adjacent_players)
-                # If we were to buy from p1, whatever it's still negative in our resources is to buy from p2
-                to_buy_from_p2 = abs((resources_to_buy + adjacent_players[0].resources).negative_items())
-                to_buy_from_p1 = abs(to_buy_from_p2 + resources_to_buy)
-                cost_from_p1 = 0
-                cost_from_p2 = 0
-                for resource, value in to_buy_from_p1.items():
-                    if (resource in 'TSCO' and 'West Trading Post' in played_cards_names) or \
-                            (resource in 'LGP' and 'Marketplace' in played_cards_names) or \
-                            self.wonder.specials['trading_post']:
-                        cost_from_p1 += value
-                    else:
-                        cost_from_p1 += value * 2
-                for resource, value in to_buy_from_p2.items():
-                    if (resource in 'TSCO' and 'East Trading Post' in played_cards_names) or \
-                            (resource in 'LGP' and 'Marketplace' in played_cards_names) or \
-                            self.wonder.specials['trading_post']:
-                        cost_from_p2 += value
-                    else:
-                        cost_from_p2 += value * 2
-                if self.resources['$'] > cost_from_p1 + cost_from_p2:
-                    gold_cost[adjacent_players[0].player_i] = cost_from_p1
-                    gold_cost[adjacent_players[1].player_i] = cost_from_p2
-                    gold_cost_list.append(gold_cost)
-
-        if gold_cost_list:
-            # Return the cheapest set of trades
-            return sorted(gold_cost_list, key=lambda x: sum(x.values()))[0]
-        return None
+            trade = cheapest_trade(abs(resources_to_buy).as_tuple(), players[left_i].trade_supply(),
+                                   players[right_i].trade_supply(), *self.trade_prices)
+            if trade is not None and (best_trade is None or sum(trade) < sum(best_trade)):
+                best_trade = trade
+        if profiler.enabled:
+            profiler.stop('trade', started)
+        if best_trade is None or sum(best_trade) > coins:
+            return None
+        gold_cost[left_i], gold_cost[right_i] = best_trade
+        return gold_cost
+
+    def trade_supply(self):
+        """Return the resources this player can sell to its neighbours, in the form used by cheapest_trade."""
+        return (tuple(v if symbol in RAW_MATERIALS or symbol in MANUFACTURED_GOODS else 0
+                      for symbol, v in zip(Resource.symbols, self.resources.values)),
+                self.tradeable_split_resources.key)
 
-    def _play_a_card(self, card, gold_cost, players):
+    def _play_a_card(self, card, gold_cost, players, free=False):
         # permanently remove the cost of cards in coin. Resources are not removed, since they reset every turn.
-        self.resources['$'] -= card.cost['$'] + sum([v for v in gold_cost.values()])
-        self.played_cards.append(card)
-        self.free_to_play += card.gives_free
-
-        if card.type == 'yellow':
-            adjacent_players = [players[i] for i in self.adjacent_players_i]
-            if card.name == 'Vineyard':
-                self.resources['$'] += count_card_types('brown', adjacent_players)
-            elif card.name == 'Bazaar':
-                self.resources['$'] += count_card_types('gray', adjacent_players) * 2
-            elif card.name == 'Haven':
-                self.resources['$'] += count_card_types('brown', [self])
-            elif card.name == 'Lighthouse':
-                self.resources['$'] += count_card_types('yellow', [self])
-            elif card.name == 'Chamber of Commerce':
-                self.resources['$'] += count_card_types('gray', [self]) * 2
-            elif card.name == 'Arena':
-                self.resources['$'] += 3 * self.wonder.current_stage
+        self.resources['$'] -= (0 if free else card.cost['$']) + sum([v for v in gold_cost.values()])
+        self._add_to_tableau(card)
+        for effect in card.effects:
+            if effect.kind == 'coins':
+                self.resources['$'] += effect_value(effect, self, players)
+            elif effect.kind == 'discount':
+                self._add_discount(effect)
+            else:
+                self.end_effects.append(effect)
 
         # Guild cards don't give any resource
-        elif card.type == 'guild':
+        if card.type == 'guild':
             return True
 
         elif card.type == 'wonder':
             # This wonder stage triggers a special ability
             if isinstance(card.resources, str):
                 self.wonder.specials[card.resources] = True
+                if card.resources == 'trading_post':
+                    self._add_discount(TRADING_POST)
                 return True
 
         self.resources += card.resources
         if card.split_resources:
             self.split_resources.append(card.split_resources)
-            self.split_resources_combinations = [Resource(''.join(resource_comb))
-                                                 for resource_comb in itertools.product(*self.split_resources)]
+            self.split_resources_index.add(card.split_resources)
+            if card.type in ('brown', 'gray'):
+                self.tradeable_split_resources.add(card.split_resources)
 
-    def _pick_best_move(self, playable_cards_i, cards, players):
-        """Return the index of the card to pick and an action."""
+    def _add_to_tableau(self, card):
+        self.played_cards.append(card)
+        # Wonder stages can be built after one another
+        if card.type != 'wonder':
+            self.played_names.add(card.name)
+        if card.card_id is not None:
+            self.played_ids.add(card.card_id)
+        self.colour_counts[card.type] += 1
+        self.free_to_play.update(card.gives_free)
+
+    def _add_discount(self, effect):
+        sides = (0, 1) if effect.whose == 'neighbours' else (0,) if effect.whose == 'left' else (1,)
+        for side in sides:
+            self.discounts[side].update(effect.counts)
+        self.trade_prices = tuple(trade_prices('raw' in goods, 'manufactured' in goods) for goods in self.discounts)
+
+    def decision(self, playable_cards_i, cards, players):
+        """Return the (GameView, playable cards) given to the agent to choose a move."""
         if self.wonder.specials['build_free_structure']:
             playable_cards_i = {i: {} for i in range(max(len(cards) - 2, 0))}
             self.wonder.specials['build_free_structure'] = False
-        if not playable_cards_i:
-            # -2 to avoid choosing the wonder
-            return "coin", random.randint(0, max(len(cards) - 2, 0)), None
-        picked_card_i = random.choice(list(playable_cards_i.keys()))
-        cost = playable_cards_i[picked_card_i]
-        if isinstance(cards[picked_card_i], Wonder):
-            return "wonder", random.randint(0, max(len(cards) - 2, 0)), cost
-        return 'play', picked_card_i, cost
+        view = agents.GameView(self.player_i, self.age, tuple(agents.card_view(card) for card in cards),
+                               tuple(agents.player_view(p) for p in players), self.rng)
+        return view, playable_cards_i
+
 
+class Resource:
+    """Fixed layout vector of resources, with one slot per symbol of _resource_map.
 
-class Resource(collections.Counter):
+    Behaves like a Counter of symbols (missing symbols count 0), but arithmetic works slot by slot on plain lists.
+    """
     # TODO trivial: split usable resources from the rest?
     _resource_map = {
         '$': 'Coins',
@@ -193,47 +261,110 @@ class Resource(collections.Counter):
         'V': 'Victory Points from blue cards',
         'W': 'Victory Points from wonder'
     }
-
-    def __init__(self, *args, **kwargs):
-        self.update(*args, **kwargs)
-        self.__name__ = 'Resource'
+    symbols = tuple(_resource_map.keys())
+    _index = {symbol: i for i, symbol in enumerate(symbols)}
+    __slots__ = ('values',)
+
+    def __init__(self, resources=None):
+        """Create from a string of symbols ('TTS'), a mapping of symbol to count, or another Resource."""
+        self.values = [0] * len(self.symbols)
+        if resources is None:
+            return
+        if isinstance(resources, Resource):
+            self.values[:] = resources.values
+            return
+        try:
+            if isinstance(resources, str):
+                for symbol in resources:
+                    self.values[self._index[symbol]] += 1
+            else:
+                for symbol, value in resources.items():
+                    self.values[self._index[symbol]] += value
+        except KeyError as e:
+            raise ValueError(str(e) + ' is not a valid resource\n')
+
+    @classmethod
+    def from_values(cls, values):
+        """Wrap a list of slot values without copying or validating it."""
+        result = cls.__new__(cls)
+        result.values = values
+        return result
 
     def initialize_resources(self):
-        dict.update(self, [(k, 0) for k in self._resource_map.keys()])
+        self.values = [0] * len(self.symbols)
         self['$'] = 4
 
     def negative_items(self):
         # returns all negative resources
-        return Resource({k: v for k, v in self.items() if v < 0})
+        return Resource.from_values([v if v < 0 else 0 for v in self.values])
+
+    def has_negative(self):
+        return min(self.values) < 0
+
+    def copy(self):
+        return Resource.from_values(self.values[:])
+
+    def as_tuple(self):
+        return tuple(self.values)
+
+    def __getitem__(self, symbol):
+        try:
+            return self.values[self._index[symbol]]
+        except KeyError:
+            raise ValueError(repr(symbol) + ' is not a valid resource\n')
+
+    def __setitem__(self, symbol, value):
+        try:
+            self.values[self._index[symbol]] = value
+        except KeyError:
+            raise ValueError(repr(symbol) + ' is not a valid resource\n')
+
+    def keys(self):
+        return [symbol for symbol, v in zip(self.symbols, self.values) if v]
 
-    def validate_resource(self, other):
-        if not isinstance(other, collections.Counter):
+    def items(self):
+        return [(symbol, v) for symbol, v in zip(self.symbols, self.values) if v]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __bool__(self):
+        return any(self.values)
+
+    def __eq__(self, other):
+        if not isinstance(other, Resource):
             return NotImplemented
-        if not set(other.keys()) <= set(self._resource_map.keys()):
-            raise ValueError(str(other.keys()) + ' are not valid resources\n')
+        return self.values == other.values
+
+    __hash__ = None
 
     def __abs__(self):
-        return Resource({k: abs(v) for k, v in self.items()})
+        return Resource.from_values([abs(v) for v in self.values])
 
     def __sub__(self, other):
-        self.validate_resource(other)
-        result = Resource()
-        for elem in set(self) | set(other):
-            result[elem] = self[elem] - other[elem]
-        return result
+        if not isinstance(other, Resource):
+            other = Resource(other)
+        return Resource.from_values([a - b for a, b in zip(self.values, other.values)])
 
     def __add__(self, other):
-        self.validate_resource(other)
-        result = Resource()
-        for elem in set(self) | set(other):
-            result[elem] = self[elem] + other[elem]
-        return result
+        if not isinstance(other, Resource):
+            other = Resource(other)
+        return Resource.from_values([a + b for a, b in zip(self.values, other.values)])
 
     def __iadd__(self, other):
-        return self + other
+        if not isinstance(other, Resource):
+            other = Resource(other)
+        self.values = [a + b for a, b in zip(self.values, other.values)]
+        return self
 
     def __isub__(self, other):
-        return self - other
+        if not isinstance(other, Resource):
+            other = Resource(other)
+        self.values = [a - b for a, b in zip(self.values, other.values)]
+        return self
 
     def __repr__(self):
         if not self:
@@ -248,8 +379,40 @@ class Resource(collections.Counter):
         return '{%s}' % items
 
 
+class SplitResources:
+    """Index of the cards that give one resource out of several, grouped by their options.
+
+    Tells what is still missing after picking at most one resource from each card, without enumerating every
+    combination of the cards. It is updated in place when a card is played.
+    """
+    def __init__(self):
+        # Slot indices of the options -> number of cards offering them
+        self.options = {}
+        self.key = ()
+
+    def add(self, split_resources):
+        options = tuple(sorted(Resource._index[symbol] for symbol in split_resources))
+        self.options[options] = self.options.get(options, 0) + 1
+        # Hashable summary of the index, used to cache the answers
+        self.key = tuple(sorted(self.options.items()))
+
+    def leftovers(self, missing_resources):
+        """Return the smallest sets of resources still missing after using the split cards.
+
+        missing_resources holds negative values, as returned by Resource.negative_items(). If the split cards cover
+        everything the result is [Resource()], otherwise none of the returned Resources includes another one.
+        """
+        missing = tuple(-v for v in missing_resources.values)
+        return [Resource.from_values([-v for v in leftover]) for leftover in split_leftovers(missing, self.key)]
+
+    def covers(self, missing_resources):
+        return not self.leftovers(missing_resources)[0]
+
+
 class Card:
-    def __init__(self, ld):
+    def __init__(self, ld, card_id=None):
+        # Index of the card in the card file
+        self.card_id = card_id
         self.cost = Resource(ld[0])
         self.name = ld[1].strip()
         self.split_resources = []
@@ -258,7 +421,10 @@ class Card:
         self.cards_per_players = [int(val.strip()) for val in ld[5:10] if val]
         self.age = int(ld[10].strip())
         self.type = ld[11].strip()
-        if not (self.type == "yellow" or self.type == 'guild'):
+        # Set by the catalogue from the effects file
+        self.effects = ()
+        # Resources starting with '>' describe the effects of the card
+        if not ld[2].startswith('>'):
             self._calculate_resources(ld[2])
 
     def _calculate_resources(self, resource):
@@ -283,12 +449,27 @@ class Wonder:
         self.side = side
         self.current_stage = 0
         self.split_resources = []
-        self.cost = Resource()
         self.resources = wonder_resource
         self.type = 'wonder'
+        self.effects = ()
+        self.card_id = None
+        self.wonder_id = None
         # Don't change this into a card, it's similar, but quite different. Not worth.
         self.stages = [(Resource(), wonder_resource)]
 
+    @property
+    def cost(self):
+        """Cost of the next stage."""
+        stage = self.current_stage + 1
+        return self.stages[stage][0] if stage < len(self.stages) else Resource()
+
+    def fresh_copy(self):
+        """Return this wonder with no stage built. The stages are shared, since they are never modified."""
+        wonder = Wonder(self.name, self.side, self.stages[0][1])
+        wonder.wonder_id = self.wonder_id
+        wonder.stages = self.stages
+        return wonder
+
     def __iter__(self):
         return self
 
@@ -299,8 +480,6 @@ class Wonder:
             self.is_last_stage = True
         elif stage > len(self.stages):
             raise StopIteration
-        else:
-            self.cost = self.stages[stage][0]
         resource = self.stages[stage][1]
         if '/' in resource:
             self.split_resources = resource.split('/')
@@ -312,4 +491,84 @@ class Wonder:
 
 
 def count_card_types(card_type, players):
-    return sum([1 for player in players for card in player.played_cards if card.type == card_type])
+    return sum(player.colour_counts[card_type] for player in players)
+
+
+def effect_value(effect, player, players):
+    """Return the coins or victory points that a coins, commerce or guild effect gives to player."""
+    if effect.whose == 'self':
+        counted = (player,)
+    elif effect.whose == 'neighbours':
+        counted = [players[i] for i in player.adjacent_players_i]
+    elif effect.whose == 'self_and_neighbours':
+        counted = [player] + [players[i] for i in player.adjacent_players_i]
+    else:
+        counted = players
+    total = 0
+    for p in counted:
+        for thing in effect.counts:
+            # Built wonder stages are counted as played cards of type 'wonder'
+            total += p.military_tokens.count(-1) if thing == 'defeat' else p.colour_counts[thing]
+    return effect.amount * total
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def split_leftovers(missing, split_key):
+    """Return the minimal tuples still missing after using the split cards of split_key to cover missing."""
+    # Each card can reduce one missing resource by one, so the number of states is bounded by the cost of the
+    # card rather than by the number of combinations of split cards.
+    states = {missing}
+    for options, cards in split_key:
+        useful = [i for i in options if missing[i]]
+        for _ in range(cards if useful else 0):
+            next_states = set(states)
+            for state in states:
+                for i in useful:
+                    if state[i]:
+                        next_states.add(state[:i] + (state[i] - 1,) + state[i + 1:])
+            states = next_states
+    zero = (0,) * len(missing)
+    if zero in states:
+        return (zero,)
+    # Drop the leftovers that include a smaller one: they can never be cheaper to buy.
+    minimal = []
+    for state in sorted(states, key=sum):
+        if not any(all(a <= b for a, b in zip(other, state)) for other in minimal):
+            minimal.append(state)
+    return tuple(minimal)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def cheapest_trade(to_buy, left_supply, right_supply, left_prices, right_prices):
+    """Return the cheapest (left cost, right cost) to buy the resources in to_buy, or None if it is not possible.
+
+    to_buy and the prices have one value per Resource slot. A supply is the (tradeable resources, split key) of a
+    neighbour, as returned by Player.trade_supply().
+    """
+    if any(n and not price for n, price in zip(to_buy, left_prices)):
+        # Coins, military, science and points can't be bought
+        return None
+    best = None
+    for from_left in itertools.product(*[range(n + 1) for n in to_buy]):
+        from_right = tuple(n - l for n, l in zip(to_buy, from_left))
+        cost = (sum(n * price for n, price in zip(from_left, left_prices)),
+                sum(n * price for n, price in zip(from_right, right_prices)))
+        # On ties, pay less to the left neighbour
+        if best is not None and (sum(cost), cost[0]) >= (sum(best), best[0]):
+            continue
+        if _can_supply(from_left, left_supply) and _can_supply(from_right, right_supply):
+            best = cost
+    return best
+
+
+def _can_supply(resources, supply):
+    produced, split_key = supply
+    missing = tuple(n - p if n > p else 0 for n, p in zip(resources, produced))
+    return not any(missing) or not any(split_leftovers(missing, split_key)[0])
+
+
+def trade_prices(raw_discount, manufactured_discount):
+    """Return the price of each Resource slot: 1 or 2 coins for tradeable resources, 0 for the others."""
+    return tuple((1 if raw_discount else 2) if symbol in RAW_MATERIALS else
+                 (1 if manufactured_discount else 2) if symbol in MANUFACTURED_GOODS else 0
+                 for symbol in Resource.symbols)
@@ -0,0 +1,215 @@
+"""Structured events of a game, sent to pluggable sinks.
+
+The engine calls the methods of an EventSink at every step of a game, but only when its enabled attribute is true,
+so the default NULL_SINK costs a single attribute check. TextSink prints the game as text, ColumnarSink buffers the
+events in integer columns and writes them in chunks of NumPy .npz files for offline analysis.
+"""
+import array
+import ast
+import os
+import struct
+import sys
+import zipfile
+
+# Victory point categories of the players at the end of a game, see run.calculate_victory_points
+SCORE_CATEGORIES = ('Military', 'Treasury', 'Wonder', 'Blue cards', 'Commerce', 'Science', 'Guilds',
+                    'Copied Guild: ', 'Total')
+# Codes of the action column of the moves
+ACTIONS = ('play', 'wonder', 'coin')
+MOVE_COLUMNS = ('game', 'age', 'turn', 'player', 'action', 'card_id', 'wonder_stage', 'coins', 'pay_left',
+                'pay_right')
+# winner is -1 for a draw
+FIGHT_COLUMNS = ('game', 'age', 'fighter_one', 'fighter_two', 'winner')
+
+
+class EventSink:
+    """Sink that ignores every event. Subclasses set enabled and override the events they need."""
+    enabled = False
+
+    def game_start(self, players):
+        pass
+
+    def age_start(self, age):
+        pass
+
+    def turn_start(self, turn):
+        pass
+
+    def move(self, player, action, card, coins, payments):
+        """A player played card: coins is the change of its coins, payments the coins paid to (left, right)."""
+        pass
+
+    def fight(self, age, fighter_one, fighter_two, winner):
+        pass
+
+    def game_end(self, players):
+        """The game ended and the victory points of the players are set."""
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+NULL_SINK = EventSink()
+
+
+class TextSink(EventSink):
+    """Print a human readable account of the game."""
+    enabled = True
+
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self._fights_age = None
+
+    def _print(self, *args, **kwargs):
+        print(*args, file=self.output, **kwargs)
+
+    def game_start(self, players):
+        self._print("\n** Wonders **")
+        for p in players:
+            self._print("Player {}: {}".format(p.name, p.wonder.name))
+
+    def age_start(self, age):
+        self._print("\n** Beginning of age %s **" % age)
+
+    def turn_start(self, turn):
+        if turn:
+            self._print()
+
+    def move(self, player, action, card, coins, payments):
+        if action == 'coin':
+            text = 'discarded ' + card.name
+        elif action == 'wonder':
+            # TODO minor: this won't print split resources for Alexandria
+            text = 'activated stage %s of the wonder %s - %s' % (player.wonder.current_stage, player.wonder.name,
+                                                                 player.wonder.resources)
+        else:
+            resource_to_print = str(card.resources) if card.resources else '/'.join(card.split_resources)
+            text = 'played %s - %s' % (card.name, resource_to_print)
+        self._print("player %s: %s" % (player.name, text))
+
+    def fight(self, age, fighter_one, fighter_two, winner):
+        if age != self._fights_age:
+            self._fights_age = age
+            self._print('\n** Fighting begins **')
+        result = winner.name + " wins" if winner else 'draw!'
+        self._print("%s vs %s: %s" % (fighter_one.name, fighter_two.name, result))
+
+    def game_end(self, players):
+        self._print()
+        for p in players:
+            self._print("Player %s:\n\tResources: %s\n\tSplit resources: %s" % (p.name, p.resources,
+                                                                               p.split_resources))
+        self._print("\n** Victory Points **")
+        for p in players:
+            formatted_points = ["\n{:>15}: {}".format(k, v) for k, v in p.victory_points.items()]
+            self._print("\nPlayer %s:%s" % (p.name, ''.join(formatted_points)))
+        self._print("\n**Ranking**",
+                    ''.join(["\n\tPlayer {}: {}".format(p.name, p.victory_points['Total']) for p
+                             in sorted(players, key=lambda p: p.victory_points['Total'], reverse=True)]))
+
+
+class ColumnarSink(EventSink):
+    """Buffer the events in integer columns and write them in chunks of .npz files.
+
+    Every chunk file, named <prefix>-<chunk>.npz in directory, holds the arrays moves_<column>, fights_<column>
+    and scores_<column> (see MOVE_COLUMNS, FIGHT_COLUMNS and score_columns). Games are numbered from first_game.
+    The files are written without NumPy, and can be read with numpy.load or read_chunk.
+    """
+    enabled = True
+
+    def __init__(self, directory, prefix='events', chunk_rows=1 << 16, first_game=0, categories=SCORE_CATEGORIES):
+        self.directory = directory
+        self.prefix = prefix
+        self.chunk_rows = chunk_rows
+        self.categories = categories
+        self.game = first_game - 1
+        self.chunk = 0
+        self._age = 0
+        self._turn = 0
+        self.tables = {
+            'moves': {column: array.array('i') for column in MOVE_COLUMNS},
+            'fights': {column: array.array('i') for column in FIGHT_COLUMNS},
+            'scores': {column: array.array('i') for column in score_columns(self.categories)},
+        }
+        os.makedirs(directory, exist_ok=True)
+
+    def game_start(self, players):
+        self.game += 1
+
+    def age_start(self, age):
+        self._age = age
+
+    def turn_start(self, turn):
+        self._turn = turn
+
+    def move(self, player, action, card, coins, payments):
+        self._append('moves', (self.game, self._age, self._turn, player.player_i, ACTIONS.index(action),
+                               -1 if card.card_id is None else card.card_id, player.wonder.current_stage, coins)
+                     + tuple(payments))
+
+    def fight(self, age, fighter_one, fighter_two, winner):
+        self._append('fights', (self.game, age, fighter_one.player_i, fighter_two.player_i,
+                                winner.player_i if winner else -1))
+
+    def game_end(self, players):
+        for p in players:
+            self._append('scores', (self.game, p.player_i, p.wonder.wonder_id, p.wonder.side == 'B') +
+                         tuple(p.victory_points.get(category, 0) for category in self.categories))
+        if len(self.tables['moves']['game']) >= self.chunk_rows:
+            self.flush()
+
+    def _append(self, table, row):
+        for column, value in zip(self.tables[table].values(), row):
+            column.append(value)
+
+    def flush(self):
+        """Write the buffered events to a new chunk file, if there are any."""
+        if not any(len(columns['game']) for columns in self.tables.values()):
+            return
+        path = os.path.join(self.directory, '%s-%05d.npz' % (self.prefix, self.chunk))
+        with zipfile.ZipFile(path, 'w') as chunk_file:
+            for table, columns in self.tables.items():
+                for column, values in columns.items():
+                    chunk_file.writestr('%s_%s.npy' % (table, column), _npy_bytes(values))
+                    del values[:]
+        self.chunk += 1
+
+    def close(self):
+        self.flush()
+
+
+def score_columns(categories):
+    # 'Blue cards' -> 'blue_cards', 'Copied Guild: ' -> 'copied_guild'
+    return ('game', 'player', 'wonder_id', 'side_b') + tuple(
+        category.strip(': ').lower().replace(' ', '_') for category in categories)
+
+
+def _npy_bytes(values):
+    """Return the content of a .npy file holding an array('i')."""
+    header = "{'descr': '%si%d', 'fortran_order': False, 'shape': (%d,), }" % (
+        '<' if sys.byteorder == 'little' else '>', values.itemsize, len(values))
+    # The header, with its magic string and length, is padded to a multiple of 64 bytes
+    header += ' ' * (-(10 + len(header) + 1) % 64) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1') + values.tobytes()
+
+
+def read_chunk(path):
+    """Return {array name: array('i')} of a chunk file written by ColumnarSink, without NumPy."""
+    arrays = {}
+    with zipfile.ZipFile(path) as chunk_file:
+        for name in chunk_file.namelist():
+            data = chunk_file.read(name)
+            header_length = struct.unpack('<H', data[8:10])[0]
+            header = ast.literal_eval(data[10:10 + header_length].decode('latin1'))
+            values = array.array('i', data[10 + header_length:])
+            if header['descr'][0] != ('<' if sys.byteorder == 'little' else '>'):
+                values.byteswap()
+            arrays[name[:-len('.npy')]] = values
+    return arrays
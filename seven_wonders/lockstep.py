@@ -0,0 +1,449 @@
+"""Lockstep engine: many games held in NumPy arrays and advanced together, one seat at a time.
+
+LockstepGames follows the rules of run.play, with the random agent or a vectorised policy, but stores the N games
+of a batch as arrays (hands as card ID matrices, resources as an (N, players, 14) array, coins, wonder stages,
+military) and plays a turn of a seat in every game with a handful of array operations. Trades are priced with
+array operations too, except the ones involving split resources: these are solved once per distinct trade and
+cached, with the same answers as Player.can_play.
+
+Games are not replayable one by one as with run.game_rng: a batch only depends on its NumPy generator (see
+batch_rng). NumPy is only needed by this module.
+"""
+import collections
+
+import numpy as np
+
+from seven_wonders import agents
+from seven_wonders import definitions as sw
+from seven_wonders import run
+from seven_wonders import scoring
+from seven_wonders.arrays import (BUILD_FREE, COINS, DEFEAT, GOODS, PLAY_DISCARDED, PLAY_SEVENTH, RAW_GOODS,
+                                  SPECIALS, SYMBOLS, THINGS, TRADING_POST, WONDER, tables)
+
+# Source of the cards of a turn that is not a hand
+DISCARDED = -1
+
+# Result of a batch: wonder_id of each seat, scores ordered as events.SCORE_CATEGORIES, final coins and the
+# winning seat of each game, ties broken by coins.
+BatchResult = collections.namedtuple('BatchResult', ['wonders', 'scores', 'coins', 'winner'])
+
+# Solved trades of each catalogue, see LockstepGames._trade
+_trades = {}
+
+
+def random_policy(games, rows, seat, candidates, playable, gold):
+    """Pick a random playable move, like agents.RandomAgent."""
+    keys = games.rng.random(playable.shape)
+    keys[~playable] = -1
+    return keys.argmax(axis=1)
+
+
+def evaluator_policy(evaluate):
+    """Return a policy picking the best move for evaluate, the evaluator of an agents.BatchEvaluatorAgent.
+
+    evaluate is called once per turn of a seat, with the moves of all the games of the batch: the rows of
+    LockstepGames.move_features for every candidate of every game, in game order.
+    """
+    def policy(games, rows, seat, candidates, playable, gold):
+        features = games.move_features(rows, seat, candidates, gold)
+        scores = np.asarray(evaluate(features.reshape(-1, features.shape[2])), dtype=np.float64)
+        scores = scores.reshape(playable.shape)
+        scores[~playable] = -np.inf
+        return scores.argmax(axis=1)
+    return policy
+
+
+class LockstepGames:
+    """n_games games of no_of_players players, played together by play().
+
+    policy(games, rows, seat, candidates, playable, gold) picks the moves of seat in the games of rows: candidates
+    holds the card IDs of the cards each game can play, padded with -1, plus a last column for the next wonder stage,
+    playable tells which ones are allowed and gold the coins each one costs from the (left, right) neighbours. It
+    returns the chosen column of each row, rows with no playable move are ignored. As with the agents, the card
+    discarded or buried under the wonder is picked at random.
+    """
+    def __init__(self, catalogue, n_games, no_of_players, rng, policy=None):
+        self.tables = tables(catalogue)
+        self.catalogue = catalogue
+        self.rng = rng
+        self.policy = policy or random_policy
+        self.n_games = n_games
+        self.no_of_players = no_of_players
+        t = self.tables
+        shape = (n_games, no_of_players)
+        self.resources = np.zeros(shape + (len(SYMBOLS),), dtype=np.int32)
+        self.resources[..., COINS] = 4
+        self.played = np.zeros(shape + (len(catalogue.cards),), dtype=np.int32)
+        self.played_names = np.zeros(shape + (t.gives_free.shape[1],), dtype=bool)
+        self.free_to_play = np.zeros_like(self.played_names)
+        self.counts = np.zeros(shape + (len(THINGS),), dtype=np.int32)
+        self.own_split = np.zeros(shape + (len(t.split_options),), dtype=np.int32)
+        self.tradeable_split = np.zeros_like(self.own_split)
+        self.discounts = np.zeros(shape + (2, 2), dtype=bool)
+        self.specials = np.zeros(shape + (len(SPECIALS),), dtype=bool)
+        self.stage = np.zeros(shape, dtype=np.int32)
+        self.military = np.zeros(shape, dtype=np.int32)
+        self.discarded = np.full((n_games, 3 * 7 * no_of_players), -1, dtype=np.int32)
+        self.discarded_len = np.zeros(n_games, dtype=np.int32)
+        self.hands = self.hand_len = None
+        self._trades = _trades.setdefault(catalogue.data_hash, {})
+        self.age = 1
+        self.wonders = self._deal_wonders()
+
+    def play(self):
+        rows = np.arange(self.n_games)
+        for age in range(3):
+            self.age = age + 1
+            self._deal(age)
+            deck_index = 0
+            for _ in range(self.hands.shape[2] - 1):
+                for seat in range(self.no_of_players):
+                    self._turn(rows, seat, (deck_index + seat) % self.no_of_players, False)
+                deck_index += 1 if age == 1 else -1
+            for seat in range(self.no_of_players - 1):
+                self._fight(seat, seat + 1, age)
+            self._fight(0, self.no_of_players - 1, age)
+        return self.result()
+
+    def result(self):
+        scores = self.scores()
+        # Ties are broken by coins, as in run.winner
+        coins = self.resources[..., COINS]
+        winner = (scores[..., -1].astype(np.int64) * 100000 + coins).argmax(axis=1)
+        return BatchResult(self.wonders, scores, coins, winner)
+
+    def _deal_wonders(self):
+        # As run.deal_wonders: distinct wonders, each on a random side
+        sides = [list(name_sides.values()) for name_sides in run.wonder_sides(self.catalogue.wonders).values()]
+        counts = np.array([len(name_sides) for name_sides in sides])
+        wonder_ids = np.zeros((len(sides), counts.max()), dtype=np.int64)
+        for name_i, name_sides in enumerate(sides):
+            wonder_ids[name_i, :len(name_sides)] = name_sides
+        names = self.rng.random((self.n_games, len(sides))).argsort(axis=1)[:, :self.no_of_players]
+        picked = wonder_ids[names, (self.rng.random(names.shape) * counts[names]).astype(np.int64)]
+        self.resources += self.tables.stage_resources[picked, 0]
+        return picked
+
+    def _deal(self, age):
+        template = np.frombuffer(self.catalogue.deck_templates[self.no_of_players][age], dtype=np.uint16)
+        deck = np.tile(template.astype(np.int32), (self.n_games, 1))
+        if age == 2:
+            guilds = np.frombuffer(self.catalogue.guild_ids, dtype=np.uint16).astype(np.int32)
+            sampled = self.rng.random((self.n_games, len(guilds))).argsort(axis=1)[:, :self.no_of_players + 2]
+            deck = np.concatenate([deck, guilds[sampled]], axis=1)
+        deck = np.take_along_axis(deck, self.rng.random(deck.shape).argsort(axis=1), axis=1)
+        hand_size = deck.shape[1] // self.no_of_players
+        self.hands = deck[:, :hand_size * self.no_of_players].reshape(self.n_games, self.no_of_players, hand_size)
+        self.hand_len = np.full((self.n_games, self.no_of_players), hand_size, dtype=np.int32)
+
+    def _fight(self, one, two, age):
+        strength = self.resources[..., SYMBOLS.index('X')]
+        wins, losses = strength[:, one] > strength[:, two], strength[:, one] < strength[:, two]
+        for seat, won, lost in ((one, wins, losses), (two, losses, wins)):
+            self.military[:, seat] += won * (1 + age * 2) - lost
+            self.counts[:, seat, DEFEAT] += lost
+
+    def _source(self, source, rows):
+        if source == DISCARDED:
+            return self.discarded[rows], self.discarded_len[rows]
+        return self.hands[rows, source], self.hand_len[rows, source]
+
+    def _remove(self, source, rows, index):
+        cards, length = self._source(source, rows)
+        shifted = np.concatenate([cards[:, 1:], np.full((len(rows), 1), -1, dtype=cards.dtype)], axis=1)
+        cards = np.where(np.arange(cards.shape[1]) < index[:, None], cards, shifted)
+        if source == DISCARDED:
+            self.discarded[rows] = cards
+            self.discarded_len[rows] -= 1
+        else:
+            self.hands[rows, source] = cards
+            self.hand_len[rows, source] -= 1
+
+    def _neighbours_sum(self, values, seat):
+        return values[:, (seat - 1) % self.no_of_players] + values[:, (seat + 1) % self.no_of_players]
+
+    def _turn(self, rows, seat, source, free):
+        """Play a turn of seat in the games of rows, from a hand or the discard pile, as Player.play_a_turn."""
+        if not len(rows):
+            return
+        t = self.tables
+        cards, length = self._source(source, rows)
+        n, width = cards.shape
+        in_source = np.arange(width) < length[:, None]
+        card_ids = np.where(in_source, cards, 0)
+        wonder, stage = self.wonders[rows, seat], self.stage[rows, seat]
+        wonder_open = stage < t.n_stages[wonder]
+        next_stage = np.minimum(stage + 1, t.n_stages[wonder])
+        names = t.name_id[card_ids]
+        allowed = np.concatenate([in_source & ~self.played_names[rows[:, None], seat, names],
+                                  wonder_open[:, None]], axis=1)
+        cost = np.concatenate([t.cost[card_ids], t.stage_cost[wonder, next_stage][:, None]], axis=1)
+        no_cost = np.zeros((n, width + 1), dtype=bool)
+        if free:
+            no_cost[:, :width] = True
+        else:
+            no_cost[:, :width] = self.free_to_play[rows[:, None], seat, names]
+        playable, gold = self._afford(rows, seat, allowed, cost, no_cost)
+        pending = self.specials[rows, seat, BUILD_FREE]
+        if pending.any():
+            # As Player.decision: any of the first cards, but the last two, with no resource to buy
+            self.specials[rows[pending], seat, BUILD_FREE] = False
+            playable[pending] = np.arange(width + 1) < (length + wonder_open - 2)[pending, None]
+            gold[pending] = 0
+
+        candidates = np.concatenate([np.where(in_source, cards, -1), np.full((n, 1), -1)], axis=1)
+        column = np.asarray(self.policy(self, rows, seat, candidates, playable, gold))
+        can_play = playable.any(axis=1)
+        build = can_play & (column == width)
+        play = can_play & ~build
+        # The card to discard or to bury under the wonder
+        index = np.where(play, column, (self.rng.random(n) * length).astype(np.int64))
+        picked = cards[np.arange(n), index]
+        paid = np.where(can_play[:, None], gold[np.arange(n), np.where(can_play, column, 0)], 0)
+        self._remove(source, rows, index)
+
+        coin = ~can_play
+        self.resources[rows[coin], seat, COINS] += 3
+        discarding = rows[coin]
+        self.discarded[discarding, self.discarded_len[discarding]] = picked[coin]
+        self.discarded_len[discarding] += 1
+        self._build(rows[build], seat)
+        self._play(rows[play], seat, picked[play], free)
+        self.resources[rows, seat, COINS] -= paid.sum(axis=1)
+        self.resources[rows, (seat - 1) % self.no_of_players, COINS] += paid[:, 0]
+        self.resources[rows, (seat + 1) % self.no_of_players, COINS] += paid[:, 1]
+
+        # Wonder specials giving extra turns, in the order of Player.play_a_turn
+        again = self.specials[rows, seat, PLAY_DISCARDED]
+        if again.any():
+            self.specials[rows[again], seat, PLAY_DISCARDED] = False
+            again &= self.discarded_len[rows] > 0
+            self._turn(rows[again], seat, DISCARDED, True)
+        seventh = (self._source(source, rows)[1] == 1) & self.specials[rows, seat, PLAY_SEVENTH]
+        self._turn(rows[seventh], seat, source, True)
+
+    def move_features(self, rows, seat, candidates, gold):
+        """Return the (rows, candidates, len(agents.MOVE_FEATURES)) array of the moves of a policy.
+
+        The features are those of agents.move_feature_matrix, filled a column at a time for all the games.
+        """
+        t = self.tables
+        n, width = candidates.shape[0], candidates.shape[1] - 1
+        card_ids = np.maximum(candidates[:, :width], 0)
+        wonder = self.wonders[rows, seat]
+        next_stage = np.minimum(self.stage[rows, seat] + 1, t.n_stages[wonder])
+        resources = self.resources[rows, seat]
+        features = np.zeros((n, width + 1, len(agents.MOVE_FEATURES)), dtype=np.int32)
+        features[..., 0] = self.age
+        features[:, width, 1] = 1
+        features[..., 2] = gold.sum(axis=2)
+        features[..., 3] = resources[:, None, COINS]
+        types = 4
+        features[:, :width, types:types + len(agents.CARD_TYPES)] = (
+            t.type_id[card_ids][..., None] == np.arange(len(agents.CARD_TYPES)))
+        features[:, width, types + WONDER] = 1
+        gives = types + len(agents.CARD_TYPES)
+        costs, has = gives + len(SYMBOLS), gives + 2 * len(SYMBOLS)
+        features[:, :width, gives:costs] = t.resources[card_ids]
+        features[:, width, gives:costs] = t.stage_resources[wonder, next_stage]
+        features[:, :width, costs:has] = t.cost[card_ids]
+        features[:, width, costs:has] = t.stage_cost[wonder, next_stage]
+        features[..., has:] = resources[:, None]
+        return features
+
+    def _afford(self, rows, seat, allowed, cost, no_cost):
+        """Return which candidates can be played and the coins paid to the (left, right) neighbours."""
+        t = self.tables
+        resources = self.resources[rows, seat]
+        coins_after = resources[:, None, COINS] - cost[..., COINS]
+        need = np.maximum(cost - resources[:, None], 0)
+        need[..., COINS] = 0
+        missing = need.any(axis=2)
+        playable = allowed & (no_cost | (~missing & (coins_after >= 0)))
+        gold = np.zeros(allowed.shape + (2,), dtype=np.int32)
+        trade_i, trade_j = np.nonzero(allowed & ~no_cost & missing & (coins_after >= 0))
+        if not len(trade_i):
+            return playable, gold
+        need = need[trade_i, trade_j]
+        # Costs in anything else than goods are rare, and can only be paid with split resources
+        exotic = need.sum(axis=1) > need[:, GOODS].sum(axis=1)
+        need = need[:, GOODS]
+        trading = rows[trade_i]
+        left, right = (seat - 1) % self.no_of_players, (seat + 1) % self.no_of_players
+        # Prices of the goods bought from each side
+        prices = [np.where(RAW_GOODS, 2 - self.discounts[trading, seat, side, 0, None],
+                           2 - self.discounts[trading, seat, side, 1, None]) for side in (0, 1)]
+        supply = [self.resources[trading, neighbour, GOODS] for neighbour in (left, right)]
+        # Goods that a split resource could give make the choice of what to buy combinatorial
+        needed = need > 0
+        splits = [self.own_split[trading, seat], self.tradeable_split[trading, left],
+                  self.tradeable_split[trading, right]]
+        simple = ~np.any([((split > 0).astype(np.int32) @ t.split_goods > 0) & needed for split in splits],
+                         axis=(0, 2)) & ~exotic
+
+        # Without split resources every good is bought from the cheapest neighbour first, from the right one on ties
+        left_first = prices[0] < prices[1]
+        from_first = np.minimum(need, np.where(left_first, supply[0], supply[1]))
+        rest = need - from_first
+        enough = np.all(rest <= np.where(left_first, supply[1], supply[0]), axis=1)
+        from_left = np.where(left_first, from_first, rest)
+        trade = np.stack([(from_left * prices[0]).sum(axis=1), ((need - from_left) * prices[1]).sum(axis=1)], axis=1)
+        for k in np.nonzero(exotic)[0]:
+            game = trading[k]
+            supplies = [(self.resources[game, neighbour], t.split_key(self.tradeable_split[game, neighbour]))
+                        for neighbour in (left, right)]
+            best = _exotic_trade(cost[trade_i[k], trade_j[k]] - self.resources[game, seat],
+                                 t.split_key(self.own_split[game, seat]), supplies, prices[0][k], prices[1][k])
+            enough[k] = best is not None
+            trade[k] = best or (0, 0)
+        hard = np.nonzero(~simple & ~exotic)[0]
+        if len(hard):
+            # What decides a trade, restricted to the needed goods so that equivalent trades share a row. A split
+            # card is never used for more units of its options than needed.
+            option_need = need[hard] @ t.split_goods.T
+            problems = np.concatenate(
+                [need[hard]] + [np.where(needed[hard], side_prices[hard], 0) for side_prices in prices] +
+                [np.minimum(side_supply[hard], need[hard]) for side_supply in supply] +
+                [np.minimum(split[hard], option_need) for split in splits], axis=1).astype(np.int8)
+            keys = problems.view(np.dtype((np.void, problems.shape[1]))).ravel().tolist()
+            trades = self._trades
+            solved = np.array([trades.get(key) or self._trade(key) for key in keys], dtype=np.int32)
+            enough[hard] = solved[:, 0] > 0
+            trade[hard] = solved[:, 1:]
+        enough &= trade.sum(axis=1) <= coins_after[trade_i, trade_j]
+        playable[trade_i[enough], trade_j[enough]] = True
+        gold[trade_i[enough], trade_j[enough]] = trade[enough]
+        return playable, gold
+
+    def _build(self, rows, seat):
+        t = self.tables
+        wonder = self.wonders[rows, seat]
+        stage = self.stage[rows, seat] + 1
+        self.stage[rows, seat] = stage
+        self.counts[rows, seat, WONDER] += 1
+        self.resources[rows, seat] += t.stage_resources[wonder, stage]
+        self.resources[rows, seat, COINS] -= t.stage_cost[wonder, stage, COINS]
+        split = t.stage_split[wonder, stage]
+        self.own_split[rows[split >= 0], seat, split[split >= 0]] += 1
+        special = t.stage_special[wonder, stage]
+        self.specials[rows[special >= 0], seat, special[special >= 0]] = True
+        # The trading_post special lowers the price of raw materials on both sides
+        self.discounts[rows[special == TRADING_POST], seat, :, 0] = True
+
+    def _play(self, rows, seat, card_ids, free):
+        t = self.tables
+        if not free:
+            self.resources[rows, seat, COINS] -= t.cost[card_ids, COINS]
+        self.played[rows, seat, card_ids] += 1
+        self.played_names[rows, seat, t.name_id[card_ids]] = True
+        self.free_to_play[rows, seat] |= t.gives_free[card_ids]
+        self.counts[rows, seat, t.type_id[card_ids]] += 1
+        counted = np.stack([self.counts[rows, seat], self._neighbours_sum(self.counts[rows], seat),
+                            self.counts[rows].sum(axis=1)], axis=1)
+        self.resources[rows, seat, COINS] += (t.effects['coins'][card_ids] * counted).sum(axis=(1, 2))
+        self.discounts[rows, seat] |= t.discount[card_ids]
+        self.resources[rows, seat] += t.resources[card_ids]
+        split = t.split[card_ids]
+        has_split = split >= 0
+        self.own_split[rows[has_split], seat, split[has_split]] += 1
+        tradeable = has_split & t.tradeable[card_ids]
+        self.tradeable_split[rows[tradeable], seat, split[tradeable]] += 1
+
+    def positions(self):
+        """Return the scoring.Positions of the games."""
+        return scoring.Positions(self.wonders, self.stage, self.resources, self.played, self.military,
+                                 self.counts[..., DEFEAT])
+
+    def scores(self):
+        """Return the victory points of the players as an (N, players, categories) array, see scoring."""
+        return scoring.score_positions(self.catalogue, self.positions())
+
+    def _trade(self, problem):
+        """Return (possible, left cost, right cost) of a trade packed by _afford."""
+        t = self.tables
+        row = np.frombuffer(problem, dtype=np.int8).tolist()
+        need, left_prices, right_prices, left_supply, right_supply = (tuple(row[i:i + 7]) for i in range(0, 35, 7))
+        own_split, left_split, right_split = (t.split_key(row[35 + i * len(t.split_options):]) for i in range(3))
+        best = _cheapest_trade(need, own_split, (left_supply, left_split), (right_supply, right_split),
+                               left_prices, right_prices)
+        self._trades[problem] = (best is not None,) + (best or (0, 0))
+        return self._trades[problem]
+
+
+def _cheapest_trade(need, split_key, left_supply, right_supply, left_prices, right_prices):
+    """Solve a trade as Player.can_play, from arguments restricted to the goods.
+
+    Gives the same answer as definitions.cheapest_trade, but enumerates what each neighbour can supply instead of
+    every way to split the purchase: once the split cards of both neighbours are assigned, every good is bought
+    from the cheapest neighbour first, and from the right one on ties.
+    """
+    goods_slot = GOODS.start
+    leftovers = sw.split_leftovers(tuple([0] * goods_slot) + need + (0,) * (len(SYMBOLS) - GOODS.stop), split_key)
+    if not any(leftovers[0]):
+        return 0, 0
+    supplies = [_supplies(supply, split, need) for supply, split in (left_supply, right_supply)]
+    best = None
+    for to_buy in leftovers:
+        to_buy = to_buy[GOODS]
+        trade = None
+        for left in supplies[0]:
+            for right in supplies[1]:
+                cost = [0, 0]
+                for n, left_n, right_n, left_price, right_price in zip(to_buy, left, right, left_prices,
+                                                                      right_prices):
+                    if n > left_n + right_n:
+                        break
+                    if left_price < right_price:
+                        from_left = min(n, left_n)
+                    else:
+                        from_left = n - min(n, right_n)
+                    cost[0] += from_left * left_price
+                    cost[1] += (n - from_left) * right_price
+                else:
+                    if trade is None or (sum(cost), cost[0]) < (sum(trade), trade[0]):
+                        trade = tuple(cost)
+        if trade is not None and (best is None or sum(trade) < sum(best)):
+            best = trade
+    return best
+
+
+def _exotic_trade(missing, split_key, supplies, left_prices, right_prices):
+    """Solve a trade of a cost that is not only made of goods with the functions used by Player.can_play."""
+    def slots(goods):
+        values = [0] * len(SYMBOLS)
+        values[GOODS] = goods.tolist()
+        return tuple(values)
+
+    leftovers = sw.split_leftovers(tuple(max(n, 0) if i != COINS else 0 for i, n in enumerate(missing.tolist())),
+                                   split_key)
+    if not any(leftovers[0]):
+        return 0, 0
+    best = None
+    for to_buy in leftovers:
+        trade = sw.cheapest_trade(to_buy, *[(slots(supply[GOODS]), split) for supply, split in supplies],
+                                  slots(left_prices), slots(right_prices))
+        if trade is not None and (best is None or sum(trade) < sum(best)):
+            best = trade
+    return best
+
+
+def _supplies(supply, split_key, need):
+    """Return the goods a neighbour can sell, capped by need, for each non dominated use of its split cards."""
+    states = {tuple(min(n, s) for n, s in zip(need, supply))}
+    for options, cards in split_key:
+        goods = [slot - GOODS.start for slot in options if GOODS.start <= slot < GOODS.stop]
+        for _ in range(cards):
+            states |= {state[:i] + (state[i] + 1,) + state[i + 1:] for state in states for i in goods
+                       if state[i] < need[i]}
+    return [state for state in states
+            if not any(other != state and all(a >= b for a, b in zip(other, state)) for other in states)]
+
+
+def batch_rng(base_seed, batch_i):
+    """Return the NumPy generator of batch batch_i, the counterpart of run.game_rng."""
+    return np.random.default_rng([base_seed, batch_i])
+
+
+def play_batch(catalogue, n_games, no_of_players, rng, policy=None):
+    """Play n_games games with the random agent (or policy) on every seat and return their BatchResult."""
+    return LockstepGames(catalogue, n_games, no_of_players, rng, policy).play()
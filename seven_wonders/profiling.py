@@ -0,0 +1,138 @@
+"""Opt-in instrumentation of the engine: time spent in each phase of the games, and counters.
+
+The engine calls a Profiler only when its enabled attribute is true, as with events.EventSink, so the default
+NULL_PROFILER costs a single attribute check at each instrumented point. Phases are timed inclusively: 'trade' is
+spent inside 'affordability', and turns played by wonder specials inside 'card_application' of the turn that
+triggered them. Profilers of the chunks of a batch are merged, and reported as a dict ready for JSON or as text.
+
+profile_call runs a function under cProfile, or under pyinstrument with tool='pyinstrument', for a view by Python
+function.
+"""
+import collections
+import time
+
+# Timed phases, see run.play and Player.play_a_turn
+PHASES = ('deal', 'affordability', 'trade', 'move_selection', 'card_application', 'fights', 'scoring')
+
+
+class Profiler:
+    """Accumulate the time and calls of each phase, counters and histograms of the values of some counters."""
+    enabled = True
+
+    def __init__(self):
+        self.times = collections.Counter()
+        self.calls = collections.Counter()
+        self.counters = collections.Counter()
+        self.histograms = collections.defaultdict(collections.Counter)
+        self._caches = {}
+
+    start = staticmethod(time.perf_counter)
+
+    def stop(self, phase, started):
+        """Add the time since started, a value returned by start(), to phase."""
+        self.times[phase] += time.perf_counter() - started
+        self.calls[phase] += 1
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def observe(self, histogram, value):
+        """Count one occurrence of value in a histogram."""
+        self.histograms[histogram][value] += 1
+
+    def start_caches(self, cached_functions):
+        """Remember the hits and misses of {name: lru_cache function}, until stop_caches counts the new ones."""
+        self._caches = {name: (function, function.cache_info()) for name, function in cached_functions.items()}
+
+    def stop_caches(self):
+        for name, (function, before) in self._caches.items():
+            after = function.cache_info()
+            self.counters[name + '_cache_hits'] += after.hits - before.hits
+            self.counters[name + '_cache_misses'] += after.misses - before.misses
+        self._caches = {}
+
+    def merge(self, other):
+        self.times.update(other.times)
+        self.calls.update(other.calls)
+        self.counters.update(other.counters)
+        for histogram, values in other.histograms.items():
+            self.histograms[histogram].update(values)
+        return self
+
+    def report(self):
+        """Return the collected data as a dict of plain values, ready to be written as JSON."""
+        return {
+            'phases': {phase: {'seconds': self.times[phase], 'calls': self.calls[phase],
+                               'mean_us': self.times[phase] / self.calls[phase] * 1e6 if self.calls[phase] else 0.0}
+                       for phase in sorted(self.calls, key=_phase_order)},
+            'counters': dict(sorted(self.counters.items())),
+            'histograms': {histogram: {str(value): n for value, n in sorted(values.items())}
+                           for histogram, values in sorted(self.histograms.items())},
+        }
+
+    def format(self):
+        """Return the report as flat text."""
+        report = self.report()
+        lines = ['{:<18} {:>10} {:>12} {:>12}'.format('phase', 'seconds', 'calls', 'mean us')]
+        for phase, values in report['phases'].items():
+            lines.append('{:<18} {:>10.3f} {:>12} {:>12.1f}'.format(phase, values['seconds'], values['calls'],
+                                                                  values['mean_us']))
+        lines.append('')
+        for counter, n in report['counters'].items():
+            lines.append('{:<30} {:>12}'.format(counter, n))
+        for histogram, values in report['histograms'].items():
+            lines.append('\n%s:' % histogram)
+            lines.extend('{:>10} {:>12}'.format(value, n) for value, n in values.items())
+        return '\n'.join(lines)
+
+
+class NullProfiler(Profiler):
+    """Profiler that is never called by the engine."""
+    enabled = False
+
+    def stop(self, phase, started):
+        pass
+
+    def count(self, counter, n=1):
+        pass
+
+    def observe(self, histogram, value):
+        pass
+
+    def start_caches(self, cached_functions):
+        pass
+
+    def stop_caches(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def _phase_order(phase):
+    return PHASES.index(phase) if phase in PHASES else len(PHASES)
+
+
+def profile_call(function, path, tool='cprofile'):
+    """Call function under cProfile or pyinstrument, write the profile to path and return the function's result.
+
+    cProfile writes pstats data, to be read with pstats or snakeviz; pyinstrument writes an HTML page.
+    """
+    if tool == 'pyinstrument':
+        import pyinstrument
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        try:
+            return function()
+        finally:
+            profiler.stop()
+            with open(path, 'w') as output:
+                output.write(profiler.output_html())
+    if tool != 'cprofile':
+        raise ValueError('unknown profiling tool: ' + tool)
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function)
+    finally:
+        profiler.dump_stats(path)
@@ -1,45 +1,79 @@
+from seven_wonders import catalogue
 from seven_wonders import definitions as sw
-import csv
+from seven_wonders import events
+from seven_wonders import profiling
 import random
-import os
 
+SCIENCE_SYMBOLS = ('&', '#', '@')
+# Bump when a change of the engine or of the agents changes the outcome of seeded games, see store
+ENGINE_VERSION = 3
+# Caches of the trade solver, whose hits and misses are counted by the profiler
+CACHED_FUNCTIONS = {'split_leftovers': sw.split_leftovers, 'cheapest_trade': sw.cheapest_trade}
 
-def main(no_of_players=4, card_file='cards.tsv', wonder_file='wonders.tsv'):
-    wonders = load_wonders(wonder_file)
-    deck = populate_decks(load_cards(card_file), no_of_players)
+
+def main(no_of_players=4, card_file='cards.tsv', wonder_file='wonders.tsv', seed=None):
+    cards_and_wonders = catalogue.load(card_file, wonder_file)
+    game_i = 0
     while True:
         players = [sw.Player(str(player)) for player in range(no_of_players)]
+        rng = game_rng(seed, game_i) if seed is not None else random.Random()
         try:
-            play(players, deck, wonders)
+            play(players, cards_and_wonders.decks(no_of_players, rng), cards_and_wonders.wonders, rng=rng)
         except KeyboardInterrupt:
             pass
+        game_i += 1
+
+
+def game_rng(base_seed, game_i):
+    """Return the random generator of game game_i of a batch.
 
+    Each game gets its own stream derived from (base_seed, game_i), so games can be split across workers in any way
+    and any of them can be replayed on its own.
+    """
+    return random.Random('%s/%s' % (base_seed, game_i))
 
-def play(players, original_deck, original_wonders):
-    sw.discarded_cards = []
+
+def play(players, original_deck, original_wonders, verbose=True, rng=None, log=None, profiler=None, deal_rng=None,
+         wonder_ids=None):
+    """Play a full game and return the total victory points of each player.
+
+    All random choices of the game, including the players' moves, are drawn from rng, except the wonders and hands
+    when deal_rng is given: games sharing a deal_rng seed then get the same deal, whatever the moves. The players
+    get distinct wonders (see deal_wonders), unless wonder_ids, an index in original_wonders per seat, forces them
+    instead. The events of the game go to log,
+    an events.EventSink; by default they are printed if verbose and dropped otherwise. The phases of the game are
+    timed by profiler, a profiling.Profiler, if given.
+    """
+    rng = rng or random.Random()
+    deal_rng = deal_rng or rng
+    log = log or (events.TextSink() if verbose else events.NULL_SINK)
+    profiler = profiler or profiling.NULL_PROFILER
+    if profiler.enabled:
+        profiler.start_caches(CACHED_FUNCTIONS)
+        started = profiler.start()
     deck = original_deck[:]
-    wonders = original_wonders[:]
-    print("\n** Wonders **")
-    for i, p in enumerate(players):
-        p.player_i = i
-        random.shuffle(wonders)
-        p.wonder = iter(wonders[random.randint(0, 1)])
-        del wonders[0:2]
-        if not isinstance(p.wonder.resources, str):
-            p.resources += p.wonder.resources
-        print("Player {}: {}".format(p.name, p.wonder.name))
-        p.adjacent_players_i = ((p.player_i - 1) % len(players),
-                              (p.player_i + 1) % len(players))
+    seat_players(players, original_wonders, rng, log, profiler, deal_rng, wonder_ids)
+    if profiler.enabled:
+        profiler.stop('deal', started)
+    if log.enabled:
+        log.game_start(players)
     for age, hand in enumerate(deck):
-        print("\n** Beginning of age %s **" % str(age + 1))
-        # create a deck for each player
-        random.shuffle(hand)
-        cards_per_deck = int(len(hand) / len(players))
-        player_decks = [hand[cards_per_deck * i:cards_per_deck * (i + 1)] for i in range(0, len(players))]
+        for p in players:
+            p.age = age + 1
+        if log.enabled:
+            log.age_start(age + 1)
+        if profiler.enabled:
+            started = profiler.start()
+        player_decks = deal(hand, len(players), deal_rng)
+        if profiler.enabled:
+            profiler.stop('deal', started)
         # Index used to track deck->player map. If it's 1, then p1 plays first, then p2 second, etc.
         deck_index = 0
+        turn = 0
         # until decks have one card left
         while len(player_decks[0]) > 1:
+            if log.enabled:
+                log.turn_start(turn)
             # assign a deck to each player and play a card
             for p_i in range(len(players)):
                 player = players[p_i]
@@ -51,78 +85,85 @@ def play(players, original_deck, original_wonders):
                 deck_index += 1
             else:
                 deck_index -= 1
-            print()
+            turn += 1
 
-        print('** Fighting begins **')
-        for p in range(len(players) - 1):
-            players[p].military_tokens, players[p + 1].military_tokens = resolve_fight(players[p], players[p + 1], age)
-            # First and last players also fight
-        players[0].military_tokens, players[-1].military_tokens = resolve_fight(players[0], players[-1], age)
-        print()
+        if profiler.enabled:
+            started = profiler.start()
+        resolve_fights(players, age, log)
+        if profiler.enabled:
+            profiler.stop('fights', started)
+
+    if profiler.enabled:
+        started = profiler.start()
+    all_victory_points = calculate_victory_points(players)
+    if profiler.enabled:
+        profiler.stop('scoring', started)
+        profiler.stop_caches()
+        profiler.count('games')
+    if log.enabled:
+        log.game_end(players)
+    return all_victory_points
+
+
+def seat_players(players, original_wonders, rng, log=events.NULL_SINK, profiler=profiling.NULL_PROFILER,
+                 deal_rng=None, wonder_ids=None):
+    """Prepare the players for a new game at the same table, with the wonders of deal_wonders drawn from deal_rng (rng
+    by default), or with original_wonders[wonder_ids[i]] for player i if wonder_ids is given."""
+    wonder_ids = wonder_ids or deal_wonders(original_wonders, len(players), deal_rng or rng)
+    discarded_cards = []
+    for i, p in enumerate(players):
+        p.player_i = i
+        p.log = log
+        p.profiler = profiler
+        # The agent's own stream, so that what an agent draws never changes the rest of the game
+        p.rng = random.Random(rng.getrandbits(64))
+        p.discarded_cards = discarded_cards
+        p.wonder = iter(original_wonders[wonder_ids[i]].fresh_copy())
+        if not isinstance(p.wonder.resources, str):
+            p.resources += p.wonder.resources
+        p.adjacent_players_i = ((p.player_i - 1) % len(players),
+                              (p.player_i + 1) % len(players))
 
-    for p in players:
-        print("Player %s:\n\tResources: %s\n\tSplit resources: %s" % (p.name, p.resources, p.split_resources))
 
-    calculate_victory_points(players)
+def wonder_sides(wonders):
+    """Return {wonder name: {side: index in wonders}}, the names being those of the wonders without their side."""
+    sides = {}
+    for i, wonder in enumerate(wonders):
+        sides.setdefault(wonder.name.rsplit('_', 1)[0], {})[wonder.side] = i
+    return sides
+
+
+def deal_wonders(wonders, no_of_players, rng):
+    """Return the index in wonders of the wonder of each player: distinct wonders, each on a random side."""
+    sides = wonder_sides(wonders)
+    return [sides[name][rng.choice(sorted(sides[name]))] for name in rng.sample(sorted(sides), no_of_players)]
+
+
+def deal(hand, no_of_players, rng):
+    """Shuffle the deck of an age and return the hand of each player."""
+    rng.shuffle(hand)
+    cards_per_deck = int(len(hand) / no_of_players)
+    return [hand[cards_per_deck * i:cards_per_deck * (i + 1)] for i in range(0, no_of_players)]
+
+
+def resolve_fights(players, age, log=events.NULL_SINK):
+    """Fight every pair of neighbours at the end of age (0 to 2)."""
+    for p in range(len(players) - 1):
+        players[p].military_tokens, players[p + 1].military_tokens = resolve_fight(players[p], players[p + 1], age,
+                                                                                   log)
+    # First and last players also fight
+    players[0].military_tokens, players[-1].military_tokens = resolve_fight(players[0], players[-1], age, log)
 
 
 def calculate_victory_points(players):
-    def calc_science_vp(player):
-        def science_formula(resources):
-            return (resources['&'] ** 2 + resources['#'] ** 2 + resources['@'] ** 2 +
-            7 * min([resources['&'], resources['#'], resources['@']]))
-
-        p_resources = player.resources
-        if 'Scientists' in [c.name for c in player.played_cards]:
-            resource_candidates = []
-            for symbol in ['&', '#', '@']:
-                tmp_resources = p_resources
-                tmp_resources[symbol] += 1
-                resource_candidates.append(science_formula(tmp_resources))
-            return sorted(resource_candidates)[-1]
-        return science_formula(p_resources)
-
-    def calc_commerce_vp(player):
-        vp = 0
-        played_cards_names = [c.name for c in player.played_cards]
-        if 'Haven' in played_cards_names:
-            vp += sw.count_card_types('brown', [player])
-        if 'Lighthouse' in played_cards_names:
-            vp = sw.count_card_types('yellow', [player])
-        if 'Haven' in played_cards_names:
-            vp += sw.count_card_types('gray', [player]) * 2
-        return vp
-
-    def calc_guilds_vp(this_player, adjacent_players):
-        vp = []
-        played_cards_names = [c.name for c in this_player.played_cards]
-        if 'Workers' in played_cards_names:
-            vp.append(sw.count_card_types('brown', adjacent_players))
-        if 'Craftsmen' in played_cards_names:
-            vp.append(sw.count_card_types('gray', adjacent_players) * 2)
-        if 'Traders' in played_cards_names:
-            vp.append(sw.count_card_types('yellow', adjacent_players))
-        if 'Philosophers' in played_cards_names:
-            vp.append(sw.count_card_types('green', adjacent_players))
-        if 'Spies' in played_cards_names:
-            vp.append(sw.count_card_types('red', adjacent_players))
-        if 'Magistrates' in played_cards_names:
-            vp.append(sw.count_card_types('blue', adjacent_players))
-        if 'Strategists' in played_cards_names:
-            vp.append(sum([1 for player in adjacent_players for token in player.military_tokens if token == -1]))
-        if 'Ship-owners' in played_cards_names:
-            vp.append(sum([1 for card in this_player.played_cards if card.type in ['brown', 'gray', 'guild']]))
-        if 'Builders' in played_cards_names:
-            vp.append(sum([player.wonder.current_stage for player in players]))
-        return vp
+    """Set the victory_points of every player, by category, and return the total of each player by name.
 
-    all_victory_points = dict()
-    print("\n** Victory Points **")
-    # We do it in two loops to use copy_guild_cards, not very elegant, but works fine.
-    for p in players:
-        adjacent_players = [players[i] for i in p.adjacent_players_i]
-        p.victory_points['Guilds']: sum(calc_guilds_vp(p, adjacent_players))
+    scoring.score_positions scores the same way, for batches of games held in arrays.
+    """
+    def effects_vp(player, kind):
+        return sum(sw.effect_value(effect, player, players) for effect in player.end_effects if effect.kind == kind)
 
+    all_victory_points = dict()
     for p in players:
         adjacent_players = [players[i] for i in p.adjacent_players_i]
         p.victory_points = {
@@ -130,51 +171,65 @@ def calculate_victory_points(players):
             'Treasury': p.resources['$'] // 3,
             'Wonder': p.resources['W'],
             'Blue cards': p.resources['V'],
-            'Commerce': calc_commerce_vp(p),
-            'Science': calc_science_vp(p),
+            'Commerce': effects_vp(p, 'commerce'),
+            'Science': science_points([p.resources[symbol] for symbol in SCIENCE_SYMBOLS], science_wildcards(p)),
+            'Guilds': effects_vp(p, 'guild'),
         }
         if p.wonder.specials['copy_guild_card']:
-            highest_vp_guilds = []
-            for adj_p in adjacent_players:
-                adj_adj_p = [players[i] for i in adj_p.adjacent_players_i]
-                highest_vp_guilds += [vp for vp in calc_guilds_vp(adj_p, adj_adj_p)]
-            p.victory_points['Copied Guild: '] = sorted(highest_vp_guilds)[-1] if highest_vp_guilds else 0
+            # The copied guild is scored as if p had built it
+            p.victory_points['Copied Guild: '] = max(
+                [sw.effect_value(effect, p, players) for adj_p in adjacent_players for effect in adj_p.end_effects
+                 if effect.kind == 'guild'] or [0])
         p.victory_points['Total'] = sum(p.victory_points.values())
-        formatted_points = ["\n{:>15}: {}".format(k, v) for k, v in p.victory_points.items()]
-        print("\nPlayer %s:%s" % (p.name, ''.join(formatted_points)))
         all_victory_points[p.name] = p.victory_points['Total']
+    return all_victory_points
 
-    print("\n**Ranking**",
-          ''.join(["\n\tPlayer {}: {}".format(k, v) for k, v
-                   in sorted(all_victory_points.items(), key=lambda item: item[1], reverse=True)]))
 
+def standing(player):
+    """Return the key ranking a player at the end of the game: its total points, ties broken by coins."""
+    return player.victory_points['Total'], player.resources['$']
 
-def resolve_fight(fighter_one, fighter_two, age):
-    print("%s vs %s:" % (fighter_one.name, fighter_two.name), end=' ')
+
+def winner(players):
+    """Return the index of the winner of a scored game, ties broken by coins as in the rules."""
+    return max(range(len(players)), key=lambda i: standing(players[i]))
+
+
+def science_points(symbols, wildcards=0):
+    """Return the points of the counts of the three science symbols, each wildcard being the best symbol."""
+    if wildcards:
+        return max(science_points(symbols[:i] + [symbols[i] + 1] + symbols[i + 1:], wildcards - 1) for i in range(3))
+    return sum(n ** 2 for n in symbols) + 7 * min(symbols)
+
+
+def science_wildcards(player):
+    """Return the number of science symbols of a player's choice: Scientists Guild and split science stages."""
+    return (sum(effect.amount for effect in player.end_effects if effect.kind == 'science') +
+            sum(1 for options in player.split_resources if set(options) <= set(SCIENCE_SYMBOLS)))
+
+
+def resolve_fight(fighter_one, fighter_two, age, log=events.NULL_SINK):
+    winner = None
     if fighter_one.resources['X'] > fighter_two.resources['X']:
-        # The formula gives 1, 3 and 5 victory points for age 1, 2, 3
-        fighter_one.military_tokens.append(1 + age * 2)
-        fighter_two.military_tokens.append(-1)
-        print(fighter_one.name + " wins")
+        winner, loser = fighter_one, fighter_two
     elif fighter_one.resources['X'] < fighter_two.resources['X']:
-        fighter_one.military_tokens.append(1 + age * 2)
-        fighter_two.military_tokens.append(-1)
-        print(fighter_two.name + " wins")
-    else:
-        print('draw!')
+        winner, loser = fighter_two, fighter_one
+    if winner:
+        # The formula gives 1, 3 and 5 victory points for age 1, 2, 3
+        winner.military_tokens.append(1 + age * 2)
+        loser.military_tokens.append(-1)
+    if log.enabled:
+        log.fight(age + 1, fighter_one, fighter_two, winner)
     return fighter_one.military_tokens, fighter_two.military_tokens
 
 
 def load_cards(card_file='cards.tsv'):
-    """Create a list of card object from a tsv file with card descriptions."""
-    with open(os.path.join('data', card_file)) as card_file:
-        card_reader = csv.reader(card_file, delimiter='\t')
-        next(card_reader, None)
-        return [sw.Card(line) for line in card_reader]
+    """Return the list of cards of a tsv file with card descriptions, indexed by card_id."""
+    return catalogue.load(card_file=card_file).cards
 
 
-def populate_decks(card_list, no_of_players):
-    """Returns a list of three shuffled decks"""
+def populate_decks(card_list, no_of_players, rng=random):
+    """Returns a list of three shuffled decks. Catalogue.decks is faster for the cards of a catalogue."""
     decks = [[] for _ in range(3)]
     guild_cards = []
     for age in range(1, 4):
@@ -184,42 +239,21 @@ def populate_decks(card_list, no_of_players):
                     # it's a guild card
                     guild_cards.append(card)
                     continue
-                number_of_cards = card.cards_per_players[no_of_players - 1]
+                # The counts start from 3 players
+                number_of_cards = card.cards_per_players[no_of_players - 3]
                 for _ in range(0, number_of_cards):
                     decks[age - 1].append(card)
     # Add guild cards to age 3 deck
-    random.shuffle(guild_cards)
-    # According to Tofino
-    decks[2] += guild_cards[0:no_of_players + 3]
+    rng.shuffle(guild_cards)
+    decks[2] += guild_cards[0:no_of_players + 2]
     for deck in decks:
-        random.shuffle(deck)
+        rng.shuffle(deck)
     return decks
 
 
-def load_wonders(wonders_file):
-    """Load list of wonders from a tsv file."""
-    with open(os.path.join('data', wonders_file)) as w_file:
-        wonder_reader = csv.reader(w_file, delimiter='\t')
-        next(wonder_reader)
-        wonders = {}
-        for line in wonder_reader:
-            if not line:
-                continue
-            try:
-                name, cost, resources, stage, side = line
-            except ValueError:
-                raise ValueError('invalid line: ' + str(line))
-            cost = sw.Resource(cost)
-            name = name + '_' + side
-            if resources.startswith('>'):
-                resources = resources[1:]
-            elif '/' not in resources:
-                resources = sw.Resource(resources)
-            if name not in wonders:
-                wonders[name] = sw.Wonder(name, side, resources)
-            else:
-                wonders[name].stages.append((cost, resources))
-    return [wonders[wonder] for wonder in wonders.keys()]
+def load_wonders(wonders_file='wonders.tsv'):
+    """Return the list of wonders of a tsv file, one per side. play uses copies, so the list can be reused."""
+    return catalogue.load(wonder_file=wonders_file).wonders
 
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+"""Scoring of batches of final positions held in arrays.
+
+A Positions holds what the score of a player depends on at the end of a game, for N games of the same number of
+players. score_positions scores them all at once, by the categories of events.SCORE_CATEGORIES and with the same
+rules as run.calculate_victory_points, or with the scoring parameters of a rule variant. Positions come from the
+lockstep engine (LockstepGames.positions) or from finished games of run.play (from_players), and can be saved with
+numpy.savez to be scored again later. NumPy is needed by this module.
+"""
+import collections
+import itertools
+
+import numpy as np
+
+from seven_wonders import events
+from seven_wonders.arrays import COINS, COPY_GUILD, DEFEAT, SCIENCE, SYMBOLS, THINGS, WONDER, tables
+
+# wonders: (N, players) wonder_id of each seat
+# stages: (N, players) wonder stages built
+# resources: (N, players, 14) final resources, in the slots of definitions.Resource
+# played: (N, players, cards) number of copies of each card_id played
+# military: (N, players) sum of the military tokens, defeats included
+# defeats: (N, players) number of defeat tokens
+Positions = collections.namedtuple('Positions', ['wonders', 'stages', 'resources', 'played', 'military', 'defeats'])
+# Scoring parameters that rule variants change: coins per Treasury point, points of a set of the three science
+# symbols and points of a defeat token
+Rules = collections.namedtuple('Rules', ['coins_per_point', 'science_set', 'defeat'])
+RULES = Rules(coins_per_point=3, science_set=7, defeat=-1)
+
+
+def score_positions(catalogue, positions, rules=RULES):
+    """Return the victory points of the players as an (N, players, categories) array of int32.
+
+    The categories are events.SCORE_CATEGORIES, the last one being the total.
+    """
+    t = tables(catalogue)
+    wonders, stages, resources, played, military, defeats = (np.asarray(values) for values in positions)
+    # What the effects count, with the same layout as LockstepGames.counts: (N, players, things)
+    counts = np.einsum('npc,ct->npt', played, np.eye(len(THINGS), dtype=np.int32)[t.type_id])
+    counts[..., WONDER] += stages
+    counts[..., DEFEAT] += defeats
+    # (N, players, whose, things), the neighbours of a seat being the seats next to it, around the table
+    counted = np.stack([counts, np.roll(counts, 1, axis=1) + np.roll(counts, -1, axis=1),
+                        np.broadcast_to(counts.sum(axis=1, keepdims=True), counts.shape)], axis=2)
+    # Points each card would give to each player
+    card_points = {kind: np.einsum('cwt,npwt->npc', t.effects[kind], counted) for kind in ('commerce', 'guild')}
+    # Stages 1 and up are the built ones, stage 0 is what the wonder gives from the start
+    built = (np.arange(t.stage_special.shape[1]) <= stages[..., None]) & (np.arange(t.stage_special.shape[1]) > 0)
+    wildcards = (played @ t.science) + (built & t.split_science[t.stage_split[wonders]]).sum(axis=2)
+    copies_guild = (built & (t.stage_special[wonders] == COPY_GUILD)).any(axis=2)
+    neighbours_played = (np.roll(played, 1, axis=1) > 0) | (np.roll(played, -1, axis=1) > 0)
+    points = {
+        'Military': military + (rules.defeat + 1) * defeats,
+        'Treasury': resources[..., COINS] // rules.coins_per_point,
+        'Wonder': resources[..., SYMBOLS.index('W')],
+        'Blue cards': resources[..., SYMBOLS.index('V')],
+        'Commerce': (card_points['commerce'] * played).sum(axis=2),
+        'Science': science_points(resources[..., SCIENCE], wildcards, rules.science_set),
+        'Guilds': (card_points['guild'] * played).sum(axis=2),
+        # The copied guild is scored as if the player had built it
+        'Copied Guild: ': np.where(copies_guild, np.where(neighbours_played, card_points['guild'], 0).max(axis=2), 0),
+    }
+    scores = np.zeros(played.shape[:2] + (len(events.SCORE_CATEGORIES),), dtype=np.int32)
+    for i, category in enumerate(events.SCORE_CATEGORIES[:-1]):
+        scores[..., i] = points[category]
+    scores[..., -1] = scores[..., :-1].sum(axis=2)
+    return scores
+
+
+def science_points(symbols, wildcards=0, science_set=7):
+    """Return the points of (..., 3) counts of science symbols, each wildcard being the symbol worth the most.
+
+    Every way to spread the wildcards over the three symbols is scored, and the best one kept.
+    """
+    symbols = np.asarray(symbols)
+    wildcards = np.broadcast_to(wildcards, symbols.shape[:-1])
+    most = int(wildcards.max(initial=0))
+    spreads = np.array([spread for spread in itertools.product(range(most + 1), repeat=3) if sum(spread) <= most])
+    totals = symbols[..., None, :] + spreads
+    points = (totals ** 2).sum(axis=-1) + science_set * totals.min(axis=-1)
+    return np.where(spreads.sum(axis=1) == wildcards[..., None], points, -1).max(axis=-1)
+
+
+def from_players(catalogue, games):
+    """Return the Positions of finished games of run.play, given as lists of players of the same length."""
+    shape = (len(games), len(games[0]) if games else 0)
+    positions = Positions(np.zeros(shape, dtype=np.int32), np.zeros(shape, dtype=np.int32),
+                          np.zeros(shape + (len(SYMBOLS),), dtype=np.int32),
+                          np.zeros(shape + (len(catalogue.cards),), dtype=np.int32),
+                          np.zeros(shape, dtype=np.int32), np.zeros(shape, dtype=np.int32))
+    for game_i, players in enumerate(games):
+        for seat, p in enumerate(players):
+            positions.wonders[game_i, seat] = p.wonder.wonder_id
+            positions.stages[game_i, seat] = p.wonder.current_stage
+            positions.resources[game_i, seat] = p.resources.values
+            for card in p.played_cards:
+                if card.type != 'wonder':
+                    positions.played[game_i, seat, card.card_id] += 1
+            positions.military[game_i, seat] = sum(p.military_tokens)
+            positions.defeats[game_i, seat] = p.military_tokens.count(-1)
+    return positions
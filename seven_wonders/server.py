@@ -0,0 +1,406 @@
+"""Asyncio host of tables for remote and human agents.
+
+A Table plays a game between async agents, one per seat: every agent has an awaitable choose(view, playable_cards)
+returning a move as agents.Agent.choose does. The hands of a turn are decided concurrently from the state at the
+start of the turn, as at a real table, then played in seat order. Free turns given by wonder specials are decided
+afterwards, one at a time. A move that takes more than the timeout, is invalid or comes from a disconnected agent
+is played by the fallback agent instead, so one slow player never holds a table for more than the timeout.
+
+TableServer seats the agents connecting over TCP at tables, fills the other seats with bots and plays all the
+tables concurrently in one process. Messages are JSON objects, one per line:
+
+    client -> server   {"name": "..."} once connected
+    server -> client   {"type": "decide", "id": n, "seat": ..., "age": ..., "cards": [names], "playable":
+                        {card index: [coins to the left, coins to the right]}, "players": [...]}
+    client -> server   {"id": n, "action": "play" | "wonder" | "coin", "card": card index}
+    server -> client   {"type": "game_over", "seat": ..., "players": [{"name", "wonder", "points"}, ...]}
+
+"cards" ends with the wonder when a stage can still be built; like agents.Agent.choose, "card" is then the card
+buried under the wonder for "wonder", and the card discarded for "coin". Replies to an expired request are ignored:
+the next message tells the client that the request expired.
+
+    python -m seven_wonders.server serve --port 7777 --players 4 --remote-seats 1
+    python -m seven_wonders.server join --port 7777 --name Ada
+
+Games played this way are not the same as run.play games, whose players decide one after another.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import random
+import sys
+import threading
+
+from seven_wonders import agents
+from seven_wonders import catalogue
+from seven_wonders import definitions as sw
+from seven_wonders import events
+from seven_wonders import run
+
+DEFAULT_TIMEOUT = 30.0
+logger = logging.getLogger(__name__)
+
+
+class LocalAgent:
+    """Async wrapper of an agents.Agent, which decides in the event loop."""
+    def __init__(self, agent):
+        self.agent = agent
+        self.name = type(agent).__name__
+
+    async def choose(self, view, playable_cards):
+        return self.agent.choose(view, playable_cards)
+
+    async def game_over(self, message):
+        pass
+
+
+class SocketAgent:
+    """Agent on the other end of a stream, speaking the protocol of the module docstring."""
+    def __init__(self, reader, writer, name):
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        self.connected = True
+        self._request = 0
+
+    async def send(self, message):
+        if not self.connected:
+            raise ConnectionError('%s is disconnected' % self.name)
+        try:
+            self.writer.write(json.dumps(message).encode() + b'\n')
+            await self.writer.drain()
+        except OSError:
+            self.connected = False
+            raise ConnectionError('%s is disconnected' % self.name)
+
+    async def choose(self, view, playable_cards):
+        self._request += 1
+        await self.send(decide_message(self._request, view, playable_cards))
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                self.connected = False
+                raise ConnectionError('%s is disconnected' % self.name)
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                raise ValueError('invalid message from %s: %r' % (self.name, line))
+            # Late replies to requests that timed out are dropped
+            if isinstance(reply, dict) and reply.get('id') == self._request:
+                return parse_move(reply, view, playable_cards)
+
+    async def game_over(self, message):
+        try:
+            await self.send(message)
+            self.writer.close()
+        except ConnectionError:
+            pass
+
+
+def decide_message(request_id, view, playable_cards):
+    n = len(view.players)
+    left, right = (view.player_i - 1) % n, (view.player_i + 1) % n
+    return {
+        'type': 'decide',
+        'id': request_id,
+        'seat': view.player_i,
+        'age': view.age,
+        'cards': [card.name for card in view.cards],
+        'playable': {str(card_i): [cost.get(left, 0), cost.get(right, 0)] if cost else [0, 0]
+                     for card_i, cost in playable_cards.items()},
+        'players': [dict(player._asdict(), played_cards=sorted(player.played_cards)) for player in view.players],
+    }
+
+
+def parse_move(reply, view, playable_cards):
+    """Return the move of a reply to a decide message, or raise ValueError if it is not a legal one."""
+    action, card_i = reply.get('action'), reply.get('card')
+    hand_size = agents.hand_size(view)
+    if not isinstance(card_i, int) or not 0 <= card_i < hand_size:
+        raise ValueError('invalid card: %r' % (card_i,))
+    if action == 'play' and card_i in playable_cards:
+        return 'play', card_i, playable_cards[card_i]
+    if action == 'wonder' and hand_size < len(view.cards) and hand_size in playable_cards:
+        return 'wonder', card_i, playable_cards[hand_size]
+    if action == 'coin':
+        return 'coin', card_i, None
+    raise ValueError('illegal move: %r' % (reply,))
+
+
+class Table:
+    """A game between async agents, see the module docstring.
+
+    fallback is the agents.Agent playing the moves that the agent of a seat did not give in time or correctly;
+    fallbacks counts them by seat.
+    """
+    def __init__(self, seat_agents, cards_and_wonders, rng, timeout=DEFAULT_TIMEOUT, fallback=None, log=None):
+        self.seat_agents = seat_agents
+        self.cards_and_wonders = cards_and_wonders
+        self.rng = rng
+        self.timeout = timeout
+        self.fallback = fallback or agents.HeuristicAgent()
+        self.log = log or events.NULL_SINK
+        self.fallbacks = collections.Counter()
+        self.players = [sw.Player(agent.name, self.fallback) for agent in seat_agents]
+
+    async def play(self):
+        """Play the game, tell the agents how it ended and return the total victory points of each seat.
+
+        Totals are listed by seat, as in the game_over message: several seats can have the same name.
+        """
+        players, log = self.players, self.log
+        run.seat_players(players, self.cards_and_wonders.wonders, self.rng, log)
+        if log.enabled:
+            log.game_start(players)
+        for age, hand in enumerate(self.cards_and_wonders.decks(len(players), self.rng)):
+            for p in players:
+                p.age = age + 1
+            if log.enabled:
+                log.age_start(age + 1)
+            player_decks = run.deal(hand, len(players), self.rng)
+            deck_index = 0
+            turn = 0
+            while len(player_decks[0]) > 1:
+                if log.enabled:
+                    log.turn_start(turn)
+                hands = [player_decks[(deck_index + p_i) % len(players)] for p_i in range(len(players))]
+                turns = [p.playable_moves(players, hands[p_i]) for p_i, p in enumerate(players)]
+                moves = await asyncio.gather(*(self._choose(p, *p.decision(turns[p_i][1], turns[p_i][0], players))
+                                               for p_i, p in enumerate(players)))
+                for p_i, p in enumerate(players):
+                    p.apply_move(players, hands[p_i], turns[p_i][0], moves[p_i])
+                    await self._special_turns(p, hands[p_i])
+                # shift the decks to the right if it's age 2
+                deck_index += 1 if age == 1 else -1
+                turn += 1
+            run.resolve_fights(players, age, log)
+        run.calculate_victory_points(players)
+        if log.enabled:
+            log.game_end(players)
+        results = [{'name': p.name, 'wonder': p.wonder.name, 'points': p.victory_points} for p in players]
+        await asyncio.gather(*(agent.game_over({'type': 'game_over', 'seat': seat, 'players': results})
+                               for seat, agent in enumerate(self.seat_agents)))
+        return [p.victory_points['Total'] for p in players]
+
+    async def _special_turns(self, player, hand):
+        # As Player.play_a_turn, free turns can give more free turns
+        for special_hand in player.special_turns(hand):
+            cards, playable_cards = player.playable_moves(self.players, special_hand, free=True)
+            move = await self._choose(player, *player.decision(playable_cards, cards, self.players))
+            player.apply_move(self.players, special_hand, cards, move, free=True)
+            await self._special_turns(player, special_hand)
+
+    async def _choose(self, player, view, playable_cards):
+        agent = self.seat_agents[player.player_i]
+        try:
+            return await asyncio.wait_for(agent.choose(view, playable_cards), self.timeout)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            self.fallbacks[player.player_i] += 1
+            return self.fallback.choose(view, playable_cards)
+
+
+class TableServer:
+    """Seat the agents connecting over TCP at tables of no_of_players, remote_seats of them per table.
+
+    The other seats are played by bot, a name of agents.AGENTS. Table t only depends on run.game_rng(seed, t) and
+    on the moves of its agents if seed is given.
+    """
+    def __init__(self, no_of_players=4, remote_seats=1, bot='heuristic', timeout=DEFAULT_TIMEOUT, seed=None,
+                 card_file='cards.tsv', wonder_file='wonders.tsv'):
+        if not 1 <= remote_seats <= no_of_players:
+            raise ValueError('remote_seats must be between 1 and no_of_players')
+        self.no_of_players = no_of_players
+        self.remote_seats = remote_seats
+        self.bot = bot
+        self.timeout = timeout
+        self.seed = seed
+        self.cards_and_wonders = catalogue.load(card_file, wonder_file)
+        self.lobby = []
+        self.tables = 0
+        self._games = set()
+
+    async def handle(self, reader, writer):
+        """Greet a new connection and seat it at the next table."""
+        try:
+            hello = json.loads(await reader.readline())
+            name = str(hello['name'])
+        except (ValueError, TypeError, KeyError):
+            writer.close()
+            return
+        self.lobby.append(SocketAgent(reader, writer, name))
+        # Players who left while waiting don't get a seat
+        self.lobby = [agent for agent in self.lobby if not agent.reader.at_eof()]
+        if len(self.lobby) >= self.remote_seats:
+            seat_agents = self.lobby[:self.remote_seats]
+            del self.lobby[:self.remote_seats]
+            seat_agents += [LocalAgent(agents.AGENTS[self.bot]()) for _ in range(self.no_of_players -
+                                                                                  self.remote_seats)]
+            game = asyncio.ensure_future(self.play_table(seat_agents))
+            self._games.add(game)
+            game.add_done_callback(self._table_done)
+
+    def _table_done(self, game):
+        self._games.discard(game)
+        # Nothing awaits the tables, so their errors would be lost
+        if not game.cancelled() and game.exception() is not None:
+            logger.error('A table stopped with an error', exc_info=game.exception())
+
+    async def play_table(self, seat_agents):
+        table_i = self.tables
+        self.tables += 1
+        rng = run.game_rng(self.seed, table_i) if self.seed is not None else random.Random()
+        # Seats are drawn at random, so that remote players don't always play first
+        rng.shuffle(seat_agents)
+        return await Table(seat_agents, self.cards_and_wonders, rng, self.timeout).play()
+
+    async def serve(self, host='127.0.0.1', port=7777):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+async def join(host, port, name, choose_move):
+    """Play games at a TableServer, answering every decide message with await choose_move(message).
+
+    The server sends nothing else while a request is pending, so a decision still running when the next message
+    arrives has expired: it is cancelled.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(json.dumps({'name': name}).encode() + b'\n')
+    next_line = asyncio.ensure_future(reader.readline())
+    while True:
+        line = await next_line
+        if not line:
+            break
+        next_line = asyncio.ensure_future(reader.readline())
+        message = json.loads(line)
+        if message['type'] == 'decide':
+            decision = asyncio.ensure_future(choose_move(message))
+            await asyncio.wait([decision, next_line], return_when=asyncio.FIRST_COMPLETED)
+            if not decision.done():
+                decision.cancel()
+                continue
+            reply = decision.result()
+            try:
+                writer.write(json.dumps(dict(reply, id=message['id'])).encode() + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                # The game ended while we were deciding
+                break
+        elif message['type'] == 'game_over':
+            for seat, player in enumerate(message['players']):
+                print('%s%s (%s): %s points' % ('* ' if seat == message['seat'] else '  ', player['name'],
+                                                player['wonder'], player['points']['Total']))
+    writer.close()
+
+
+class TerminalInput:
+    """Lines typed in the terminal, read by a thread of their own so that a prompt can be given up.
+
+    input() in an executor can't be cancelled: after a timeout it would keep waiting, and its line would answer the
+    next prompt. Here the lines go to a queue instead, and the lines typed before a prompt can be discarded.
+    """
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.lines = asyncio.Queue()
+        self.closed = False
+        self._thread = None
+
+    def feed(self, line):
+        """Queue a line read from the terminal, '' at the end of the input."""
+        if line:
+            self.lines.put_nowait(line)
+        else:
+            self.closed = True
+            self.lines.put_nowait(line)
+
+    def discard(self):
+        """Drop the lines typed so far."""
+        while not self.lines.empty():
+            if not self.lines.get_nowait():
+                self.lines.put_nowait('')
+                break
+
+    async def readline(self, prompt):
+        if self._thread is None and self.stream is not None:
+            loop = asyncio.get_running_loop()
+            # A daemon thread, so that a pending read doesn't keep the program alive
+            self._thread = threading.Thread(target=self._read, args=(loop,), daemon=True)
+            self._thread.start()
+        print(prompt, end='', flush=True)
+        line = await self.lines.get()
+        if not line:
+            self.lines.put_nowait(line)
+            raise EOFError
+        return line
+
+    def _read(self, loop):
+        while True:
+            line = self.stream.readline()
+            loop.call_soon_threadsafe(self.feed, line)
+            if not line:
+                return
+
+
+TERMINAL = TerminalInput(sys.stdin)
+
+
+async def ask_human(message, terminal=TERMINAL):
+    """Print a decision and read the move from the terminal, e.g. 'play 2', 'wonder 0' or 'coin 1'.
+
+    What was typed before the decision is ignored, as it answered an expired one.
+    """
+    terminal.discard()
+    me = message['players'][message['seat']]
+    print('\nAge %s, %s coins, resources %s' % (message['age'], me['resources']['$'],
+                                                {k: v for k, v in me['resources'].items() if v and k != '$'}))
+    for card_i, name in enumerate(message['cards']):
+        cost = message['playable'].get(str(card_i))
+        if cost is None:
+            status = ''
+        elif any(cost):
+            status = 'playable, paying %s coins to the left and %s to the right' % tuple(cost)
+        else:
+            status = 'playable'
+        print('%3d %-25s %s' % (card_i, name, status))
+    while True:
+        try:
+            answer = (await terminal.readline('move> ')).split()
+        except asyncio.CancelledError:
+            print('\nToo late, a move was played for you')
+            raise
+        if len(answer) == 2 and answer[0] in ('play', 'wonder', 'coin') and answer[1].isdigit():
+            return {'action': answer[0], 'card': int(answer[1])}
+        print("Type an action and a card index: 'play 2', 'wonder 0' or 'coin 1'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Host tables for remote agents, or join one as a human.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=7777)
+    serve.add_argument('-p', '--players', type=int, default=4, choices=range(3, 8))
+    serve.add_argument('--remote-seats', type=int, default=1, help='seats per table for connecting agents')
+    serve.add_argument('--bot', default='heuristic', choices=sorted(agents.AGENTS), help='agent of the other seats')
+    serve.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='seconds to decide a move')
+    serve.add_argument('-s', '--seed', type=int, default=None)
+    human = commands.add_parser('join')
+    human.add_argument('--host', default='127.0.0.1')
+    human.add_argument('--port', type=int, default=7777)
+    human.add_argument('--name', default='human')
+    args = parser.parse_args()
+    if args.command == 'serve':
+        if not 1 <= args.remote_seats <= args.players:
+            parser.error('--remote-seats must be between 1 and --players')
+        logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+        server = TableServer(args.players, args.remote_seats, args.bot, args.timeout, args.seed)
+        asyncio.run(server.serve(args.host, args.port))
+    else:
+        asyncio.run(join(args.host, args.port, args.name, ask_human))
+
+
+if __name__ == '__main__':
+    main()
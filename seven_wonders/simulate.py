@@ -0,0 +1,261 @@
+"""Run many silent games across a process pool and aggregate their results."""
+import argparse
+import collections
+import importlib.util
+import json
+import multiprocessing
+
+from seven_wonders import agents
+from seven_wonders import catalogue
+from seven_wonders import definitions as sw
+from seven_wonders import events
+from seven_wonders import profiling
+from seven_wonders import run
+
+SCORE_CATEGORIES = events.SCORE_CATEGORIES
+
+# Compact per-game result: one entry per seat for agents, wonders, sides and scores (ordered as SCORE_CATEGORIES).
+GameResult = collections.namedtuple('GameResult', ['game_i', 'agents', 'wonders', 'sides', 'scores', 'winner'])
+
+# Card and wonder catalogue loaded once per worker process
+_catalogue = None
+
+
+def _init_worker(card_file, wonder_file):
+    global _catalogue
+    _catalogue = catalogue.load(card_file, wonder_file)
+
+
+def play_one(no_of_players, seed, game_i, verbose=False, agent_names=None, log=None, profiler=None):
+    """Play game game_i of the batch started from seed and return its GameResult.
+
+    agent_names holds a name from agents.AGENTS per seat, all seats play randomly by default. The game only depends
+    on (seed, game_i) and the agents, so it can be replayed with verbose=True to see every move. The events of the
+    game go to log and its phases are timed by profiler, if given.
+    """
+    agent_names = agent_names or ('random',) * no_of_players
+    rng = run.game_rng(seed, game_i)
+    deck = _catalogue.decks(no_of_players, rng)
+    players = [sw.Player(str(player), agents.AGENTS[agent_names[player]]()) for player in range(no_of_players)]
+    run.play(players, deck, _catalogue.wonders, verbose, rng, log, profiler)
+    scores = tuple(tuple(p.victory_points.get(category, 0) for category in SCORE_CATEGORIES) for p in players)
+    return GameResult(game_i,
+                      tuple(agent_names),
+                      tuple(p.wonder.name.rsplit('_', 1)[0] for p in players),
+                      tuple(p.wonder.side for p in players),
+                      scores,
+                      run.winner(players))
+
+
+def _play_chunk(args):
+    """Return the GameResults of a chunk of games, and its Profiler if profile, else None."""
+    no_of_players, seed, game_indices, agent_names, events_dir, profile = args
+    profiler = profiling.Profiler() if profile else None
+    if not events_dir:
+        return [play_one(no_of_players, seed, game_i, agent_names=agent_names, profiler=profiler)
+                for game_i in game_indices], profiler
+    # One file per chunk, named after its range of games: a chunk played again has the same games and replaces
+    # its file, and never one of another chunk
+    with events.ColumnarSink(events_dir, 'events-%010d-%010d' % (game_indices[0], game_indices[-1]),
+                             first_game=game_indices[0]) as log:
+        return [play_one(no_of_players, seed, game_i, agent_names=agent_names, log=log, profiler=profiler)
+                for game_i in game_indices], profiler
+
+
+class SimulationStats:
+    """Aggregate statistics over a batch of GameResults."""
+    def __init__(self):
+        self.games = 0
+        self.wonder_games = collections.Counter()
+        self.wonder_wins = collections.Counter()
+        self.seat_wins = collections.Counter()
+        self.agent_games = collections.Counter()
+        self.agent_wins = collections.Counter()
+        self.score_totals = collections.Counter()
+        self.winning_score_total = 0
+
+    def add(self, result):
+        self.games += 1
+        for seat, (agent, wonder, side, scores) in enumerate(zip(result.agents, result.wonders, result.sides,
+                                                                result.scores)):
+            self.wonder_games[wonder, side] += 1
+            self.agent_games[agent] += 1
+            self.score_totals.update(dict(zip(SCORE_CATEGORIES, scores)))
+            if seat == result.winner:
+                self.wonder_wins[wonder, side] += 1
+                self.seat_wins[seat] += 1
+                self.agent_wins[agent] += 1
+                self.winning_score_total += scores[-1]
+
+    def merge(self, other):
+        self.games += other.games
+        self.wonder_games.update(other.wonder_games)
+        self.wonder_wins.update(other.wonder_wins)
+        self.seat_wins.update(other.seat_wins)
+        self.agent_games.update(other.agent_games)
+        self.agent_wins.update(other.agent_wins)
+        self.score_totals.update(other.score_totals)
+        self.winning_score_total += other.winning_score_total
+        return self
+
+    def win_rate(self, wonder, side):
+        games = self.wonder_games[wonder, side]
+        return self.wonder_wins[wonder, side] / games if games else 0.0
+
+    def mean_scores(self):
+        player_games = sum(self.wonder_games.values())
+        return {category: self.score_totals[category] / player_games if player_games else 0.0
+                for category in SCORE_CATEGORIES}
+
+    def report(self):
+        lines = ['Games: %s' % self.games]
+        if self.games:
+            lines.append('Mean winning score: %.2f' % (self.winning_score_total / self.games))
+        lines.append('\n** Win rate by wonder **')
+        for wonder, side in sorted(self.wonder_games):
+            lines.append('{:>15} {}: {:6.2%} ({} games)'.format(wonder, side, self.win_rate(wonder, side),
+                                                               self.wonder_games[wonder, side]))
+        lines.append('\n** Win rate by seat **')
+        for seat in sorted(self.seat_wins):
+            lines.append('{:>15}: {:6.2%}'.format(seat, self.seat_wins[seat] / self.games))
+        if len(self.agent_games) > 1:
+            lines.append('\n** Win rate by agent **')
+            for agent in sorted(self.agent_games):
+                games = self.agent_games[agent]
+                lines.append('{:>15}: {:6.2%} ({} seats)'.format(agent, self.agent_wins[agent] / games, games))
+        lines.append('\n** Mean score by category **')
+        for category, score in self.mean_scores().items():
+            lines.append('{:>15}: {:.2f}'.format(category.rstrip(': '), score))
+        return '\n'.join(lines)
+
+
+def simulate_results(n_games, no_of_players=4, seed=0, workers=None, chunksize=64, agent_names=None,
+                     events_dir=None, card_file='cards.tsv', wonder_file='wonders.tsv', profiler=None,
+                     game_indices=None):
+    """Yield a GameResult for each of n_games games, in no particular order.
+
+    Only the games of game_indices are played if given, n_games is then ignored.
+    If events_dir is given, the events of every game are written there as .npz chunks (see events.ColumnarSink).
+    If profiler is given, the games are profiled in the workers and their profilers merged into it.
+    """
+    game_indices = range(n_games) if game_indices is None else sorted(game_indices)
+    chunks = [(no_of_players, seed, chunk, agent_names, events_dir, profiler is not None)
+              for chunk in _chunks(game_indices, chunksize)]
+    if workers == 1:
+        _init_worker(card_file, wonder_file)
+        for results, chunk_profiler in map(_play_chunk, chunks):
+            if chunk_profiler:
+                profiler.merge(chunk_profiler)
+            yield from results
+        return
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(card_file, wonder_file)) as pool:
+        for results, chunk_profiler in pool.imap_unordered(_play_chunk, chunks):
+            if chunk_profiler:
+                profiler.merge(chunk_profiler)
+            yield from results
+
+
+def _chunks(game_indices, chunksize):
+    """Split sorted game indices into ranges of consecutive games, of chunksize games at most."""
+    start = 0
+    for end in range(1, len(game_indices) + 1):
+        if end == len(game_indices) or end - start == chunksize or game_indices[end] != game_indices[end - 1] + 1:
+            yield game_indices[start:end]
+            start = end
+
+
+def lockstep_results(n_games, no_of_players=4, seed=0, batch_size=1024, card_file='cards.tsv',
+                     wonder_file='wonders.tsv'):
+    """Yield a GameResult for each of n_games random games played in batches by the lockstep engine.
+
+    The results are statistically the same as those of simulate_results with random agents, but not game by game:
+    batch b only depends on lockstep.batch_rng(seed, b). Needs NumPy.
+    """
+    from seven_wonders import lockstep
+    cards_and_wonders = catalogue.load(card_file, wonder_file)
+    for start in range(0, n_games, batch_size):
+        batch = lockstep.play_batch(cards_and_wonders, min(batch_size, n_games - start), no_of_players,
+                                    lockstep.batch_rng(seed, start // batch_size))
+        for i, (wonder_ids, scores, winner) in enumerate(zip(batch.wonders.tolist(), batch.scores.tolist(),
+                                                             batch.winner.tolist())):
+            wonders = [cards_and_wonders.wonders[wonder_id] for wonder_id in wonder_ids]
+            yield GameResult(start + i,
+                             ('random',) * no_of_players,
+                             tuple(wonder.name.rsplit('_', 1)[0] for wonder in wonders),
+                             tuple(wonder.side for wonder in wonders),
+                             tuple(map(tuple, scores)),
+                             winner)
+
+
+def simulate(n_games, no_of_players=4, seed=0, workers=None, **kwargs):
+    """Play n_games silent games on a pool of workers and return their aggregated SimulationStats."""
+    stats = SimulationStats()
+    for result in simulate_results(n_games, no_of_players, seed, workers, **kwargs):
+        stats.add(result)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate many games of Seven Wonders without output.')
+    parser.add_argument('-n', '--games', type=int, default=1000)
+    parser.add_argument('-p', '--players', type=int, default=4, choices=range(3, 8))
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-w', '--workers', type=int, default=None, help='defaults to the number of CPUs')
+    parser.add_argument('--chunksize', type=int, default=64, help='games sent to a worker at a time')
+    parser.add_argument('-a', '--agents', default='random',
+                        help='comma separated agent of each seat, or a single one for every seat: %s' %
+                             ', '.join(agents.AGENTS))
+    parser.add_argument('--events', metavar='DIR', help='write the events of every game to .npz files in DIR')
+    parser.add_argument('--replay', type=int, metavar='GAME_I', help='print every move of one game of the batch')
+    parser.add_argument('--lockstep', action='store_true',
+                        help='play in a single process with the NumPy lockstep engine, random agents only')
+    parser.add_argument('--profile', metavar='JSON', help='time the phases of the games and write a report to JSON')
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help='play in a single process under a Python profiler and write its output to FILE')
+    parser.add_argument('--profiler-tool', choices=['cprofile', 'pyinstrument'], default='cprofile',
+                        help='profiler of --cprofile: pstats data or, with pyinstrument installed, an HTML page')
+    parser.add_argument('--store', metavar='SQLITE',
+                        help='only play the games missing from this results store, and store them')
+    args = parser.parse_args()
+    agent_names = args.agents.split(',')
+    if len(agent_names) == 1:
+        agent_names *= args.players
+    if len(agent_names) != args.players or not set(agent_names) <= set(agents.AGENTS):
+        parser.error('invalid agents: ' + args.agents)
+    if args.cprofile and args.profiler_tool == 'pyinstrument' and not importlib.util.find_spec('pyinstrument'):
+        parser.error('--profiler-tool pyinstrument needs pyinstrument to be installed')
+    if args.lockstep:
+        if set(agent_names) != {'random'} or args.events or args.replay is not None or args.profile or args.store:
+            parser.error('--lockstep only plays random agents, without --events, --replay, --profile or --store')
+        stats = SimulationStats()
+        for result in lockstep_results(args.games, args.players, args.seed):
+            stats.add(result)
+        print(stats.report())
+        return
+    if args.replay is not None:
+        _init_worker('cards.tsv', 'wonders.tsv')
+        play_one(args.players, args.seed, args.replay, verbose=True, agent_names=agent_names)
+        return
+    profiler = profiling.Profiler() if args.profile else None
+    workers = 1 if args.cprofile else args.workers
+
+    def run_batch():
+        if args.store:
+            from seven_wonders import store
+            with store.ResultStore(args.store) as results:
+                return store.simulate_stored(results, args.games, args.players, args.seed, workers,
+                                             agent_names=agent_names, chunksize=args.chunksize,
+                                             events_dir=args.events, profiler=profiler)
+        return simulate(args.games, args.players, args.seed, workers, chunksize=args.chunksize,
+                        agent_names=agent_names, events_dir=args.events, profiler=profiler)
+    stats = profiling.profile_call(run_batch, args.cprofile, args.profiler_tool) if args.cprofile else run_batch()
+    print(stats.report())
+    if profiler:
+        print('\n** Profile **')
+        print(profiler.format())
+        with open(args.profile, 'w') as report_file:
+            json.dump(profiler.report(), report_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
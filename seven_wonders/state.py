@@ -0,0 +1,438 @@
+"""Packed game state for search and rollouts.
+
+A GameState stores a game as integers: a flat array of per-player values (resources, wonder stage, military, wonder
+specials and trade discounts), bitmasks of the played card IDs and of the free chains of each player, the split
+resources of each player as SplitResources keys, and the hands and the discard pile as tuples of card IDs. Cards and
+wonders are only referenced by ID and read from the shared tables, never copied or modified, so clone() is a copy of a
+few small containers and apply()/undo() let a search explore moves without copying object graphs.
+
+legal_moves() gives the same moves as Player.can_play and Player.decision, and rollout() plays a game to its end from a
+state, as run.play does.
+"""
+import array
+import collections
+import random
+
+from seven_wonders import definitions as sw
+from seven_wonders import run
+
+# Layout of the values of a player, starting at player_i * PLAYER_SIZE
+RESOURCES = 0
+COINS = RESOURCES + sw.Resource.symbols.index('$')
+MILITARY_STRENGTH = RESOURCES + sw.Resource.symbols.index('X')
+WONDER_STAGE = RESOURCES + len(sw.Resource.symbols)
+MILITARY_POINTS = WONDER_STAGE + 1
+DEFEATS = MILITARY_POINTS + 1
+# One flag per wonder special, in the order of SPECIALS
+SPECIALS = ('play_discarded_card', 'trading_post', 'copy_guild_card', 'build_free_structure', 'play_seventh')
+PLAY_DISCARDED, TRADING_POST, COPY_GUILD, BUILD_FREE, PLAY_SEVENTH = range(DEFEATS + 1, DEFEATS + 1 + len(SPECIALS))
+# One flag per (side, goods) of Player.discounts: raw and manufactured goods bought from the left, then the right
+DISCOUNTS = DEFEATS + 1 + len(SPECIALS)
+DISCOUNT_GOODS = ('raw', 'manufactured')
+PLAYER_SIZE = DISCOUNTS + 2 * len(DISCOUNT_GOODS)
+
+# Slots that neighbours can buy, and the science symbols
+_GOODS = frozenset(sw.Resource._index[symbol] for symbol in sw.RAW_MATERIALS + sw.MANUFACTURED_GOODS)
+_SCIENCE = frozenset(sw.Resource._index[symbol] for symbol in run.SCIENCE_SYMBOLS)
+# Trade prices of a side, by (raw discount, manufactured discount)
+_PRICES = {(raw, manufactured): sw.trade_prices(raw, manufactured) for raw in (0, 1) for manufactured in (0, 1)}
+NO_COST = (0, 0)
+
+
+class GameState:
+    """Packed state of a game, see the module docstring.
+
+    cards is the list of Card objects indexed by card_id and wonders the Wonder of each seat, both only read.
+    A move is (action, card_id, gold_cost), where action is 'play', 'wonder' or 'coin' as returned by the agents
+    and gold_cost the coins paid to the (left, right) neighbours. A 'wonder' move buries card_id under the next
+    stage.
+    """
+    __slots__ = ('cards', 'wonders', 'age', 'values', 'played', 'free', 'split', 'tradeable_split', 'hands',
+                 'discarded', '_masks', '_history')
+
+    def __init__(self, cards, wonders, age=1):
+        self.cards = cards
+        self.wonders = tuple(wonders)
+        self.age = age
+        self.values = array.array('i', bytes(4 * PLAYER_SIZE * len(wonders)))
+        self.played = [0] * len(wonders)
+        # Card IDs whose name the player can build for free, from the chains of its played cards
+        self.free = [0] * len(wonders)
+        # SplitResources.key of all the split resources of each player, and of the ones its neighbours can buy
+        self.split = [()] * len(wonders)
+        self.tradeable_split = [()] * len(wonders)
+        self.hands = [()] * len(wonders)
+        self.discarded = ()
+        self._masks = _masks(cards)
+        self._history = []
+
+    @classmethod
+    def from_players(cls, players, cards, hands, age, discarded_cards=()):
+        """Pack the state of a game played with definitions.Player objects."""
+        state = cls(cards, [p.wonder for p in players], age)
+        for player_i, p in enumerate(players):
+            base = player_i * PLAYER_SIZE
+            state.values[base + RESOURCES:base + WONDER_STAGE] = array.array('i', p.resources.values)
+            state.values[base + WONDER_STAGE] = p.wonder.current_stage
+            state.values[base + MILITARY_POINTS] = sum(p.military_tokens)
+            state.values[base + DEFEATS] = p.military_tokens.count(-1)
+            for special_i, special in enumerate(SPECIALS):
+                state.values[base + PLAY_DISCARDED + special_i] = p.wonder.specials[special]
+            for side, goods in enumerate(p.discounts):
+                for goods_i, kind in enumerate(DISCOUNT_GOODS):
+                    state.values[base + DISCOUNTS + 2 * side + goods_i] = kind in goods
+            # Wonder stages have no card ID, they are counted in WONDER_STAGE
+            for card_id in p.played_ids:
+                state.played[player_i] |= 1 << card_id
+            for name in p.free_to_play:
+                state.free[player_i] |= state._masks.names.get(name, 0)
+            state.split[player_i] = p.split_resources_index.key
+            state.tradeable_split[player_i] = p.tradeable_split_resources.key
+        state.hands = [tuple(card.card_id for card in hand) for hand in hands]
+        state.discarded = tuple(card.card_id for card in discarded_cards)
+        return state
+
+    @property
+    def no_of_players(self):
+        return len(self.wonders)
+
+    def clone(self):
+        """Return an independent copy of the state, without the undo history."""
+        state = GameState.__new__(GameState)
+        state.cards = self.cards
+        state.wonders = self.wonders
+        state.age = self.age
+        state.values = array.array('i', self.values)
+        state.played = self.played[:]
+        state.free = self.free[:]
+        state.split = self.split[:]
+        state.tradeable_split = self.tradeable_split[:]
+        state.hands = self.hands[:]
+        state.discarded = self.discarded
+        state._masks = self._masks
+        state._history = []
+        return state
+
+    def key(self):
+        """Return a hashable summary of the state, e.g. for transposition tables."""
+        return (self.age, self.values.tobytes(), tuple(self.played), tuple(self.free), tuple(self.split),
+                tuple(self.tradeable_split), tuple(self.hands), self.discarded)
+
+    def get(self, player_i, field):
+        return self.values[player_i * PLAYER_SIZE + field]
+
+    def resources(self, player_i):
+        base = player_i * PLAYER_SIZE + RESOURCES
+        return sw.Resource.from_values(self.values[base:base + len(sw.Resource.symbols)].tolist())
+
+    def count_cards(self, player_i, card_type):
+        return (self.played[player_i] & self._masks.types.get(card_type, 0)).bit_count()
+
+    def neighbours(self, player_i):
+        return (player_i - 1) % self.no_of_players, (player_i + 1) % self.no_of_players
+
+    def hand(self, hand_i):
+        """Return the card IDs of the hand of seat hand_i, or of the discard pile for hand_i=-1."""
+        return self.discarded if hand_i == -1 else self.hands[hand_i]
+
+    def legal_moves(self, player_i, hand_i=None, free=False):
+        """Return the moves of player_i with the cards of hand_i (player_i by default, -1 for the discard pile).
+
+        The played cards and built stages are the playable cards of Player.decision, with the gold cost of
+        Player.can_play. If free, the cards (but not the wonder stage) cost nothing. Every card can also be
+        discarded for coins.
+        """
+        hand_i = player_i if hand_i is None else hand_i
+        hand = self.hand(hand_i)
+        base = player_i * PLAYER_SIZE
+        stage = self.values[base + WONDER_STAGE] + 1
+        has_stage = stage < len(self.wonders[player_i].stages)
+        moves = []
+        if self.values[base + BUILD_FREE]:
+            # Player.decision: the first cards of the turn, the wonder being the last one, are free to build
+            moves.extend(('play', card_id, NO_COST) for card_id in hand[:max(len(hand) + has_stage - 2, 0)])
+        else:
+            for card_id in hand:
+                card = self.cards[card_id]
+                if self.played[player_i] & self._masks.names[card.name]:
+                    continue
+                chained = self.free[player_i] >> card_id & 1
+                gold_cost = NO_COST if free else self._gold_cost(player_i, card.cost, chained)
+                if gold_cost is not None:
+                    moves.append(('play', card_id, gold_cost))
+            gold_cost = self._gold_cost(player_i, self.wonders[player_i].stages[stage][0]) if has_stage else None
+            if gold_cost is not None:
+                moves.extend(('wonder', card_id, gold_cost) for card_id in hand)
+        moves.extend(('coin', card_id, NO_COST) for card_id in hand)
+        return moves
+
+    def _gold_cost(self, player_i, cost, chained=False):
+        """Return the (left, right) coins to pay for cost, or None if player_i can't pay it, as Player.can_play."""
+        base = player_i * PLAYER_SIZE + RESOURCES
+        after = [self.values[base + slot] - value for slot, value in enumerate(cost.values)]
+        if chained or min(after) >= 0:
+            return NO_COST
+        coins = after[COINS - RESOURCES]
+        if coins < 0:
+            return None
+        leftovers = sw.split_leftovers(tuple(-value if value < 0 else 0 for value in after), self.split[player_i])
+        if not any(leftovers[0]):
+            return NO_COST
+        left_i, right_i = self.neighbours(player_i)
+        left_prices, right_prices = self.trade_prices(player_i)
+        best = None
+        for leftover in leftovers:
+            trade = sw.cheapest_trade(leftover, self.trade_supply(left_i), self.trade_supply(right_i), left_prices,
+                                      right_prices)
+            if trade is not None and (best is None or sum(trade) < sum(best)):
+                best = trade
+        if best is None or sum(best) > coins:
+            return None
+        return best
+
+    def trade_prices(self, player_i):
+        """Return the (left, right) prices of each Resource slot for player_i, as Player.trade_prices."""
+        base = player_i * PLAYER_SIZE + DISCOUNTS
+        return tuple(_PRICES[self.values[base + 2 * side], self.values[base + 2 * side + 1]] for side in (0, 1))
+
+    def trade_supply(self, player_i):
+        """Return what player_i can sell to its neighbours, as Player.trade_supply."""
+        base = player_i * PLAYER_SIZE + RESOURCES
+        return (tuple(self.values[base + slot] if slot in _GOODS else 0 for slot in range(len(sw.Resource.symbols))),
+                self.tradeable_split[player_i])
+
+    def apply(self, player_i, move, hand_i=None, free=False):
+        """Apply the move of a player, taking the card from the hand of hand_i (player_i by default).
+
+        If free, the card costs no coins, as for the play_seventh and play_discarded_card specials. Pass hand_i=-1
+        to take the card from the discard pile. A second copy of a card, only playable with build_free_structure,
+        gives its resources and coins but isn't counted twice by the effects.
+        """
+        action, card_id, gold_cost = move
+        hand_i = player_i if hand_i is None else hand_i
+        self._history.append((player_i, self.values, self.played[player_i], self.free[player_i],
+                              self.split[player_i], self.tradeable_split[player_i], self.hands[:], self.discarded))
+        self.values = array.array('i', self.values)
+        base = player_i * PLAYER_SIZE
+        # Player.decision uses up build_free_structure on the turn after the stage is built
+        self.values[base + BUILD_FREE] = 0
+        if hand_i == -1:
+            discarded = list(self.discarded)
+            discarded.remove(card_id)
+            self.discarded = tuple(discarded)
+        else:
+            hand = list(self.hands[hand_i])
+            hand.remove(card_id)
+            self.hands[hand_i] = tuple(hand)
+        if gold_cost:
+            for neighbour_i, coins in zip(self.neighbours(player_i), gold_cost):
+                self.values[base + COINS] -= coins
+                self.values[neighbour_i * PLAYER_SIZE + COINS] += coins
+        if action == 'coin':
+            self.values[base + COINS] += 3
+            self.discarded += (card_id,)
+        elif action == 'wonder':
+            # The card is buried under the wonder, which gives the resources or the special of its next stage
+            stage = self.values[base + WONDER_STAGE] + 1
+            cost, resources = self.wonders[player_i].stages[stage]
+            self.values[base + WONDER_STAGE] = stage
+            self.values[base + COINS] -= cost['$']
+            if not isinstance(resources, str):
+                self._add_resources(base, resources)
+            elif '/' in resources:
+                # Split resources of wonders can't be bought by the neighbours
+                self.split[player_i] = _add_split(self.split[player_i], _split_options(resources.split('/')))
+            else:
+                self.values[base + PLAY_DISCARDED + SPECIALS.index(resources)] = 1
+                if resources == 'trading_post':
+                    self._add_discount(base, sw.TRADING_POST)
+        else:
+            card = self.cards[card_id]
+            if not free:
+                self.values[base + COINS] -= card.cost['$']
+            self.played[player_i] |= 1 << card_id
+            self.free[player_i] |= self._masks.gives_free[card_id]
+            for effect in card.effects:
+                if effect.kind == 'coins':
+                    self.values[base + COINS] += self.effect_value(player_i, effect)
+                elif effect.kind == 'discount':
+                    self._add_discount(base, effect)
+            # Guild cards don't give any resource
+            if card.type != 'guild':
+                self._add_resources(base, card.resources)
+                if card.split_resources:
+                    options = _split_options(card.split_resources)
+                    self.split[player_i] = _add_split(self.split[player_i], options)
+                    if card.type in ('brown', 'gray'):
+                        self.tradeable_split[player_i] = _add_split(self.tradeable_split[player_i], options)
+
+    def undo(self):
+        """Revert the last applied move."""
+        player_i, values, played, free, split, tradeable_split, hands, discarded = self._history.pop()
+        self.values = values
+        self.played[player_i] = played
+        self.free[player_i] = free
+        self.split[player_i] = split
+        self.tradeable_split[player_i] = tradeable_split
+        self.hands = hands
+        self.discarded = discarded
+
+    def special_turns(self, player_i, hand_i):
+        """Yield the hand_i of the free turns given by the wonder specials after a move from hand_i, in order.
+
+        As Player.special_turns, play_discarded_card is used up even when the discard pile is empty. Each hand_i
+        is yielded once the turn of the previous one is played.
+        """
+        base = player_i * PLAYER_SIZE
+        if self.values[base + PLAY_DISCARDED]:
+            self.values[base + PLAY_DISCARDED] = 0
+            if self.discarded:
+                yield -1
+        if len(self.hand(hand_i)) == 1 and self.values[base + PLAY_SEVENTH]:
+            yield hand_i
+
+    def play_a_turn(self, player_i, policy, rng, hand_i=None, free=False):
+        """Play a move of player_i picked by policy, then the free turns of its wonder specials."""
+        hand_i = player_i if hand_i is None else hand_i
+        self.apply(player_i, policy(self, player_i, self.legal_moves(player_i, hand_i, free), rng), hand_i, free)
+        for special_hand_i in self.special_turns(player_i, hand_i):
+            self.play_a_turn(player_i, policy, rng, special_hand_i, free=True)
+
+    def pass_hands(self):
+        """Pass every hand on as run.play does: from seat i to seat i + 1 in ages 1 and 3, to seat i - 1 in age 2."""
+        shift = 1 if self.age == 2 else -1
+        self.hands = [self.hands[(i + shift) % self.no_of_players] for i in range(self.no_of_players)]
+
+    def deal(self, deck, rng):
+        """Shuffle the card IDs of the deck of an age with rng and give a hand to every seat, as run.deal."""
+        deck = list(deck)
+        rng.shuffle(deck)
+        cards_per_hand = len(deck) // self.no_of_players
+        self.hands = [tuple(deck[cards_per_hand * i:cards_per_hand * (i + 1)]) for i in range(self.no_of_players)]
+
+    def resolve_fights(self):
+        """Give the military tokens of the end of the current age."""
+        for player_i in range(self.no_of_players):
+            right_i = self.neighbours(player_i)[1]
+            strength = self.get(player_i, MILITARY_STRENGTH), self.get(right_i, MILITARY_STRENGTH)
+            if strength[0] != strength[1]:
+                winner, loser = (player_i, right_i) if strength[0] > strength[1] else (right_i, player_i)
+                self.values[winner * PLAYER_SIZE + MILITARY_POINTS] += 1 + (self.age - 1) * 2
+                self.values[loser * PLAYER_SIZE + MILITARY_POINTS] -= 1
+                self.values[loser * PLAYER_SIZE + DEFEATS] += 1
+
+    def _add_resources(self, base, resources):
+        for slot, value in enumerate(resources.values):
+            if value:
+                self.values[base + RESOURCES + slot] += value
+
+    def _add_discount(self, base, effect):
+        sides = (0, 1) if effect.whose == 'neighbours' else (0,) if effect.whose == 'left' else (1,)
+        for side in sides:
+            for kind in effect.counts:
+                self.values[base + DISCOUNTS + 2 * side + DISCOUNT_GOODS.index(kind)] = 1
+
+    def effect_value(self, player_i, effect):
+        """Return the coins or victory points given to player_i by a coins, commerce or guild effect."""
+        if effect.whose == 'self':
+            counted = (player_i,)
+        elif effect.whose == 'neighbours':
+            counted = self.neighbours(player_i)
+        elif effect.whose == 'self_and_neighbours':
+            counted = (player_i,) + self.neighbours(player_i)
+        else:
+            counted = range(self.no_of_players)
+        total = 0
+        for i in counted:
+            for thing in effect.counts:
+                if thing == 'wonder':
+                    total += self.get(i, WONDER_STAGE)
+                elif thing == 'defeat':
+                    total += self.get(i, DEFEATS)
+                else:
+                    total += self.count_cards(i, thing)
+        return effect.amount * total
+
+    def end_effects(self, player_i, kind):
+        """Yield the effects of kind scored at the end of the game of the cards played by player_i."""
+        played = self.played[player_i]
+        while played:
+            card_id = played.bit_length() - 1
+            played ^= 1 << card_id
+            for effect in self.cards[card_id].effects:
+                if effect.kind == kind:
+                    yield effect
+
+    def victory_points(self, player_i):
+        """Return the victory points of player_i by category, as run.calculate_victory_points."""
+        base = player_i * PLAYER_SIZE
+        wildcards = (sum(effect.amount for effect in self.end_effects(player_i, 'science')) +
+                     sum(count for options, count in self.split[player_i] if set(options) <= _SCIENCE))
+        points = {
+            'Military': self.values[base + MILITARY_POINTS],
+            'Treasury': self.values[base + COINS] // 3,
+            'Wonder': self.values[base + RESOURCES + sw.Resource._index['W']],
+            'Blue cards': self.values[base + RESOURCES + sw.Resource._index['V']],
+            'Commerce': sum(self.effect_value(player_i, effect) for effect in self.end_effects(player_i, 'commerce')),
+            'Science': run.science_points([self.values[base + RESOURCES + slot] for slot in sorted(_SCIENCE)],
+                                          wildcards),
+            'Guilds': sum(self.effect_value(player_i, effect) for effect in self.end_effects(player_i, 'guild')),
+        }
+        if self.values[base + COPY_GUILD]:
+            # The copied guild is scored as if player_i had built it
+            points['Copied Guild: '] = max([self.effect_value(player_i, effect) for i in self.neighbours(player_i)
+                                            for effect in self.end_effects(i, 'guild')] or [0])
+        points['Total'] = sum(points.values())
+        return points
+
+
+def random_policy(state, player_i, moves, rng):
+    """Pick one of the legal moves at random."""
+    return rng.choice(moves)
+
+
+def rollout(state, rng=random, decks=(), policy=random_policy):
+    """Play the game of state to its end and return the total victory points of each player.
+
+    The state must be at the start of a round of turns. decks holds the card IDs of the decks of the ages after the
+    current one, dealt with rng, and policy(state, player_i, moves, rng) picks the moves. The state is played in
+    place: roll out a clone() to keep it.
+    """
+    decks = list(decks)
+    while True:
+        while len(state.hands[0]) > 1:
+            for player_i in range(state.no_of_players):
+                state.play_a_turn(player_i, policy, rng)
+            state.pass_hands()
+        state.resolve_fights()
+        if not decks:
+            return [state.victory_points(player_i)['Total'] for player_i in range(state.no_of_players)]
+        state.age += 1
+        state.deal(decks.pop(0), rng)
+
+
+def _split_options(symbols):
+    return tuple(sorted(sw.Resource._index[symbol] for symbol in symbols))
+
+
+def _add_split(key, options):
+    """Return the SplitResources.key of key with one more card offering options."""
+    counts = dict(key)
+    counts[options] = counts.get(options, 0) + 1
+    return tuple(sorted(counts.items()))
+
+
+# Masks of the card IDs of each card type and of each name, and of the names each card chains to
+Masks = collections.namedtuple('Masks', ['types', 'names', 'gives_free'])
+
+
+def _masks(cards):
+    types, names = {}, {}
+    for card in cards:
+        types[card.type] = types.get(card.type, 0) | 1 << card.card_id
+        names[card.name] = names.get(card.name, 0) | 1 << card.card_id
+    gives_free = [0] * len(cards)
+    for card in cards:
+        for name in card.gives_free:
+            gives_free[card.card_id] |= names.get(name, 0)
+    return Masks(types, names, gives_free)
@@ -0,0 +1,292 @@
+"""Persistent results of simulated games in SQLite, resumable and aggregated as they are stored.
+
+A batch is identified by (run.ENGINE_VERSION, catalogue hash, number of players, agents, seed): games only depend on
+these and their index, so a stored game never needs to be played again, and bumping ENGINE_VERSION or editing the
+catalogue starts new batches instead of mixing results. Results are committed in bulk, every checkpoint games, each
+transaction updating the running aggregates of the batch along with its games: totals by (seat, agent, wonder, side)
+and the distribution of the total scores. An interrupted batch resumes with the games it is missing, and a complete
+one is reported from the aggregates without playing anything.
+
+    python -m seven_wonders.simulate --games 100000 --agents heuristic --store results.sqlite
+    python -m seven_wonders.store results.sqlite                  # list the batches
+    python -m seven_wonders.store results.sqlite --batch 1 --by wonder,side,seat
+"""
+import argparse
+import collections
+import math
+import sqlite3
+
+from seven_wonders import catalogue
+from seven_wonders import run
+from seven_wonders import simulate
+
+SCORE_CATEGORIES = simulate.SCORE_CATEGORIES
+# Columns of the scores, ordered as SCORE_CATEGORIES: score_military, ..., score_total
+SCORE_COLUMNS = tuple('score_' + category.strip(': ').lower().replace(' ', '_') for category in SCORE_CATEGORIES)
+# Columns of seat_totals the win rates can be grouped by
+GROUPS = ('seat', 'agent', 'wonder', 'side')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id INTEGER PRIMARY KEY,
+    engine INTEGER NOT NULL,
+    catalogue TEXT NOT NULL,
+    players INTEGER NOT NULL,
+    agents TEXT NOT NULL,
+    seed TEXT NOT NULL,
+    UNIQUE (engine, catalogue, players, agents, seed)
+);
+CREATE TABLE IF NOT EXISTS games (
+    batch_id INTEGER NOT NULL REFERENCES batches,
+    game_i INTEGER NOT NULL,
+    winner INTEGER NOT NULL,
+    PRIMARY KEY (batch_id, game_i)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS seats (
+    batch_id INTEGER NOT NULL,
+    game_i INTEGER NOT NULL,
+    seat INTEGER NOT NULL,
+    agent TEXT NOT NULL,
+    wonder TEXT NOT NULL,
+    side TEXT NOT NULL,
+    {scores},
+    PRIMARY KEY (batch_id, game_i, seat)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS seat_totals (
+    batch_id INTEGER NOT NULL,
+    seat INTEGER NOT NULL,
+    agent TEXT NOT NULL,
+    wonder TEXT NOT NULL,
+    side TEXT NOT NULL,
+    games INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    winning_total INTEGER NOT NULL,
+    total_squares INTEGER NOT NULL,
+    {scores},
+    PRIMARY KEY (batch_id, seat, agent, wonder, side)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS score_counts (
+    batch_id INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    seats INTEGER NOT NULL,
+    winners INTEGER NOT NULL,
+    PRIMARY KEY (batch_id, total)
+) WITHOUT ROWID;
+'''.format(scores=',\n    '.join('%s INTEGER NOT NULL' % column for column in SCORE_COLUMNS))
+
+Batch = collections.namedtuple('Batch', ['batch_id', 'engine', 'catalogue', 'players', 'agents', 'seed', 'games'])
+
+
+class ResultStore:
+    """GameResults of batches of games in an SQLite file, created if missing."""
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def batch_id(self, no_of_players, agent_names, seed, data_hash, engine=run.ENGINE_VERSION):
+        """Return the id of the batch of these games, creating it if needed."""
+        key = (engine, data_hash, no_of_players, ','.join(agent_names), str(seed))
+        with self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO batches (engine, catalogue, players, agents, seed) '
+                                    'VALUES (?, ?, ?, ?, ?)', key)
+        return self.connection.execute('SELECT batch_id FROM batches WHERE engine = ? AND catalogue = ? AND '
+                                       'players = ? AND agents = ? AND seed = ?', key).fetchone()[0]
+
+    def batches(self):
+        """Return a Batch per stored batch, with its number of games."""
+        rows = self.connection.execute('SELECT batches.*, (SELECT COUNT(*) FROM games WHERE games.batch_id = '
+                                       'batches.batch_id) FROM batches ORDER BY batch_id')
+        return [Batch(*row) for row in rows]
+
+    def stored_games(self, batch_id):
+        """Return the set of the indices of the stored games of a batch."""
+        return {game_i for game_i, in self.connection.execute('SELECT game_i FROM games WHERE batch_id = ?',
+                                                               (batch_id,))}
+
+    def add(self, batch_id, results):
+        """Store GameResults and update the aggregates of their batch, all in one transaction."""
+        results = list(results)
+        seat_totals = collections.defaultdict(lambda: [0] * (4 + len(SCORE_COLUMNS)))
+        score_counts = collections.defaultdict(lambda: [0, 0])
+        seat_rows = []
+        for result in results:
+            for seat, (agent, wonder, side, scores) in enumerate(zip(result.agents, result.wonders, result.sides,
+                                                                    result.scores)):
+                seat_rows.append((batch_id, result.game_i, seat, agent, wonder, side) + tuple(scores))
+                won = seat == result.winner
+                totals = seat_totals[seat, agent, wonder, side]
+                for i, value in enumerate((1, won, scores[-1] if won else 0, scores[-1] ** 2) + tuple(scores)):
+                    totals[i] += value
+                score_counts[scores[-1]][0] += 1
+                score_counts[scores[-1]][1] += won
+        score_columns = ', '.join(SCORE_COLUMNS)
+        with self.connection:
+            self.connection.executemany('INSERT INTO games VALUES (?, ?, ?)',
+                                        ((batch_id, result.game_i, result.winner) for result in results))
+            self.connection.executemany('INSERT INTO seats (batch_id, game_i, seat, agent, wonder, side, %s) '
+                                        'VALUES (%s)' % (score_columns, ', '.join('?' * (6 + len(SCORE_COLUMNS)))),
+                                        seat_rows)
+            sums = ['games', 'wins', 'winning_total', 'total_squares'] + list(SCORE_COLUMNS)
+            self.connection.executemany(
+                'INSERT INTO seat_totals (batch_id, seat, agent, wonder, side, {columns}) VALUES ({values}) '
+                'ON CONFLICT (batch_id, seat, agent, wonder, side) DO UPDATE SET {updates}'.format(
+                    columns=', '.join(sums), values=', '.join('?' * (5 + len(sums))),
+                    updates=', '.join('{0} = {0} + excluded.{0}'.format(column) for column in sums)),
+                ((batch_id,) + key + tuple(totals) for key, totals in seat_totals.items()))
+            self.connection.executemany(
+                'INSERT INTO score_counts VALUES (?, ?, ?, ?) ON CONFLICT (batch_id, total) DO UPDATE SET '
+                'seats = seats + excluded.seats, winners = winners + excluded.winners',
+                ((batch_id, total, seats, winners) for total, (seats, winners) in score_counts.items()))
+
+    def results(self, batch_id):
+        """Yield the stored GameResults of a batch, ordered by game index."""
+        game = []
+        rows = self.connection.execute('SELECT game_i, winner, seat, agent, wonder, side, %s FROM seats JOIN games '
+                                       'USING (batch_id, game_i) WHERE batch_id = ? ORDER BY game_i, seat'
+                                       % ', '.join(SCORE_COLUMNS), (batch_id,))
+        for row in rows:
+            if game and row[0] != game[0][0]:
+                yield _game_result(game)
+                game = []
+            game.append(row)
+        if game:
+            yield _game_result(game)
+
+    def stats(self, batch_id, n_games=None):
+        """Return the simulate.SimulationStats of a batch, or of its games of range(n_games) if given.
+
+        They come from the aggregates of the batch, unless it holds games past n_games: they are then summed from
+        the stored games.
+        """
+        stats = simulate.SimulationStats()
+        later, = self.connection.execute('SELECT COUNT(*) FROM games WHERE batch_id = ? AND game_i >= ?',
+                                         (batch_id, n_games)).fetchone() if n_games is not None else (0,)
+        if later:
+            stats.games, = self.connection.execute('SELECT COUNT(*) FROM games WHERE batch_id = ? AND game_i < ?',
+                                                   (batch_id, n_games)).fetchone()
+            rows = self.connection.execute(
+                'SELECT seat, agent, wonder, side, COUNT(*), SUM(seat = winner), '
+                'SUM(CASE WHEN seat = winner THEN score_total ELSE 0 END), {sums} FROM seats JOIN games '
+                'USING (batch_id, game_i) WHERE batch_id = ? AND game_i < ? GROUP BY seat, agent, wonder, side'.format(
+                    sums=', '.join('SUM(%s)' % column for column in SCORE_COLUMNS)), (batch_id, n_games))
+        else:
+            stats.games, = self.connection.execute('SELECT COUNT(*) FROM games WHERE batch_id = ?',
+                                                   (batch_id,)).fetchone()
+            rows = self.connection.execute('SELECT seat, agent, wonder, side, games, wins, winning_total, %s FROM '
+                                           'seat_totals WHERE batch_id = ?' % ', '.join(SCORE_COLUMNS), (batch_id,))
+        for seat, agent, wonder, side, games, wins, winning_total, *scores in rows:
+            stats.wonder_games[wonder, side] += games
+            stats.agent_games[agent] += games
+            stats.score_totals.update(dict(zip(SCORE_CATEGORIES, scores)))
+            if wins:
+                stats.wonder_wins[wonder, side] += wins
+                stats.seat_wins[seat] += wins
+                stats.agent_wins[agent] += wins
+            stats.winning_score_total += winning_total
+        return stats
+
+    def win_rates(self, batch_id, by=('wonder', 'side')):
+        """Return {values of the columns by: (games, win rate, mean total, standard deviation of the total)}.
+
+        by is a sequence of GROUPS, e.g. ('wonder', 'side', 'seat') for the win rate of each wonder side in each seat.
+        """
+        if not by or not set(by) <= set(GROUPS):
+            raise ValueError('win rates are grouped by some of %s, not %s' % (', '.join(GROUPS), ', '.join(by)))
+        columns = ', '.join(by)
+        rows = self.connection.execute('SELECT {0}, SUM(games), SUM(wins), SUM(score_total), SUM(total_squares) FROM '
+                                       'seat_totals WHERE batch_id = ? GROUP BY {0} ORDER BY {0}'.format(columns),
+                                       (batch_id,))
+        rates = {}
+        for row in rows:
+            key, (games, wins, total, squares) = tuple(row[:len(by)]), row[len(by):]
+            mean = total / games
+            rates[key] = (games, wins / games, mean, math.sqrt(max(squares / games - mean ** 2, 0.0)))
+        return rates
+
+    def score_distribution(self, batch_id):
+        """Return {total score: (seats with that total, winners with that total)}, ordered by total."""
+        return {total: (seats, winners) for total, seats, winners in self.connection.execute(
+            'SELECT total, seats, winners FROM score_counts WHERE batch_id = ? ORDER BY total', (batch_id,))}
+
+
+def _game_result(rows):
+    return simulate.GameResult(rows[0][0],
+                               tuple(row[3] for row in rows),
+                               tuple(row[4] for row in rows),
+                               tuple(row[5] for row in rows),
+                               tuple(tuple(row[6:]) for row in rows),
+                               rows[0][1])
+
+
+def simulate_stored(store, n_games, no_of_players=4, seed=0, workers=None, agent_names=None, checkpoint=1024,
+                    card_file='cards.tsv', wonder_file='wonders.tsv', **kwargs):
+    """Play the games of range(n_games) missing from store, store them and return the stats of range(n_games).
+
+    The results are committed every checkpoint games, and what has been played is committed when the batch is
+    interrupted, so that running it again resumes where it stopped. The other arguments are those of
+    simulate.simulate_results, which only get to the games played here.
+    """
+    agent_names = agent_names or ('random',) * no_of_players
+    data_hash = catalogue.load(card_file, wonder_file).data_hash
+    batch_id = store.batch_id(no_of_players, agent_names, seed, data_hash)
+    stored = store.stored_games(batch_id)
+    missing = [game_i for game_i in range(n_games) if game_i not in stored]
+    if missing:
+        pending = []
+        try:
+            for result in simulate.simulate_results(n_games, no_of_players, seed, workers, agent_names=agent_names,
+                                                    card_file=card_file, wonder_file=wonder_file,
+                                                    game_indices=missing, **kwargs):
+                pending.append(result)
+                if len(pending) >= checkpoint:
+                    store.add(batch_id, pending)
+                    pending = []
+        finally:
+            store.add(batch_id, pending)
+    return store.stats(batch_id, n_games)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the results stored by simulate --store.')
+    parser.add_argument('path', help='SQLite file of the results')
+    parser.add_argument('--batch', type=int, help='report on this batch, instead of listing the batches')
+    parser.add_argument('--by', default='wonder,side',
+                        help='comma separated columns to group the win rates by, among %s' % ', '.join(GROUPS))
+    parser.add_argument('--scores', action='store_true', help='print the distribution of the total scores')
+    args = parser.parse_args()
+    with ResultStore(args.path) as store:
+        if args.batch is None:
+            print('{:>6} {:>7} {:>17} {:>8} {:>10}  {}'.format('batch', 'engine', 'catalogue', 'players', 'games',
+                                                                 'agents / seed'))
+            for batch in store.batches():
+                print('{:>6} {:>7} {:>17} {:>8} {:>10}  {} / {}'.format(batch.batch_id, batch.engine, batch.catalogue,
+                                                                        batch.players, batch.games, batch.agents,
+                                                                        batch.seed))
+            return
+        try:
+            rates = store.win_rates(args.batch, args.by.split(','))
+        except ValueError as error:
+            parser.error(str(error))
+        print(store.stats(args.batch).report())
+        print('\n** Win rate by %s **' % args.by.replace(',', ', '))
+        for key, (games, win_rate, mean, deviation) in rates.items():
+            print('{:>30}: {:6.2%} ({} games), total {:.1f} +- {:.1f}'.format(' '.join(map(str, key)), win_rate,
+                                                                              games, mean, deviation))
+        if args.scores:
+            print('\n** Total scores **')
+            for total, (seats, winners) in store.score_distribution(args.batch).items():
+                print('{:>5}: {:>8} seats {:>8} winners'.format(total, seats, winners))
+
+
+if __name__ == '__main__':
+    main()
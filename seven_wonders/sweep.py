@@ -0,0 +1,255 @@
+"""Balance sweep: win rate of every wonder side in every seat, with adaptive allocation of the games.
+
+A cell is (number of players, wonder, side, seat). Every game of the sweep is played for a focal cell: its wonder side
+is forced on its seat (see the wonder_ids of run.play) and the other seats get distinct other wonders with random
+sides. Every seat of the game is an observation of its own cell, weighted so that the estimates are those of tables
+drawn uniformly: a table gets the weight 1 / (sum of the shares of the focal games of its cells in the round), the
+balance heuristic of multiple importance sampling, and intervals use the effective number of observations. A seat
+only counts if its cell has focal games in the round, since the tables of the other cells don't cover its own.
+
+Every cell is focal in min_games games first, or in fewer if the budget can't pay for them. Then, round after round,
+round_games games are given batch by batch to the cells whose Wilson confidence interval of the win rate is the
+widest, counting the batches already given this round, until every interval is narrower than target or the budget is
+spent. Cells whose win rate is near 50% have the most variance and get the most games. This doesn't save games over
+a uniform sample of tables, which observes every seat of every game while the sweep drops the seats of the cells left
+out of a round: it usually plays somewhat more (main prints the estimate of a uniform sample to compare), but it
+stops as soon as every cell reaches the target. The games of a round are played in parallel on a process pool. The
+other seats are dealt distinct wonders, as run.play deals them, so the estimates are those of normal games.
+
+    python -m seven_wonders.sweep --players 3 4 5 --target 0.03 --budget 200000
+
+The games of a cell only depend on the seed, the cell and their index, so a sweep is reproducible whatever the number
+of workers.
+"""
+import argparse
+import collections
+import heapq
+import math
+import multiprocessing
+import sys
+
+from seven_wonders import agents
+from seven_wonders import catalogue
+from seven_wonders import definitions as sw
+from seven_wonders import run
+
+Cell = collections.namedtuple('Cell', ['players', 'wonder', 'side', 'seat'])
+# Normal quantile of the 95% confidence intervals
+Z = 1.96
+
+
+def wilson_interval(wins, games, z=Z):
+    """Return the (low, high) Wilson score interval of a win rate."""
+    if not games:
+        return 0.0, 1.0
+    rate = wins / games
+    centre = (rate + z * z / (2 * games)) / (1 + z * z / games)
+    margin = z / (1 + z * z / games) * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games))
+    return max(centre - margin, 0.0), min(centre + margin, 1.0)
+
+
+def half_width(wins, games, z=Z):
+    low, high = wilson_interval(wins, games, z)
+    return (high - low) / 2
+
+
+def cells(cards_and_wonders, player_counts):
+    """Return every Cell of the sweep."""
+    return [Cell(no_of_players, wonder.name.rsplit('_', 1)[0], wonder.side, seat)
+            for no_of_players in player_counts
+            for wonder in cards_and_wonders.wonders
+            for seat in range(no_of_players)]
+
+
+def cell_wonder_ids(cards_and_wonders, cell, rng):
+    """Return the wonder_ids of a game of cell: its wonder side on its seat, distinct others on the other seats."""
+    sides = run.wonder_sides(cards_and_wonders.wonders)
+    others = rng.sample(sorted(name for name in sides if name != cell.wonder), cell.players - 1)
+    wonder_ids = [sides[name][rng.choice(sorted(sides[name]))] for name in others]
+    wonder_ids.insert(cell.seat, sides[cell.wonder][cell.side])
+    return wonder_ids
+
+
+def play_cell(cards_and_wonders, cell, seed, game_i, agent_name='random'):
+    """Play game game_i of focal cell cell and return (the Cell of every seat, the winning seat)."""
+    rng = run.game_rng('%s/%d/%s/%s/%d' % ((seed,) + cell), game_i)
+    wonder_ids = cell_wonder_ids(cards_and_wonders, cell, rng)
+    players = [sw.Player(str(seat), agents.AGENTS[agent_name]()) for seat in range(cell.players)]
+    run.play(players, cards_and_wonders.decks(cell.players, rng), cards_and_wonders.wonders, False, rng,
+             wonder_ids=wonder_ids)
+    wonders = [cards_and_wonders.wonders[wonder_id] for wonder_id in wonder_ids]
+    return tuple(Cell(cell.players, wonder.name.rsplit('_', 1)[0], wonder.side, seat)
+                 for seat, wonder in enumerate(wonders)), run.winner(players)
+
+
+def _play_cell_games(args):
+    """Return the focal cell of a task, and the (cells, winner) of its games."""
+    cell, seed, game_indices, agent_name, card_file, wonder_file = args
+    cards_and_wonders = catalogue.load(card_file, wonder_file)
+    return cell, [play_cell(cards_and_wonders, cell, seed, game_i, agent_name) for game_i in game_indices]
+
+
+class Sweep:
+    """Weighted observations of every cell, and the allocation of the next games.
+
+    focal_games counts the games played for each cell, weight, weight_squares and weighted_wins sum the weights of
+    its observations, their squares and the weights of its wins.
+    """
+    def __init__(self, cells):
+        self.focal_games = collections.Counter({cell: 0 for cell in cells})
+        self.weight = collections.Counter()
+        self.weight_squares = collections.Counter()
+        self.weighted_wins = collections.Counter()
+
+    def add(self, table, winner, shares):
+        """Add a game of the cells of table, shares giving the share of each cell in the focal games of its round.
+
+        Only the seats of cells with a share are observations: a cell without games of its own in the round only
+        sits at the tables drawn for the other cells, which aren't a uniform sample of its tables.
+        """
+        weight = 1 / sum(shares[cell] for cell in table)
+        for seat, cell in enumerate(table):
+            if not shares[cell]:
+                continue
+            self.weight[cell] += weight
+            self.weight_squares[cell] += weight * weight
+            if seat == winner:
+                self.weighted_wins[cell] += weight
+
+    def win_rate(self, cell):
+        return self.weighted_wins[cell] / self.weight[cell] if self.weight[cell] else 0.5
+
+    def observations(self, cell):
+        """Effective number of observations of a cell, (sum of weights) ** 2 / sum of squared weights."""
+        return self.weight[cell] ** 2 / self.weight_squares[cell] if self.weight_squares[cell] else 0.0
+
+    def half_width(self, cell, extra_games=0):
+        """Half width of the interval of cell once extra_games more are played for it, at the same win rate."""
+        observations = self.observations(cell) + extra_games
+        return half_width(self.win_rate(cell) * observations, observations)
+
+    def widest(self):
+        return max(self.half_width(cell) for cell in self.focal_games)
+
+    def allocate(self, n_games, batch_games):
+        """Return {cell: games} spreading n_games in batches of batch_games over the widest intervals."""
+        allocation = collections.Counter()
+        heap = [(-self.half_width(cell), cell) for cell in self.focal_games]
+        heapq.heapify(heap)
+        for _ in range(max(n_games // batch_games, 1)):
+            _, cell = heapq.heappop(heap)
+            allocation[cell] += batch_games
+            heapq.heappush(heap, (-self.half_width(cell, allocation[cell]), cell))
+        return allocation
+
+    def uniform_games(self, target):
+        """Estimate the games of a uniform sample reaching target in every cell, at the observed win rates.
+
+        A seat of a uniform game, dealt as run.play deals the wonders, gets each wonder side in about 1 in
+        (number of wonder sides) games.
+        """
+        sides = len({(cell.wonder, cell.side) for cell in self.focal_games})
+        needed = collections.Counter()
+        for cell in self.focal_games:
+            rate = self.win_rate(cell)
+            needed[cell.players] = max(needed[cell.players], Z * Z * rate * (1 - rate) / target ** 2 * sides)
+        return int(sum(needed.values()))
+
+    def _format(self, cells):
+        wins = sum(self.weighted_wins[cell] for cell in cells)
+        weight = sum(self.weight[cell] for cell in cells)
+        squares = sum(self.weight_squares[cell] for cell in cells)
+        observations = weight ** 2 / squares if squares else 0.0
+        rate = wins / weight if weight else 0.0
+        return '%5.1f%% +-%4.1f' % (100 * rate, 100 * half_width(rate * observations, observations))
+
+    def report(self):
+        lines = []
+        for no_of_players in sorted({cell.players for cell in self.focal_games}):
+            lines.append('\n** %d players: win rate +- 95%% interval half width **' % no_of_players)
+            lines.append('{:>18} '.format('') + ' '.join('{:>15}'.format('seat %d' % seat)
+                                                          for seat in range(no_of_players)) + '{:>17}'.format('all'))
+            rows = sorted({(cell.wonder, cell.side) for cell in self.focal_games if cell.players == no_of_players})
+            for wonder, side in rows:
+                row_cells = [Cell(no_of_players, wonder, side, seat) for seat in range(no_of_players)]
+                lines.append('{:>16} {} '.format(wonder, side) +
+                             ' '.join('{:>15}'.format(self._format([cell])) for cell in row_cells) +
+                             '{:>17}'.format(self._format(row_cells)))
+            lines.append('{:>18} {:.1%} (fair share)'.format('', 1 / no_of_players))
+        return '\n'.join(lines)
+
+
+def _shares(allocation):
+    """Return the share of each cell in the games of its number of players of an allocation."""
+    totals = collections.Counter()
+    for cell, games in allocation.items():
+        totals[cell.players] += games
+    return collections.defaultdict(float, {cell: games / totals[cell.players] for cell, games in allocation.items()})
+
+
+def sweep(player_counts=(3, 4, 5, 6, 7), target=0.05, budget=100000, seed=0, workers=None, min_games=16,
+          round_games=None, batch_games=8, agent_name='random', card_file='cards.tsv', wonder_file='wonders.tsv',
+          output=None):
+    """Play the sweep until every interval half width is under target or budget games are played, return the Sweep.
+
+    The first round gives min_games to every cell, or as many as the budget allows, and raises ValueError if that
+    is not one game per cell. round_games defaults to half the games of the first round. A line per round goes to
+    output.
+    """
+    cards_and_wonders = catalogue.load(card_file, wonder_file)
+    stats = Sweep(cells(cards_and_wonders, player_counts))
+    first_games = min(min_games, budget // len(stats.focal_games))
+    if not first_games:
+        raise ValueError('a budget of %d games is less than a game for each of the %d cells' %
+                         (budget, len(stats.focal_games)))
+    if output and first_games < min_games:
+        print('The budget allows %d games per cell in the first round, not %d' % (first_games, min_games),
+              file=output, flush=True)
+    allocation = collections.Counter({cell: first_games for cell in stats.focal_games})
+    round_games = round_games or len(stats.focal_games) * first_games // 2
+    played = 0
+    with multiprocessing.Pool(workers) as pool:
+        while allocation:
+            shares = _shares(allocation)
+            tasks = []
+            for cell, games in allocation.items():
+                start = stats.focal_games[cell]
+                tasks.extend((cell, seed, range(game_i, min(game_i + batch_games, start + games)), agent_name,
+                              card_file, wonder_file) for game_i in range(start, start + games, batch_games))
+            for cell, games in pool.imap_unordered(_play_cell_games, tasks):
+                stats.focal_games[cell] += len(games)
+                played += len(games)
+                for table, winner in games:
+                    stats.add(table, winner, shares)
+            widest = stats.widest()
+            if output:
+                print('%d games, widest interval +-%.2f%%' % (played, 100 * widest), file=output, flush=True)
+            if widest <= target or played >= budget:
+                break
+            allocation = stats.allocate(min(round_games, budget - played), batch_games)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the win rate of every wonder side in every seat.')
+    parser.add_argument('-p', '--players', type=int, nargs='+', default=[3, 4, 5, 6, 7], choices=range(3, 8))
+    parser.add_argument('-t', '--target', type=float, default=0.05,
+                        help='95%% interval half width to reach in every cell (default: %(default)s)')
+    parser.add_argument('-b', '--budget', type=int, default=100000, help='games to play at most')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-w', '--workers', type=int, default=None, help='defaults to the number of CPUs')
+    parser.add_argument('--min-games', type=int, default=16, help='focal games of every cell in the first round')
+    parser.add_argument('-a', '--agent', default='random', choices=sorted(agents.AGENTS), help='agent of every seat')
+    args = parser.parse_args()
+    try:
+        stats = sweep(sorted(set(args.players)), args.target, args.budget, args.seed, args.workers, args.min_games,
+                      agent_name=args.agent, output=sys.stdout)
+    except ValueError as error:
+        parser.error(str(error))
+    print(stats.report())
+    print('\n%d games played, a uniform sample would need about %d for the same widest interval' %
+          (sum(stats.focal_games.values()), stats.uniform_games(stats.widest())))
+
+
+if __name__ == '__main__':
+    main()
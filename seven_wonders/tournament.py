@@ -0,0 +1,210 @@
+"""Tournaments between agents, with paired games and sequential early stopping.
+
+A pairing plays agent A against agent B in pairs of games. Both games of a pair get the same wonders and hands (the
+same deal seed, see run.play) with the seats of A and B swapped, and A takes the even seats in one pair and the odd
+ones in the next. A game counts 1 for the agent of the winning seat, ties broken by coins, and a pair the mean of its
+two games for A, so most of the luck of the deal cancels out within a pair.
+
+Pairs are played in small batches on a process pool. After every pair, a sequential probability ratio test (SPRT) of
+H0: A is elo0 stronger than B, against H1: A is elo1 stronger, decides whether the pairing can stop: with the error
+rates alpha and beta, a clear difference is settled in far fewer games than a fixed budget would use. The pool of a
+pairing is terminated when it stops, so the games queued past the decision are dropped. Elo ratings of all the
+agents of a tournament are kept up to date after every game.
+
+    python -m seven_wonders.tournament heuristic greedy random --players 4 --elo0 0 --elo1 50
+"""
+import argparse
+import collections
+import itertools
+import math
+import multiprocessing
+import os
+import sys
+
+from seven_wonders import agents
+from seven_wonders import catalogue
+from seven_wonders import definitions as sw
+from seven_wonders import run
+
+# Points of a win or a loss in the scores of the SPRT and of the Elo ratings
+WIN, LOSS = 1.0, 0.0
+# Weight, in pairs, of the prior variance of the pair scores
+PRIOR_PAIRS = 2
+
+
+def expected_score(elo):
+    """Return the expected score of an agent elo points stronger than its opponent."""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_difference(score):
+    """Return the Elo difference giving an expected score, the inverse of expected_score."""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+class Ratings:
+    """Elo ratings, updated after every game with a K factor of k."""
+    def __init__(self, names, k=16.0, initial=1500.0):
+        self.k = k
+        self.ratings = {name: initial for name in names}
+
+    def update(self, winner, loser):
+        change = self.k * (WIN - expected_score(self.ratings[winner] - self.ratings[loser]))
+        self.ratings[winner] += change
+        self.ratings[loser] -= change
+
+
+class PairingStats:
+    """Scores of the pairs of games of agent_a against agent_b and the state of their SPRT."""
+    def __init__(self, agent_a, agent_b, elo0=0.0, elo1=50.0, alpha=0.05, beta=0.05):
+        self.agent_a = agent_a
+        self.agent_b = agent_b
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.pairs = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+
+    def add(self, pair_score):
+        self.pairs += 1
+        self.total += pair_score
+        self.total_squares += pair_score ** 2
+
+    @property
+    def score(self):
+        return self.total / self.pairs if self.pairs else 0.5
+
+    @property
+    def variance(self):
+        """Variance of the score of a pair."""
+        return self.total_squares / self.pairs - self.score ** 2 if self.pairs else 0.0
+
+    def estimated_variance(self):
+        """Return the variance of the score of a pair, with a prior of PRIOR_PAIRS pairs.
+
+        The prior is the variance of a pair of independent games at the score halfway between H0 and H1, so that
+        the estimate is never 0: after a clean sweep the observed variance is, and the SPRT could never stop.
+        """
+        score = (expected_score(self.elo0) + expected_score(self.elo1)) / 2
+        prior = score * (1 - score) / 2
+        return (self.pairs * self.variance + PRIOR_PAIRS * prior) / (self.pairs + PRIOR_PAIRS)
+
+    def llr(self):
+        """Return the log likelihood ratio of H1 against H0, with the normal approximation of the pair scores."""
+        s0, s1 = expected_score(self.elo0), expected_score(self.elo1)
+        return (s1 - s0) * (2 * self.total - self.pairs * (s0 + s1)) / (2 * self.estimated_variance())
+
+    def decision(self):
+        """Return 'H1' or 'H0' once the SPRT accepts one of them, None while it goes on."""
+        llr = self.llr()
+        return 'H1' if llr >= self.upper else 'H0' if llr <= self.lower else None
+
+    def elo(self):
+        """Return the Elo difference of A over B and its 95% confidence interval."""
+        margin = 1.96 * math.sqrt(self.estimated_variance() / self.pairs) if self.pairs else 0.5
+        return (elo_difference(self.score), elo_difference(self.score - margin),
+                elo_difference(self.score + margin))
+
+    def report(self):
+        elo, low, high = self.elo()
+        decision = self.decision()
+        conclusion = {'H1': '%s is stronger by %+g Elo or more' % (self.agent_a, self.elo1),
+                      'H0': '%s is not stronger by %+g Elo' % (self.agent_a, self.elo1)}.get(decision, 'undecided')
+        return '{} vs {}: {} pairs, score {:.3f}, Elo {:+.0f} [{:+.0f}, {:+.0f}], LLR {:.2f} [{:.2f}, {:.2f}]: {}'\
+            .format(self.agent_a, self.agent_b, self.pairs, self.score, elo, low, high, self.llr(), self.lower,
+                    self.upper, conclusion)
+
+
+def play_pair(cards_and_wonders, agent_a, agent_b, no_of_players, seed, pair_i):
+    """Play pair pair_i of a pairing and return the results (WIN or LOSS) of agent_a in its two games."""
+    results = []
+    for swapped in (False, True):
+        seats = [agent_a if (seat + pair_i + swapped) % 2 == 0 else agent_b for seat in range(no_of_players)]
+        deal_rng = run.game_rng(seed, pair_i)
+        rng = run.game_rng(seed, '%s/%d' % (pair_i, swapped))
+        players = [sw.Player(str(seat), agents.AGENTS[name]()) for seat, name in enumerate(seats)]
+        run.play(players, cards_and_wonders.decks(no_of_players, deal_rng), cards_and_wonders.wonders, False, rng,
+                 deal_rng=deal_rng)
+        results.append(WIN if seats[run.winner(players)] == agent_a else LOSS)
+    return tuple(results)
+
+
+def _play_pairs(args):
+    agent_a, agent_b, no_of_players, seed, pair_indices, card_file, wonder_file = args
+    cards_and_wonders = catalogue.load(card_file, wonder_file)
+    return [play_pair(cards_and_wonders, agent_a, agent_b, no_of_players, seed, pair_i) for pair_i in pair_indices]
+
+
+def run_pairing(agent_a, agent_b, no_of_players=4, seed=0, max_pairs=5000, batch_pairs=4, ratings=None, workers=None,
+                card_file='cards.tsv', wonder_file='wonders.tsv', **sprt):
+    """Play agent_a against agent_b until the SPRT decides or max_pairs, and return the PairingStats.
+
+    sprt holds the elo0, elo1, alpha and beta of PairingStats. ratings, a Ratings, is updated after every game.
+    The pairing has its own pool of workers processes (one per CPU by default), with two batches of batch_pairs
+    pairs in flight per worker. The SPRT is checked after every pair, in the order of the pairs, and the pool is
+    terminated as soon as it decides, so the batches still queued or running are dropped.
+    """
+    stats = PairingStats(agent_a, agent_b, **sprt)
+    workers = workers or os.cpu_count()
+    tasks = ((agent_a, agent_b, no_of_players, seed, range(start, min(start + batch_pairs, max_pairs)), card_file,
+              wonder_file) for start in range(0, max_pairs, batch_pairs))
+    with multiprocessing.Pool(workers) as pool:
+        pending = collections.deque(pool.apply_async(_play_pairs, (task,))
+                                    for task in itertools.islice(tasks, 2 * workers))
+        while pending:
+            for results in pending.popleft().get():
+                stats.add(sum(results) / len(results))
+                if ratings:
+                    for result in results:
+                        ratings.update(*((agent_a, agent_b) if result == WIN else (agent_b, agent_a)))
+                if stats.decision():
+                    # Leaving the with block terminates the pool
+                    return stats
+            pending.extend(pool.apply_async(_play_pairs, (task,)) for task in itertools.islice(tasks, 1))
+    return stats
+
+
+def tournament(agent_names, no_of_players=4, seed=0, workers=None, output=None, **kwargs):
+    """Play every pairing of agent_names and return ([PairingStats], Ratings).
+
+    The other arguments are those of run_pairing. The report of each pairing is printed to output as it ends.
+    """
+    ratings = Ratings(agent_names)
+    pairings = []
+    for pairing_i, (agent_a, agent_b) in enumerate(itertools.combinations(agent_names, 2)):
+        # Every pairing gets its own deals
+        stats = run_pairing(agent_a, agent_b, no_of_players, '%s/%s' % (seed, pairing_i), ratings=ratings,
+                            workers=workers, **kwargs)
+        pairings.append(stats)
+        if output:
+            print(stats.report(), file=output, flush=True)
+    return pairings, ratings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play a tournament between agents with early stopping.')
+    parser.add_argument('agents', nargs='+', choices=sorted(agents.AGENTS))
+    parser.add_argument('-p', '--players', type=int, default=4, choices=range(3, 8))
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-w', '--workers', type=int, default=None, help='defaults to the number of CPUs')
+    parser.add_argument('--max-pairs', type=int, default=5000, help='pairs of games per pairing at most')
+    parser.add_argument('--elo0', type=float, default=0.0, help='Elo difference of H0 (default: %(default)s)')
+    parser.add_argument('--elo1', type=float, default=50.0, help='Elo difference of H1 (default: %(default)s)')
+    parser.add_argument('--alpha', type=float, default=0.05, help='false positive rate of the SPRT')
+    parser.add_argument('--beta', type=float, default=0.05, help='false negative rate of the SPRT')
+    args = parser.parse_args()
+    if len(set(args.agents)) < 2:
+        parser.error('a tournament needs at least two different agents')
+    _, ratings = tournament(list(dict.fromkeys(args.agents)), args.players, args.seed, args.workers,
+                            output=sys.stdout, max_pairs=args.max_pairs, elo0=args.elo0, elo1=args.elo1,
+                            alpha=args.alpha, beta=args.beta)
+    print('\n** Elo ratings **')
+    for name, rating in sorted(ratings.ratings.items(), key=lambda item: -item[1]):
+        print('{:>15}: {:.0f}'.format(name, rating))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import random
+
+import numpy as np
+import pytest
+
+from seven_wonders import agents
+from seven_wonders import catalogue
+from seven_wonders import definitions as sw
+from seven_wonders import lockstep
+from seven_wonders import run
+
+
+def _first_turn(games, seat, game_i, cards_and_wonders):
+    """Return the object engine view and playable moves of the first turn of seat in lockstep game game_i."""
+    players = [sw.Player(str(player)) for player in range(games.no_of_players)]
+    run.seat_players(players, cards_and_wonders.wonders, random.Random(0),
+                     wonder_ids=[int(wonder_id) for wonder_id in games.wonders[game_i]])
+    for p in players:
+        p.age = 1
+    hand = [cards_and_wonders.cards[card_id] for card_id in games.hands[game_i, seat, :games.hand_len[game_i, seat]]]
+    cards, playable = players[seat].playable_moves(players, hand)
+    return players[seat].decision(playable, cards, players)
+
+
+def test_lockstep_features_match_the_object_engine():
+    cards_and_wonders = catalogue.load()
+    calls = []
+
+    def evaluate(features):
+        calls.append(features)
+        return np.zeros(len(features))
+
+    games = lockstep.LockstepGames(cards_and_wonders, 32, 4, lockstep.batch_rng(7, 0),
+                                   lockstep.evaluator_policy(evaluate))
+    games._deal(0)
+    hands, hand_len = games.hands.copy(), games.hand_len.copy()
+    games._turn(np.arange(32), 0, 0, False)
+    assert len(calls) == 1
+    features = calls[0].reshape(32, -1, len(agents.MOVE_FEATURES))
+    # The turn played a card of each hand
+    games.hands, games.hand_len = hands, hand_len
+    for game_i in range(32):
+        view, playable = _first_turn(games, 0, game_i, cards_and_wonders)
+        moves = [(view, card_i, cost) for card_i, cost in sorted(playable.items())]
+        expected = agents.move_feature_matrix(moves)
+        assert (features[game_i, sorted(playable)] == expected).all()
+
+
+def test_evaluator_policy_scores_every_game_of_a_turn_at_once():
+    cards_and_wonders = catalogue.load()
+    calls = []
+    points = agents.MOVE_FEATURES.index('gives_V')
+
+    def evaluate(features):
+        calls.append(len(features))
+        return features[:, points]
+
+    result = lockstep.play_batch(cards_and_wonders, 64, 3, lockstep.batch_rng(7, 1),
+                                 lockstep.evaluator_policy(evaluate))
+    assert result.scores.shape == (64, 3, len(run.events.SCORE_CATEGORIES))
+    # One call per turn of each seat, at least, each with the candidates of all the games still playing it
+    assert len(calls) >= 3 * 3 * 6
+    assert max(calls) == 64 * 8
+
+
+def test_views_cannot_change_the_game():
+    cards_and_wonders = catalogue.load()
+    views = []
+
+    class Recording(agents.RandomAgent):
+        def choose(self, view, playable_cards):
+            views.append(view)
+            return super().choose(view, playable_cards)
+
+    players = [sw.Player(str(player), Recording()) for player in range(3)]
+    rng = random.Random(1)
+    run.play(players, cards_and_wonders.decks(3, rng), cards_and_wonders.wonders, False, rng)
+    card = views[0].cards[0]
+    with pytest.raises(TypeError):
+        card.cost['$'] = 0
+    with pytest.raises(AttributeError):
+        card.name = 'Palace'
+    assert isinstance(views[0].cards[-1], agents.CardView)
+
+
+def test_agent_draws_do_not_change_the_deal(monkeypatch):
+    cards_and_wonders = catalogue.load()
+
+    class Greedy(agents.RandomAgent):
+        def choose(self, view, playable_cards):
+            for _ in range(10):
+                view.rng.random()
+            return super().choose(view, playable_cards)
+
+    deal = run.deal
+
+    def deals(agent):
+        dealt = []
+
+        def recording_deal(hand, no_of_players, rng):
+            hands = deal(hand, no_of_players, rng)
+            dealt.append([[card.name for card in player_hand] for player_hand in hands])
+            return hands
+        monkeypatch.setattr(run, 'deal', recording_deal)
+        players = [sw.Player(str(player), agent()) for player in range(4)]
+        rng = random.Random(5)
+        run.play(players, cards_and_wonders.decks(4, rng), cards_and_wonders.wonders, False, rng)
+        return dealt, [p.wonder.name for p in players]
+
+    assert deals(agents.RandomAgent) == deals(Greedy)
+
+
+def test_heuristic_values_the_split_resource_of_the_next_stage():
+    cards_and_wonders = catalogue.load()
+    alexandria = next(wonder for wonder in cards_and_wonders.wonders if wonder.name == 'Alexandria_B').fresh_copy()
+    view = agents.card_view(alexandria)
+    assert agents.card_split_options(view) == tuple(view.stages[1][1].split('/'))
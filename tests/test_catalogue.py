@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+from seven_wonders import catalogue
+
+
+# Pickles raising ImportError, ValueError, TypeError and EOFError
+@pytest.mark.parametrize('data', [b'cno_such_module\nCatalogue\n.', b"cbuiltins\nint\n(S'x'\ntR.",
+                                  b"cbuiltins\nint\n(S'x'\nS'y'\nS'z'\ntR.", b''])
+def test_an_unreadable_cache_is_rebuilt(tmp_path, data):
+    cache_path = tmp_path / 'catalogue.pickle'
+    cache_path.write_bytes(data)
+    assert catalogue._read_cache(str(cache_path)) is None
+
+
+def test_a_failed_cache_write_leaves_no_temporary_file(tmp_path, monkeypatch):
+    def failing_replace(source, destination):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(os, 'replace', failing_replace)
+    catalogue._write_cache(str(tmp_path / 'catalogue.pickle'), catalogue.load())
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,61 @@
+import collections
+
+import numpy as np
+
+from seven_wonders import agents
+from seven_wonders import catalogue
+from seven_wonders import dataset
+from seven_wonders import definitions as sw
+
+
+def _play(cards_and_wonders, encoder, monkeypatch, game_i):
+    """Return the columns of the records of a game and its number of decisions."""
+    decisions = collections.Counter()
+    decision = sw.Player.decision
+
+    def counted_decision(self, *args):
+        decisions[self.player_i] += 1
+        return decision(self, *args)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(sw.Player, 'decision', counted_decision)
+        columns = dataset.play_records(cards_and_wonders, encoder, 5, game_i, ['heuristic', 'random', 'greedy'])
+    return columns, decisions
+
+
+def test_records_are_the_decisions_and_their_moves_are_legal(monkeypatch):
+    cards_and_wonders = catalogue.load()
+    encoder = dataset.Encoder(cards_and_wonders, 3)
+    moves = set()
+    for game_i in range(4):
+        columns, decisions = _play(cards_and_wonders, encoder, monkeypatch, game_i)
+        assert all(len(column) == sum(decisions.values()) for column in columns.values())
+        assert collections.Counter(columns['seat'].tolist()) == decisions
+        assert columns['legal'][np.arange(len(columns['move'])), columns['move']].all()
+        moves.update(columns['move'].tolist())
+    assert {encoder.build, encoder.discard} <= moves
+
+
+def test_move_index_of_wonder_stages_and_coins():
+    cards_and_wonders = catalogue.load()
+    encoder = dataset.Encoder(cards_and_wonders, 4)
+    card = agents.card_view(cards_and_wonders.cards[0])
+    view = collections.namedtuple('View', ['cards'])((card,))
+    assert encoder.move_index(view, ('play', 0, {})) == encoder.name_ids[card.name]
+    assert encoder.move_index(view, ('wonder', 0, {})) == encoder.build
+    assert encoder.move_index(view, ('coin', 0, None)) == encoder.discard
+
+
+def test_shards_round_trip_through_load(tmp_path):
+    cards_and_wonders = catalogue.load()
+    encoder = dataset.Encoder(cards_and_wonders, 3)
+    shards = list(dataset.generate(str(tmp_path), 5, 3, seed=2, workers=1, games_per_shard=2))
+    manifest, arrays = dataset.load(str(tmp_path))
+    assert [shard['records'] for shard in manifest['shards']] == [records for _, records in shards]
+    games = [dataset.play_records(cards_and_wonders, encoder, 2, game_i, ['random'] * 3) for game_i in range(5)]
+    for field, (dtype, _) in dataset.FIELDS.items():
+        column = np.concatenate([shard[field] for shard in arrays])
+        assert all(isinstance(shard[field], np.memmap) for shard in arrays)
+        assert column.dtype == dtype
+        assert len(column) == sum(manifest_shard['records'] for manifest_shard in manifest['shards'])
+        np.testing.assert_array_equal(column, np.concatenate([game[field] for game in games]))
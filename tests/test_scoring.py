@@ -0,0 +1,86 @@
+import random
+
+import numpy as np
+import pytest
+
+from seven_wonders import agents
+from seven_wonders import catalogue
+from seven_wonders import definitions as sw
+from seven_wonders import run
+from seven_wonders import scoring
+from seven_wonders import state as packed
+
+
+def _card(cards_and_wonders, name):
+    return next(card for card in cards_and_wonders.cards if card.name == name)
+
+
+def _players(cards_and_wonders, brown_cards):
+    """Return 4 seated players, player i having played brown_cards[i] brown cards."""
+    players = [sw.Player(str(i)) for i in range(4)]
+    run.seat_players(players, cards_and_wonders.wonders, random.Random(0), wonder_ids=[0, 2, 4, 6])
+    browns = [card for card in cards_and_wonders.cards if card.type == 'brown']
+    for p, n in zip(players, brown_cards):
+        for card in browns[:n]:
+            p._add_to_tableau(card)
+    return players
+
+
+def test_vineyard_and_bazaar_count_own_and_neighbours_cards():
+    cards_and_wonders = catalogue.load()
+    players = _players(cards_and_wonders, [1, 2, 4, 8])
+    grays = [card for card in cards_and_wonders.cards if card.type == 'gray']
+    for card in grays[:2]:
+        players[0]._add_to_tableau(card)
+    players[2]._add_to_tableau(grays[0])
+    players[3]._add_to_tableau(grays[0])
+    game = packed.GameState.from_players(players, cards_and_wonders.cards, [[]] * 4, 2)
+    # Seat 0 counts its own cards and those of seats 3 and 1, not those of seat 2
+    for name, expected in (('Vineyard', 1 + 8 + 2), ('Bazaar', 2 * (2 + 1 + 0))):
+        (effect,) = _card(cards_and_wonders, name).effects
+        assert effect.whose == 'self_and_neighbours'
+        assert sw.effect_value(effect, players[0], players) == expected
+        assert game.effect_value(0, effect) == expected
+
+
+def test_builders_scores_own_and_neighbours_wonder_stages():
+    cards_and_wonders = catalogue.load()
+    builders = _card(cards_and_wonders, 'Builders')
+    wonders = np.array([[0, 2, 4, 6]])
+    stages = np.array([[1, 2, 3, 0]])
+    played = np.zeros((1, 4, len(cards_and_wonders.cards)), dtype=np.int32)
+    played[0, 0, builders.card_id] = 1
+    zeros = np.zeros((1, 4), dtype=np.int32)
+    positions = scoring.Positions(wonders, stages, np.zeros((1, 4, len(sw.Resource.symbols)), dtype=np.int32),
+                                  played, zeros, zeros)
+    scores = scoring.score_positions(cards_and_wonders, positions)
+    guilds = run.events.SCORE_CATEGORIES.index('Guilds')
+    # Seat 2 isn't a neighbour of seat 0
+    assert scores[0, :, guilds].tolist() == [1 + 2 + 0, 0, 0, 0]
+
+    players = _players(cards_and_wonders, [0, 0, 0, 0])
+    players[0]._play_a_card(builders, {}, players, free=True)
+    for p, n in zip(players, stages[0]):
+        # Built wonder stages are counted as played cards of type 'wonder'
+        p.colour_counts['wonder'] = n
+    run.calculate_victory_points(players)
+    assert [p.victory_points['Guilds'] for p in players] == [3, 0, 0, 0]
+
+
+@pytest.mark.parametrize('no_of_players', range(3, 8))
+def test_score_positions_agrees_with_the_engine_on_seeded_games(no_of_players):
+    cards_and_wonders = catalogue.load()
+    games = []
+    for game_i in range(60):
+        rng = run.game_rng('scoring/%d' % no_of_players, game_i)
+        players = [sw.Player(str(seat), agents.AGENTS[('heuristic', 'greedy', 'random')[seat % 3]]())
+                   for seat in range(no_of_players)]
+        run.play(players, cards_and_wonders.decks(no_of_players, rng), cards_and_wonders.wonders, False, rng)
+        games.append(players)
+    scores = scoring.score_positions(cards_and_wonders, scoring.from_players(cards_and_wonders, games))
+    expected = [[[p.victory_points.get(category, 0) for category in run.events.SCORE_CATEGORIES] for p in players]
+                for players in games]
+    assert scores.tolist() == expected
+    # The categories scored by effects all come up
+    for category in ('Commerce', 'Science', 'Guilds', 'Copied Guild: '):
+        assert scores[..., run.events.SCORE_CATEGORIES.index(category)].any()
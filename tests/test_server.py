@@ -0,0 +1,95 @@
+import asyncio
+import json
+import logging
+import random
+
+from seven_wonders import agents
+from seven_wonders import catalogue
+from seven_wonders import server
+
+
+class _Writer:
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_table_errors_are_logged(monkeypatch, caplog):
+    async def failing_table(self, seat_agents):
+        raise RuntimeError('broken table')
+
+    async def connect():
+        table_server = server.TableServer(3, remote_seats=1)
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'{"name": "ada"}\n')
+        await table_server.handle(reader, _Writer())
+        await asyncio.gather(*table_server._games, return_exceptions=True)
+        await asyncio.sleep(0)
+        return table_server
+
+    monkeypatch.setattr(server.TableServer, 'play_table', failing_table)
+    with caplog.at_level(logging.ERROR, logger=server.__name__):
+        table_server = asyncio.run(connect())
+    assert not table_server._games
+    assert 'broken table' in caplog.text
+
+
+def test_join_cancels_expired_decisions():
+    replies, cancelled = [], []
+
+    async def host(reader, writer):
+        await reader.readline()
+        for request_id in (1, 2):
+            writer.write(json.dumps({'type': 'decide', 'id': request_id}).encode() + b'\n')
+            await writer.drain()
+            if request_id == 1:
+                # The first request expires unanswered
+                await asyncio.sleep(0.05)
+        replies.append(json.loads(await reader.readline()))
+        writer.close()
+
+    async def choose_move(message):
+        if message['id'] == 1:
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(message['id'])
+                raise
+        return {'action': 'coin', 'card': 0}
+
+    async def play():
+        table_server = await asyncio.start_server(host, '127.0.0.1', 0)
+        port = table_server.sockets[0].getsockname()[1]
+        async with table_server:
+            await asyncio.wait_for(server.join('127.0.0.1', port, 'ada', choose_move), 5)
+
+    asyncio.run(play())
+    assert cancelled == [1]
+    assert replies == [{'action': 'coin', 'card': 0, 'id': 2}]
+
+
+def test_ask_human_ignores_what_was_typed_before_the_decision(capsys):
+    message = {'seat': 0, 'age': 1, 'cards': ['Loom', 'Baths'], 'playable': {'0': [0, 0]},
+               'players': [{'resources': {'$': 3}}]}
+
+    async def ask():
+        terminal = server.TerminalInput()
+        # The answer to an expired decision
+        terminal.feed('play 1\n')
+        decision = asyncio.ensure_future(server.ask_human(message, terminal))
+        await asyncio.sleep(0)
+        terminal.feed('coin 0\n')
+        return await decision
+
+    assert asyncio.run(ask()) == {'action': 'coin', 'card': 0}
+    assert 'Loom' in capsys.readouterr().out
+
+
+def test_table_returns_the_totals_of_seats_with_the_same_name():
+    seat_agents = [server.LocalAgent(agents.HeuristicAgent()) for _ in range(4)]
+    table = server.Table(seat_agents, catalogue.load(), random.Random(0))
+    totals = asyncio.run(table.play())
+    assert totals == [p.victory_points['Total'] for p in table.players]
+    assert len({p.name for p in table.players}) == 1
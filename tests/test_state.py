@@ -0,0 +1,151 @@
+import random
+
+import pytest
+
+from seven_wonders import agents
+from seven_wonders import catalogue
+from seven_wonders import definitions as sw
+from seven_wonders import run
+from seven_wonders import state as packed
+
+# Halicarnassus, Babylon B and Olympia have the wonder specials, Alexandria split resource stages
+SPECIAL_WONDERS = ('Halicarnassus', 'Babylon', 'Olympia', 'Alexandria')
+
+
+def _wonder_ids(cards_and_wonders, no_of_players, rng):
+    names = list(SPECIAL_WONDERS) + sorted({wonder.name.rsplit('_', 1)[0] for wonder in cards_and_wonders.wonders} -
+                                           set(SPECIAL_WONDERS))
+    by_name = {wonder.name: wonder.wonder_id for wonder in cards_and_wonders.wonders}
+    return [by_name['%s_%s' % (name, rng.choice('AB'))] for name in names[:no_of_players]]
+
+
+def _state(players, player, hand, cards_and_wonders):
+    """Pack the game as the player sees it, only its hand (or the discard pile) being known."""
+    hands = [hand if p is player and hand is not player.discarded_cards else [] for p in players]
+    return packed.GameState.from_players(players, cards_and_wonders.cards, hands, player.age, player.discarded_cards)
+
+
+def _hand_i(player, hand):
+    return -1 if hand is player.discarded_cards else player.player_i
+
+
+def _play(monkeypatch, cards_and_wonders, no_of_players, seed, check):
+    """Play a seeded game of heuristic agents, calling check(players, player, hand, free, ...) at every turn."""
+    play_a_turn, decision, apply_move = sw.Player.play_a_turn, sw.Player.decision, sw.Player.apply_move
+    turns = []
+
+    def patched_play_a_turn(self, players, hand, free=False):
+        turns.append((players, hand, free))
+        try:
+            return play_a_turn(self, players, hand, free)
+        finally:
+            turns.pop()
+
+    def patched_decision(self, playable_cards_i, cards, players):
+        check_players, hand, free = turns[-1]
+        expected = check('decision', self, check_players, hand, free)
+        view, playable_cards_i = decision(self, playable_cards_i, cards, players)
+        expected(cards, playable_cards_i)
+        return view, playable_cards_i
+
+    def patched_apply_move(self, players, hand, cards, move, free=False):
+        expected = check('move', self, players, hand, free, cards, move)
+        apply_move(self, players, hand, cards, move, free)
+        expected()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(sw.Player, 'play_a_turn', patched_play_a_turn)
+        patch.setattr(sw.Player, 'decision', patched_decision)
+        patch.setattr(sw.Player, 'apply_move', patched_apply_move)
+        rng = run.game_rng(seed, no_of_players)
+        players = [sw.Player(str(i), agents.HeuristicAgent()) for i in range(no_of_players)]
+        run.play(players, cards_and_wonders.decks(no_of_players, rng), cards_and_wonders.wonders, False, rng,
+                 wonder_ids=_wonder_ids(cards_and_wonders, no_of_players, rng))
+
+
+def _move(player, cards, move):
+    """Return the packed move of a move of the object engine."""
+    action, card_i, gold_cost = move
+    left_i, right_i = player.adjacent_players_i
+    return action, cards[card_i].card_id, (gold_cost.get(left_i, 0), gold_cost.get(right_i, 0)) if gold_cost else (0, 0)
+
+
+@pytest.mark.parametrize('no_of_players', [3, 4, 5, 7])
+def test_legal_moves_and_apply_match_the_object_engine(monkeypatch, no_of_players):
+    cards_and_wonders = catalogue.load()
+    seen = {'decision': 0, 'move': 0, 'free': 0, 'trade': 0}
+
+    def check(kind, player, players, hand, free, cards=None, move=None):
+        game = _state(players, player, hand, cards_and_wonders)
+        hand_i = _hand_i(player, hand)
+        seen[kind] += 1
+        if kind == 'decision':
+            moves = sorted(game.legal_moves(player.player_i, hand_i, free))
+            seen['free'] += free
+            seen['trade'] += any(sum(gold_cost) for _, _, gold_cost in moves)
+
+            def compare(cards, playable_cards_i):
+                expected = [('coin', card.card_id, (0, 0)) for card in hand]
+                for card_i, gold_cost in playable_cards_i.items():
+                    if cards[card_i].type == 'wonder':
+                        expected.extend(_move(player, cards, ('wonder', i, gold_cost)) for i in range(len(hand)))
+                    else:
+                        expected.append(_move(player, cards, ('play', card_i, gold_cost)))
+                assert moves == sorted(expected)
+            return compare
+        applied = game.clone()
+        applied.apply(player.player_i, _move(player, cards, move), hand_i, free)
+
+        def compare():
+            # The engine and the state may take different copies of a card out of a hand
+            played = _state(players, player, hand, cards_and_wonders)
+            applied.hands, played.hands = ([tuple(sorted(hand)) for hand in state.hands] for state in (applied, played))
+            assert applied.key() == played.key()
+        return compare
+
+    for seed in range(6):
+        _play(monkeypatch, cards_and_wonders, no_of_players, seed, check)
+    assert seen['decision'] == seen['move'] >= 6 * 18 * no_of_players
+    assert seen['free'] and seen['trade']
+
+
+def test_victory_points_match_the_object_engine():
+    cards_and_wonders = catalogue.load()
+    for no_of_players in range(3, 8):
+        rng = run.game_rng(1, no_of_players)
+        players = [sw.Player(str(i)) for i in range(no_of_players)]
+        run.play(players, cards_and_wonders.decks(no_of_players, rng), cards_and_wonders.wonders, False, rng,
+                 wonder_ids=_wonder_ids(cards_and_wonders, no_of_players, rng))
+        game = packed.GameState.from_players(players, cards_and_wonders.cards, [[]] * no_of_players, 3)
+        for player_i, p in enumerate(players):
+            assert game.victory_points(player_i) == p.victory_points
+
+
+def test_undo_restores_the_state():
+    cards_and_wonders = catalogue.load()
+    rng = random.Random(3)
+    game = packed.GameState(cards_and_wonders.cards, [cards_and_wonders.wonders[i] for i in (0, 2, 4, 6)])
+    game.deal([card_id for card_id in cards_and_wonders.deck_templates[4][0]], rng)
+    key = game.key()
+    for player_i in range(4):
+        for move in game.legal_moves(player_i):
+            game.apply(player_i, move)
+            game.undo()
+            assert game.key() == key
+
+
+def test_rollout_plays_every_age():
+    cards_and_wonders = catalogue.load()
+    rng = random.Random(5)
+    players = [sw.Player(str(i)) for i in range(5)]
+    run.seat_players(players, cards_and_wonders.wonders, rng, wonder_ids=[1, 3, 5, 7, 9])
+    decks = [[card.card_id for card in deck] for deck in cards_and_wonders.decks(5, rng)]
+    game = packed.GameState.from_players(players, cards_and_wonders.cards, [[]] * 5, 1)
+    game.deal(decks[0], rng)
+    start = game.clone()
+    points = packed.rollout(game, rng, decks[1:])
+    assert game.age == 3
+    assert all(len(hand) == 1 for hand in game.hands)
+    assert points == [game.victory_points(player_i)['Total'] for player_i in range(5)]
+    assert start.age == 1 and all(len(hand) == 7 for hand in start.hands)
+    assert start.key() != game.key()
@@ -0,0 +1,29 @@
+import os
+
+from seven_wonders import events
+from seven_wonders import simulate
+from seven_wonders import store
+
+
+def test_a_smaller_batch_after_a_larger_one_only_counts_its_games(tmp_path):
+    with store.ResultStore(str(tmp_path / 'results.sqlite')) as results:
+        larger = store.simulate_stored(results, 12, 3, seed=4, workers=1, checkpoint=5)
+        smaller = store.simulate_stored(results, 5, 3, seed=4, workers=1)
+        again = store.simulate_stored(results, 12, 3, seed=4, workers=1)
+    assert larger.games == again.games == 12
+    assert smaller.games == 5
+    assert smaller.report() == simulate.simulate(5, 3, seed=4, workers=1).report()
+    assert again.report() == larger.report()
+
+
+def test_resumed_events_chunks_are_named_by_their_games(tmp_path):
+    events_dir = str(tmp_path / 'events')
+    with store.ResultStore(str(tmp_path / 'results.sqlite')) as results:
+        store.simulate_stored(results, 3, 3, workers=1, chunksize=4, events_dir=events_dir)
+        store.simulate_stored(results, 10, 3, workers=1, chunksize=4, events_dir=events_dir)
+    names = sorted(os.listdir(events_dir))
+    assert names == ['events-%010d-%010d-00000.npz' % games for games in [(0, 2), (3, 6), (7, 9)]]
+    games = set()
+    for name in names:
+        games.update(events.read_chunk(os.path.join(events_dir, name))['scores_game'])
+    assert games == set(range(10))
@@ -0,0 +1,51 @@
+import collections
+import io
+import random
+
+import pytest
+
+from seven_wonders import catalogue
+from seven_wonders import definitions as sw
+from seven_wonders import lockstep
+from seven_wonders import run
+from seven_wonders import sweep
+
+
+def test_first_round_stays_within_the_budget():
+    cells = len(sweep.cells(catalogue.load(), (3,)))
+    output = io.StringIO()
+    stats = sweep.sweep((3,), target=0.01, budget=cells, workers=1, min_games=16, output=output)
+    assert sum(stats.focal_games.values()) == cells
+    assert set(stats.focal_games.values()) == {1}
+    assert 'allows 1 games per cell' in output.getvalue()
+    with pytest.raises(ValueError):
+        sweep.sweep((3,), budget=cells - 1, workers=1)
+
+
+def _names(wonders, wonder_ids):
+    return [wonders[wonder_id].name.rsplit('_', 1)[0] for wonder_id in wonder_ids]
+
+
+def test_games_deal_distinct_wonders():
+    cards_and_wonders = catalogue.load()
+    wonders = cards_and_wonders.wonders
+    sides = set()
+    for seed in range(50):
+        players = [sw.Player(str(i)) for i in range(7)]
+        run.seat_players(players, wonders, random.Random(seed))
+        assert len({p.wonder.name.rsplit('_', 1)[0] for p in players}) == 7
+        sides.update(p.wonder.side for p in players)
+    assert sides == {'A', 'B'}
+    games = lockstep.LockstepGames(cards_and_wonders, 200, 7, lockstep.batch_rng(0, 0))
+    for wonder_ids in games.wonders.tolist():
+        assert len(set(_names(wonders, wonder_ids))) == 7
+    assert {wonders[wonder_id].side for wonder_id in games.wonders.flat} == {'A', 'B'}
+
+
+def test_cells_without_focal_games_in_the_round_are_not_observed():
+    table = tuple(sweep.Cell(3, wonder, 'A', seat) for seat, wonder in enumerate(['Giza', 'Rhodos', 'Ephesos']))
+    stats = sweep.Sweep(table)
+    shares = collections.defaultdict(float, {table[0]: 0.5, table[1]: 0.25})
+    stats.add(table, 2, shares)
+    assert stats.weight[table[0]] == stats.weight[table[1]] == 1 / 0.75
+    assert stats.weight[table[2]] == stats.weighted_wins[table[2]] == 0
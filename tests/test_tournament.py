@@ -0,0 +1,38 @@
+import pytest
+
+from seven_wonders import catalogue
+from seven_wonders import tournament
+
+
+@pytest.mark.parametrize('pair_score, decision', [(tournament.WIN, 'H1'), (tournament.LOSS, 'H0'), (0.5, 'H0')])
+def test_sprt_stops_when_every_pair_has_the_same_score(pair_score, decision):
+    stats = tournament.PairingStats('a', 'b')
+    for _ in range(20):
+        stats.add(pair_score)
+        if stats.decision():
+            break
+    assert stats.variance == 0
+    assert stats.decision() == decision
+    assert stats.pairs < 20
+
+
+def test_sprt_goes_on_while_the_scores_are_even():
+    stats = tournament.PairingStats('a', 'b')
+    for pair_score in [tournament.WIN, tournament.LOSS] * 3:
+        stats.add(pair_score)
+    assert stats.decision() is None
+    elo, low, high = stats.elo()
+    assert low < elo < high
+
+
+def test_a_pairing_stops_at_the_pair_that_decides():
+    stats = tournament.run_pairing('heuristic', 'random', 3, seed=1, max_pairs=200, workers=1)
+    assert stats.decision() == 'H1'
+    cards_and_wonders = catalogue.load()
+    replayed = tournament.PairingStats('heuristic', 'random')
+    for pair_i in range(stats.pairs):
+        assert replayed.decision() is None
+        results = tournament.play_pair(cards_and_wonders, 'heuristic', 'random', 3, 1, pair_i)
+        replayed.add(sum(results) / len(results))
+    assert replayed.total == stats.total
+    assert replayed.decision() == 'H1'